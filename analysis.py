@@ -1,131 +1,136 @@
 import pandas as pd
-import ta
 import config
+from candle_store import open_store, load_candles
+from indicator_engine import compute_indicators, update_tail, save_state, INDICATOR_COLUMNS
+from indicator_cube import variant_column
 
 # --------------------- TECHNICAL INDICATOR SCRIPT ---------------------
 
-# Calculate and append technical indicators to CSV file
+# Calculate and append technical indicators to the candle store
 def calculate_indicators(df=None, modify=True, data_file=config.CSV_FILE):
+
+    '''
+    Indicators come from the NumPy engine in indicator_engine. When the store was calculated
+    before and candles were only appended since, just the appended rows are computed from the
+    saved engine state and written back, instead of recalculating and rewriting the whole store.
+    '''
+
     if df is None:
-        df=pd.read_csv(data_file, index_col=0)
+        if modify and update_tail(data_file):
+            return
+        df = load_candles(data_file)
 
     for col in ['close', 'high', 'low']:
         df[col] = pd.to_numeric(df[col], errors='coerce')
 
-    df['rsi'] = ta.momentum.rsi(df['close'], window=14)
-
-    stochrsi = ta.momentum.StochRSIIndicator(
-        close=df['close'], 
-        window=14,       
-        smooth1=3,       
-        smooth2=3        
-    )
-    df['stoch_rsi_k'] = stochrsi.stochrsi_k() * 100       
-    df['stoch_rsi_d'] = stochrsi.stochrsi_d() * 100    
-
-    macd = ta.trend.MACD(df['close'], window_slow=26, window_fast=12, window_sign=9)
-    df['macd'] = macd.macd()
-    df['macd_signal'] = macd.macd_signal()
-
-    df['adx'] = ta.trend.adx(df['high'], df['low'], df['close'], window=14)
-    df['+di'] = ta.trend.adx_pos(df['high'], df['low'], df['close'], window=14)
-    df['-di'] = ta.trend.adx_neg(df['high'], df['low'], df['close'], window=14)
-    df['adx_slope'] = (df['adx'] - df['adx'].shift(1)) / 60
-
-    bb_indicator = ta.volatility.BollingerBands(close=df['close'], window=20, window_dev=2)
-    df['bb_middle'] = bb_indicator.bollinger_mavg()
-    df['bb_upper'] = bb_indicator.bollinger_hband()
-    df['bb_lower'] = bb_indicator.bollinger_lband()
+    columns, state = compute_indicators(df['high'].values, df['low'].values, df['close'].values)
+    for name in INDICATOR_COLUMNS:
+        df[name] = columns[name]
+    last_timestamp = df['timestamp'].iloc[-1] if modify else None
 
     df = df.dropna(
         subset=['rsi','stoch_rsi_k','stoch_rsi_d','macd','macd_signal','adx','+di','-di','adx_slope', 'bb_middle', 'bb_upper', 'bb_lower']
     ).reset_index(drop=True)
 
     if modify:
-        df.to_csv(data_file)
+        store = open_store(data_file)
+        store.write(df)
+        save_state(store, state, last_timestamp)
     else:
         return df
 
 # --------------------- TECHNICAL ANALYSIS SCRIPT --------------------
 
 # INDICATOR FUNCTIONS RETURN DataFrame OF BOOLEAN VALUES
+# variant picks the window variant of the indicator columns in the indicator cube, 0 is the default
 
-def macd_crossup(df, threshold=None) -> pd.Series:
-    prev_macd = df['macd'].shift(1)
-    prev_macd_signal = df['macd_signal'].shift(1)
-    curr_macd = df['macd']
-    curr_macd_signal = df['macd_signal']
+def macd_crossup(df, threshold=None, variant=0) -> pd.Series:
+    macd = df[variant_column('macd', variant)]
+    macd_signal = df[variant_column('macd_signal', variant)]
+    prev_macd = macd.shift(1)
+    prev_macd_signal = macd_signal.shift(1)
+    curr_macd = macd
+    curr_macd_signal = macd_signal
 
     # macd first below the signal then crosses above
     return ((prev_macd <= prev_macd_signal) & (curr_macd > curr_macd_signal))
 
-def macd_crossdown(df, threshold=None) -> pd.Series:
-    prev_macd = df['macd'].shift(1)
-    prev_macd_signal = df['macd_signal'].shift(1)
-    curr_macd = df['macd']
-    curr_macd_signal = df['macd_signal']
+def macd_crossdown(df, threshold=None, variant=0) -> pd.Series:
+    macd = df[variant_column('macd', variant)]
+    macd_signal = df[variant_column('macd_signal', variant)]
+    prev_macd = macd.shift(1)
+    prev_macd_signal = macd_signal.shift(1)
+    curr_macd = macd
+    curr_macd_signal = macd_signal
 
     # macd first above the signal then crosses below
     return ((prev_macd >= prev_macd_signal) & (curr_macd < curr_macd_signal))
 
-def rsi_overbought(df, threshold=70) -> pd.Series:
-    prev_rsi = df['rsi'].shift(1)
-    curr_rsi = df['rsi']
+def rsi_overbought(df, threshold=70, variant=0) -> pd.Series:
+    rsi = df[variant_column('rsi', variant)]
+    prev_rsi = rsi.shift(1)
+    curr_rsi = rsi
 
     # rsi first below the threshold then crosses above
     return ((prev_rsi <= threshold) & (curr_rsi > threshold))
 
-def rsi_oversold(df, threshold=30) -> pd.Series:
-    prev_rsi = df['rsi'].shift(1)
-    curr_rsi = df['rsi']
+def rsi_oversold(df, threshold=30, variant=0) -> pd.Series:
+    rsi = df[variant_column('rsi', variant)]
+    prev_rsi = rsi.shift(1)
+    curr_rsi = rsi
 
     # rsi first above the threshold then crosses below
     return ((prev_rsi >= threshold) & (curr_rsi < threshold))
 
-def stoch_rsi_crossup(df, threshold=None) -> pd.Series:
-    prev_stoch_rsi_k = df['stoch_rsi_k'].shift(1)
-    prev_stoch_rsi_d = df['stoch_rsi_d'].shift(1)
-    curr_stoch_rsi_k = df['stoch_rsi_k']
-    curr_stoch_rsi_d = df['stoch_rsi_d']
+def stoch_rsi_crossup(df, threshold=None, variant=0) -> pd.Series:
+    stoch_rsi_k = df[variant_column('stoch_rsi_k', variant)]
+    stoch_rsi_d = df[variant_column('stoch_rsi_d', variant)]
+    prev_stoch_rsi_k = stoch_rsi_k.shift(1)
+    prev_stoch_rsi_d = stoch_rsi_d.shift(1)
+    curr_stoch_rsi_k = stoch_rsi_k
+    curr_stoch_rsi_d = stoch_rsi_d
 
     # stochrsi_k first below stochrsi_d then crosses above
     return ((prev_stoch_rsi_k <= prev_stoch_rsi_d) & (curr_stoch_rsi_k > curr_stoch_rsi_d))
 
-def stoch_rsi_crossdown(df, threshold=None) -> pd.Series:
-    prev_stoch_rsi_k = df['stoch_rsi_k'].shift(1)
-    prev_stoch_rsi_d = df['stoch_rsi_d'].shift(1)
-    curr_stoch_rsi_k = df['stoch_rsi_k']
-    curr_stoch_rsi_d = df['stoch_rsi_d']
+def stoch_rsi_crossdown(df, threshold=None, variant=0) -> pd.Series:
+    stoch_rsi_k = df[variant_column('stoch_rsi_k', variant)]
+    stoch_rsi_d = df[variant_column('stoch_rsi_d', variant)]
+    prev_stoch_rsi_k = stoch_rsi_k.shift(1)
+    prev_stoch_rsi_d = stoch_rsi_d.shift(1)
+    curr_stoch_rsi_k = stoch_rsi_k
+    curr_stoch_rsi_d = stoch_rsi_d
 
     # stochrsi_k first above stochrsi_d then crosses below
     return ((prev_stoch_rsi_k >= prev_stoch_rsi_d) & (curr_stoch_rsi_k < curr_stoch_rsi_d))
 
-def stoch_rsi_overbought(df, threshold=80) -> pd.Series:
+def stoch_rsi_overbought(df, threshold=80, variant=0) -> pd.Series:
     # stochrsi_k above threshold
-    return (df['stoch_rsi_k'] >= threshold)
+    return (df[variant_column('stoch_rsi_k', variant)] >= threshold)
 
-def stoch_rsi_oversold(df, threshold=20) -> pd.Series:
+def stoch_rsi_oversold(df, threshold=20, variant=0) -> pd.Series:
     # stochrsi_k below threshold
-    return (df['stoch_rsi_k'] <= threshold)
+    return (df[variant_column('stoch_rsi_k', variant)] <= threshold)
 
-def adx_trending(df, threshold=20) -> pd.Series:
+def adx_trending(df, threshold=20, variant=0) -> pd.Series:
     # adx must be above threshold and increasing
-    return ((df['adx'] >= threshold) & (df['adx_slope'] > 0))
+    return ((df[variant_column('adx', variant)] >= threshold) & (df[variant_column('adx_slope', variant)] > 0))
 
-def adx_reversal(df, threshold=None) -> pd.Series:
-    prev_adx_slope = df['adx_slope'].shift(1)
-    curr_adx_slope = df['adx_slope']
+def adx_reversal(df, threshold=None, variant=0) -> pd.Series:
+    adx_slope = df[variant_column('adx_slope', variant)]
+    prev_adx_slope = adx_slope.shift(1)
+    curr_adx_slope = adx_slope
 
     # adx must have been increasing and then starts decreasing
     return ((prev_adx_slope >= 0) & (curr_adx_slope < 0))
 
-def bollinger_bands_buy(df, threshold=None) -> pd.Series:
+def bollinger_bands_buy(df, threshold=None, variant=0) -> pd.Series:
     # price touches lower band, buy signal
-    return (df['close'] <= df['bb_lower'])
+    return (df['close'] <= df[variant_column('bb_lower', variant)])
 
-def bollinger_bands_sell(df, threshold=None) -> pd.Series:
+def bollinger_bands_sell(df, threshold=None, variant=0) -> pd.Series:
     # price touches upper band, sell signal
-    return (df['close'] >= df['bb_upper'])
+    return (df['close'] >= df[variant_column('bb_upper', variant)])
 
 
 # Variable to be imported to logging.py for indicator name lookup
@@ -142,4 +147,25 @@ INDICATOR_REGISTRY = {
     "adx_reversal": adx_reversal,
     "bollinger_bands_buy": bollinger_bands_buy,
     "bollinger_bands_sell": bollinger_bands_sell
-}
\ No newline at end of file
+}
+
+# Indicator family of each function, the window variants of a leaf are those of its family's grid
+LEAF_FAMILIES = {
+    "macd_crossup": "macd",
+    "macd_crossdown": "macd",
+    "rsi_overbought": "rsi",
+    "rsi_oversold": "rsi",
+    "stoch_rsi_crossup": "rsi",
+    "stoch_rsi_crossdown": "rsi",
+    "stoch_rsi_overbought": "rsi",
+    "stoch_rsi_oversold": "rsi",
+    "adx_trending": "adx",
+    "adx_reversal": "adx",
+    "bollinger_bands_buy": "bb",
+    "bollinger_bands_sell": "bb"
+}
+
+# Splits a strategy tree leaf into (func, threshold, variant), leaves without a variant use variant 0
+def leaf_parts(node) -> tuple:
+    func, threshold, *variant = node
+    return func, threshold, variant[0] if variant else 0
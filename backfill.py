@@ -0,0 +1,399 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import json
+import os
+import queue
+import random
+import threading
+import time
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+import config
+from analysis import calculate_indicators
+from candle_store import open_store
+from candle_integrity import integrity_report
+from resample import resample_timeframes
+from candles import get_candles, verify_candles, candle_file, columns, SIX_MONTHS
+
+WINDOW_SECONDS = 86400 * 10  # 10 days of candles per request
+
+# --------------------- HISTORICAL BACKFILL SCHEDULER ---------------------
+
+# Thread-safe token bucket, acquire() blocks until a request may be sent
+class TokenBucket:
+
+    def __init__(self, rate=config.API_RATE_LIMIT, capacity=config.API_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Pool of keep-alive HTTP sessions shared by the backfill workers
+class SessionPool:
+
+    def __init__(self, size=config.BACKFILL_WORKERS):
+        self._sessions = queue.Queue()
+        for _ in range(size):
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._sessions.put(session)
+
+    @contextmanager
+    def session(self):
+        session = self._sessions.get()
+        try:
+            yield session
+        finally:
+            self._sessions.put(session)
+
+    def close(self):
+        while not self._sessions.empty():
+            self._sessions.get_nowait().close()
+
+# Fetches one window of candles, retrying rate limits, server errors and dropped connections with jittered backoff
+def fetch_window(symbol, start, end, granularity, sessions, limiter, base_url=config.CANDLES_API_URL, max_retries=config.BACKFILL_MAX_RETRIES) -> list:
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            with sessions.session() as session:
+                return get_candles(start, end, symbol=symbol, granularity=granularity, session=session, base_url=base_url)
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if (status != 429 and (status is None or status < 500)) or attempt == max_retries:
+                raise
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+
+        time.sleep(min(30, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+# --------------------- FIRST CANDLE DISCOVERY ---------------------
+
+def load_first_candles(path=config.FIRST_CANDLE_FILE) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_first_candles(first_candles, path=config.FIRST_CANDLE_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(first_candles, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, path)
+
+# Returns the timestamp of a symbol's first candle after horizon, or None if the exchange has no candles at all
+def find_first_candle(symbol, granularity, sessions, limiter, now, horizon, base_url=config.CANDLES_API_URL):
+
+    '''
+    Window k covers [now - (k + 1) * WINDOW_SECONDS, now - k * WINDOW_SECONDS]. Every window after
+    the listing has candles and every window before it is empty, so the oldest non-empty window is
+    found by doubling k until a window comes back empty, then bisecting between the last non-empty
+    and the first empty window. That takes O(log n) requests instead of one per window.
+    '''
+
+    def window(k):
+        end = now - k * WINDOW_SECONDS
+        return fetch_window(symbol, end - WINDOW_SECONDS, end, granularity, sessions, limiter, base_url)
+
+    oldest = max(0, -(-(now - horizon) // WINDOW_SECONDS) - 1)  # window containing the horizon
+
+    candles = window(0)
+    if not candles:
+        return None
+
+    # Exponential search back in time for an empty window
+    found, found_candles = 0, candles
+    empty = None
+    step = 1
+    while empty is None and found < oldest:
+        k = min(found + step, oldest)
+        candles = window(k)
+        if candles:
+            found, found_candles = k, candles
+            step *= 2
+        else:
+            empty = k
+
+    # Binary search between the oldest non-empty window and the empty one
+    while empty is not None and empty - found > 1:
+        k = (found + empty) // 2
+        candles = window(k)
+        if candles:
+            found, found_candles = k, candles
+        else:
+            empty = k
+
+    return max(min(int(candle[0]) for candle in found_candles), horizon)
+
+# Returns the (start, end) request windows still missing from a symbol's store
+def plan_windows(store, granularity, now, first_candle=None) -> list:
+    if len(store) == 0:
+        start = now - SIX_MONTHS * 10  # start 10 six-month periods ago (5 years)
+        if first_candle is not None:
+            start = max(start, first_candle)
+    else:
+        start = int(store.load(['timestamp'])['timestamp'][-1]) + 1
+
+    return [(s, min(s + WINDOW_SECONDS, now)) for s in range(start, now - granularity, WINDOW_SECONDS)]
+
+# Appends fetched windows to a store in timestamp order, whatever order they complete in
+class WindowAssembler:
+
+    def __init__(self, store, n_windows):
+        self.store = store
+        self.n_windows = n_windows
+        self.pending = {}
+        self.next_window = 0
+        self.appended = 0
+        self.last_timestamp = int(store.load(['timestamp'])['timestamp'][-1]) if len(store) else -1
+
+    @property
+    def done(self) -> bool:
+        return self.next_window == self.n_windows
+
+    def add(self, window_index, candles):
+        self.pending[window_index] = candles
+
+        # append the contiguous run of windows that is now complete
+        while self.next_window in self.pending:
+            window = self.pending.pop(self.next_window)
+            self.next_window += 1
+            if not window:
+                continue
+
+            df = pd.DataFrame(window, columns=columns)
+            df = df.drop_duplicates(subset="timestamp").sort_values("timestamp")
+            df = df[df['timestamp'] > self.last_timestamp]
+            if df.empty:
+                continue
+
+            self.store.append(df)
+            self.last_timestamp = df.iloc[-1]['timestamp']
+            self.appended += len(df)
+
+# Backfills the candles of several symbols concurrently and recalculates their indicators
+def backfill(
+        symbols=config.MAIN_SYMBOLS,
+        granularity=config.GRANULARITY,
+        base_url=config.CANDLES_API_URL,
+        workers=config.BACKFILL_WORKERS,
+        limiter=None,
+        now=None,
+        first_candle_file=config.FIRST_CANDLE_FILE,
+        data_files=None,
+        finish=True
+    ) -> dict:
+
+    '''
+    Every missing 10-day window of every symbol is scheduled on one thread pool. The workers share a
+    pool of keep-alive sessions and a token bucket matching the exchange's public rate limit.
+    Completed windows are assembled per symbol and appended to the candle store in order, and a
+    symbol's indicators are recalculated as soon as its last window is in.
+
+    Symbols without any candles start at their listing date, found by find_first_candle and
+    cached in first_candle_file, instead of probing forward from five years back.
+
+    data_files maps symbols to the data file of their candles, candle_file(symbol) by default.
+    With finish=False the indicators are left to the caller.
+
+    A window that still fails after its retries fails its symbol only: the error is printed, the
+    symbol's remaining windows are dropped and the other symbols are finished. The windows
+    appended before the failure stay in the store, so the next run resumes from there.
+
+    Returns the number of candles appended per symbol, None for the symbols that failed.
+    '''
+
+    now = int(time.time()) if now is None else now
+    limiter = limiter or TokenBucket()
+    sessions = SessionPool(workers)
+    data_files = {symbol: (data_files or {}).get(symbol, candle_file(symbol, granularity)) for symbol in symbols}
+    stores = {symbol: open_store(data_files[symbol]) for symbol in symbols}
+    failed = {}
+    assemblers = {}
+
+    # Records a symbol's permanent failure and drops its windows still waiting to run
+    def fail(symbol, error, futures=()):
+        failed[symbol] = error
+        print(f"Error backfilling {symbol}: {error!r}, skipping its remaining windows")
+        for future, (other, _) in futures:
+            if other == symbol:
+                future.cancel()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+
+            # Listing dates of symbols without candles yet, discovered concurrently and cached
+            first_candles = load_first_candles(first_candle_file)
+            horizon = now - SIX_MONTHS * 10
+            missing = [
+                symbol for symbol, store in stores.items()
+                if len(store) == 0 and f"{symbol}:{granularity}" not in first_candles
+            ]
+            discovered = {
+                symbol: executor.submit(find_first_candle, symbol, granularity, sessions, limiter, now, horizon, base_url)
+                for symbol in missing
+            }
+            for symbol, future in discovered.items():
+                try:
+                    first_candle = future.result()
+                except Exception as e:
+                    fail(symbol, e)
+                    continue
+                if first_candle is not None:
+                    first_candles[f"{symbol}:{granularity}"] = first_candle
+            if missing:
+                save_first_candles(first_candles, first_candle_file)
+
+            tasks = []
+            for symbol, store in stores.items():
+                if symbol in failed:
+                    continue
+                windows = plan_windows(store, granularity, now, first_candles.get(f"{symbol}:{granularity}"))
+                assemblers[symbol] = WindowAssembler(store, len(windows))
+                tasks.extend((symbol, i, start, end) for i, (start, end) in enumerate(windows))
+
+            futures = {
+                executor.submit(fetch_window, symbol, start, end, granularity, sessions, limiter, base_url): (symbol, i)
+                for symbol, i, start, end in tasks
+            }
+
+            for future in as_completed(futures):
+                symbol, i = futures[future]
+                if symbol in failed:
+                    continue
+                try:
+                    candles = future.result()
+                except Exception as e:
+                    fail(symbol, e, futures.items())
+                    continue
+
+                assembler = assemblers[symbol]
+                assembler.add(i, candles)
+                if finish and assembler.done and assembler.appended:
+                    finish_symbol(symbol, granularity, data_files[symbol])
+    finally:
+        sessions.close()
+
+    # symbols without new windows still get their indicators checked
+    for symbol, assembler in assemblers.items():
+        if finish and assembler.n_windows == 0 and len(assembler.store):
+            finish_symbol(symbol, granularity, data_files[symbol])
+
+    if failed:
+        print(f"Backfill failed for {', '.join(failed)}")
+    return {symbol: None if symbol in failed else assemblers[symbol].appended for symbol in symbols}
+
+def finish_symbol(symbol, granularity, data_file=None):
+    data_file = data_file or candle_file(symbol, granularity)
+    print(f"Backfilled {symbol}, recalculating indicators")
+    calculate_indicators(data_file=data_file)
+    verify_candles(data_file=data_file, granularity=granularity)
+    if granularity == config.GRANULARITY:
+        resample_timeframes(data_file)
+
+# --------------------- GAP REPAIR ---------------------
+
+# Splits the gaps of an integrity report into request windows
+def gap_windows(report, granularity) -> list:
+    windows = []
+    for gap in report["gaps"]:
+        for start in range(gap["start"], gap["end"] + 1, WINDOW_SECONDS):
+            windows.append((start, min(start + WINDOW_SECONDS - granularity, gap["end"])))
+    return windows
+
+# Refetches only the missing candle ranges of each symbol and merges them into its store
+def repair_candles(
+        symbols=config.MAIN_SYMBOLS,
+        granularity=config.GRANULARITY,
+        base_url=config.CANDLES_API_URL,
+        workers=config.BACKFILL_WORKERS,
+        limiter=None
+    ) -> dict:
+
+    '''
+    Returns the integrity report of every symbol after the repair, with the number of candles
+    recovered under "repaired". Gaps that are still there afterwards are hours the exchange has
+    no candles for, e.g. when nothing traded.
+    '''
+
+    limiter = limiter or TokenBucket()
+    sessions = SessionPool(workers)
+    reports = {}
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for symbol in symbols:
+                report = integrity_report(candle_file(symbol, granularity), granularity)
+                reports[symbol] = report
+                for start, end in gap_windows(report, granularity):
+                    future = executor.submit(fetch_window, symbol, start, end, granularity, sessions, limiter, base_url)
+                    futures[future] = symbol
+
+            fetched = {symbol: [] for symbol in symbols}
+            for future in as_completed(futures):
+                fetched[futures[future]].extend(future.result())
+    finally:
+        sessions.close()
+
+    for symbol in symbols:
+        data_file = candle_file(symbol, granularity)
+        repaired = 0
+
+        if fetched[symbol]:
+            store = open_store(data_file)
+            candles = store.to_frame(columns)[columns]
+            new_candles = pd.DataFrame(fetched[symbol], columns=columns)
+            new_candles = new_candles[~new_candles['timestamp'].isin(candles['timestamp'])]
+            new_candles = new_candles.drop_duplicates(subset="timestamp")
+            repaired = len(new_candles)
+
+            if repaired:
+                merged = pd.concat([candles, new_candles]).sort_values("timestamp").reset_index(drop=True)
+                store.write(merged)
+                calculate_indicators(data_file=data_file)
+
+                # buckets already aggregated from the gaps are rebuilt
+                if granularity == config.GRANULARITY:
+                    resample_timeframes(data_file, rebuild=True)
+
+        reports[symbol] = dict(integrity_report(data_file, granularity), repaired=repaired)
+        print(f"Repaired {repaired} candles of {symbol}, {reports[symbol]['missing']} still missing")
+
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill the candles of the main symbols")
+    parser.add_argument("--repair", action="store_true", help="refetch the gaps of the existing stores instead")
+    parser.add_argument("--report", help="JSON file to write the integrity reports of a repair to")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.repair:
+        reports = repair_candles()
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(reports, f, indent=2)
+    else:
+        appended = backfill()
+        print(appended)
+    print(f"Backfill took {time.perf_counter() - start:.1f} seconds")
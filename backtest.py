@@ -0,0 +1,287 @@
+from bisect import bisect_left
+import numpy as np
+
+# --------------------- BACKTEST ENGINE ---------------------
+
+# Walks only the candles where the strategy can actually trade and returns the state after each trade
+def simulate_trades(closes, buy_signal_arr, sell_signal_arr, buy_prop, sell_prop, balance, position, fee) -> tuple:
+
+    '''
+    Runs the balance/position state machine of the backtest over the signal arrays.
+
+    Instead of visiting every candle, the signals are compressed into the candle indices
+    where a buy or a sell is possible and the loop jumps straight to the next index that can
+    change state: while the balance is empty only sell signals are visited, and while the
+    position is empty only buy signals are visited.
+
+    Returns (trade_indices, balances, positions) where balances[k]/positions[k] hold the
+    state right after the trade executed on candle trade_indices[k].
+    '''
+
+    buy_idx = np.flatnonzero(buy_signal_arr).tolist()
+    sell_idx = np.flatnonzero(sell_signal_arr).tolist()
+    n = len(closes)
+
+    trade_indices = []
+    balances = []
+    positions = []
+
+    t = 0
+    while True:
+        # next candle where a buy can execute (only while there is balance left)
+        next_buy = n
+        if balance > 0:
+            b = bisect_left(buy_idx, t)
+            if b < len(buy_idx):
+                next_buy = buy_idx[b]
+
+        # next candle where a sell can execute (only while there is a position left)
+        next_sell = n
+        if position > 0:
+            s = bisect_left(sell_idx, t)
+            if s < len(sell_idx):
+                next_sell = sell_idx[s]
+
+        i = min(next_buy, next_sell)
+        if i >= n:
+            break
+
+        price = closes[i]
+
+        # buy takes priority over sell on the same candle, same as the per-candle loop
+        if i == next_buy:
+            cost = balance * buy_prop
+            coins = (cost / price) * (1 - fee)
+            position += coins
+            balance -= cost
+        else:
+            revenue = (position * price) * sell_prop * (1 - fee)
+            balance += revenue
+            position *= (1 - sell_prop)
+
+        trade_indices.append(i)
+        balances.append(balance)
+        positions.append(position)
+        t = i + 1
+
+    return trade_indices, balances, positions
+
+# Expands the per-trade state into one equity value per candle
+def equity_curve(closes, trade_indices, balances, positions, balance, position, out=None) -> np.ndarray:
+
+    '''
+    Balance and position are constant between two trades, so the equity of every candle is
+    balance + position * close with the state of the last trade at or before that candle.
+    Pass a preallocated float64 array as out to avoid allocating a new equity buffer.
+    '''
+
+    n = len(closes)
+    bounds = np.empty(len(trade_indices) + 2, dtype=np.int64)
+    bounds[0] = 0
+    bounds[1:-1] = trade_indices
+    bounds[-1] = n
+    run_lengths = np.diff(bounds)
+
+    balance_arr = np.repeat(np.array([balance] + balances, dtype=np.float64), run_lengths)
+    position_arr = np.repeat(np.array([position] + positions, dtype=np.float64), run_lengths)
+
+    if out is None:
+        out = np.empty(n, dtype=np.float64)
+
+    np.multiply(position_arr, closes, out=out)
+    np.add(balance_arr, out, out=out)
+    return out
+
+# Returns the candle-to-candle returns of an equity curve, skipping candles that follow zero equity
+def period_returns(equity) -> np.ndarray:
+    prev_equity = equity[:-1]
+    curr_equity = equity[1:]
+    valid = prev_equity > 0
+    return (curr_equity[valid] - prev_equity[valid]) / prev_equity[valid]
+
+# Runs a full backtest and returns the equity curve plus the final balance and position
+def simulate(closes, buy_signal_arr, sell_signal_arr, buy_prop, sell_prop, balance, position, fee, out=None) -> tuple:
+    trade_indices, balances, positions = simulate_trades(
+        closes, buy_signal_arr, sell_signal_arr, buy_prop, sell_prop, balance, position, fee
+    )
+    equity = equity_curve(closes, trade_indices, balances, positions, balance, position, out=out)
+
+    final_balance = balances[-1] if balances else balance
+    final_position = positions[-1] if positions else position
+    return equity, final_balance, final_position
+
+# Computes the equity curve chunk by chunk and stops as soon as the drawdown falls below drawdown_limit
+def equity_within_drawdown(closes, trade_indices, balances, positions, balance, position, drawdown_limit, chunk_size=2048) -> tuple:
+
+    '''
+    Same equity values as equity_curve, but the running peak is carried from chunk to chunk so
+    that a strategy breaching the drawdown limit early never has the rest of its history built.
+
+    Returns (equity, max_drawdown) where equity is None if the limit was breached, in which case
+    max_drawdown is the drawdown of the chunk that breached it.
+    '''
+
+    n = len(closes)
+    trade_indices = np.asarray(trade_indices, dtype=np.int64)
+    balance_states = np.array([balance] + balances, dtype=np.float64)
+    position_states = np.array([position] + positions, dtype=np.float64)
+
+    equity = np.empty(n, dtype=np.float64)
+    peak = -np.inf
+    max_drawdown = np.inf
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+
+        # state of the last trade at or before each candle of the chunk
+        state = np.searchsorted(trade_indices, np.arange(start, stop), side='right')
+        chunk = equity[start:stop]
+        np.multiply(position_states[state], closes[start:stop], out=chunk)
+        np.add(balance_states[state], chunk, out=chunk)
+
+        peaks = np.maximum.accumulate(np.maximum(chunk, peak))
+        chunk_drawdown = ((chunk / peaks - 1) * 100).min()
+        max_drawdown = np.minimum(max_drawdown, chunk_drawdown)
+        peak = peaks[-1]
+
+        if max_drawdown < drawdown_limit:
+            return None, max_drawdown
+
+    return equity, max_drawdown
+
+# Runs the trade state machine for many strategies at once over the same candles
+def simulate_batch_trades(closes, buy_matrix, sell_matrix, buy_props, sell_props, balance, position, fee) -> tuple:
+
+    '''
+    Batched version of simulate_trades for a (strategies x candles) pair of signal matrices.
+
+    Every strategy's candidate trade candles are lined up by rank, so step k applies the k-th
+    candidate trade of all strategies with one set of vectorized state updates. Strategies are
+    processed in order of decreasing candidate count so that each step only touches the prefix
+    of strategies that still have candidates left.
+
+    Returns (balance_hist, position_hist, final_balances, final_positions), where column k of the
+    histories is the state after the k-th candidate candle of each strategy (column 0 is the
+    initial state). The number of candidates at or before a candle selects the state of that candle.
+    '''
+
+    n_strategies, n = buy_matrix.shape
+    buy_props = np.asarray(buy_props, dtype=np.float64)
+    sell_props = np.asarray(sell_props, dtype=np.float64)
+
+    candidate_mask = buy_matrix | sell_matrix
+    counts = candidate_mask.sum(axis=1)
+    max_events = int(counts.max()) if n_strategies else 0
+
+    # candidate candle indices per strategy, left-aligned by rank
+    rows, cols = np.nonzero(candidate_mask)
+    ranks = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    event_idx = np.zeros((n_strategies, max_events), dtype=np.int64)
+    event_idx[rows, ranks] = cols
+
+    # strategies with the most candidates first, active strategies are always a prefix
+    order = np.argsort(-counts, kind='stable')
+    neg_sorted_counts = -counts[order]
+    event_idx = event_idx[order]
+    buy_sorted = buy_matrix[order]
+    sell_sorted = sell_matrix[order]
+    buy_props_sorted = buy_props[order]
+    sell_props_sorted = sell_props[order]
+
+    # state after each candidate, column 0 is the initial state
+    balance_hist = np.empty((n_strategies, max_events + 1), dtype=np.float64)
+    position_hist = np.empty((n_strategies, max_events + 1), dtype=np.float64)
+    balance_hist[:, 0] = balance
+    position_hist[:, 0] = position
+
+    balances = balance_hist[:, 0].copy()
+    positions = position_hist[:, 0].copy()
+
+    for k in range(max_events):
+        active = int(np.searchsorted(neg_sorted_counts, -k, side='left'))
+        rows_k = np.arange(active)
+        idx = event_idx[:active, k]
+        price = closes[idx]
+        bal = balances[:active]
+        pos = positions[:active]
+
+        # buy takes priority over sell on the same candle, same as the single strategy engine
+        is_buy = buy_sorted[rows_k, idx] & (bal > 0)
+        is_sell = ~is_buy & sell_sorted[rows_k, idx] & (pos > 0)
+
+        cost = bal * buy_props_sorted[:active]
+        coins = (cost / price) * (1 - fee)
+        revenue = (pos * price) * sell_props_sorted[:active] * (1 - fee)
+
+        new_bal = np.where(is_buy, bal - cost, np.where(is_sell, bal + revenue, bal))
+        new_pos = np.where(is_buy, pos + coins, np.where(is_sell, pos * (1 - sell_props_sorted[:active]), pos))
+
+        balances[:active] = new_bal
+        positions[:active] = new_pos
+        balance_hist[:active, k + 1] = new_bal
+        position_hist[:active, k + 1] = new_pos
+
+    # restore the caller's strategy order
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(n_strategies)
+    return balance_hist[inverse], position_hist[inverse], balances[inverse], positions[inverse]
+
+# Expands the batched trade states into one equity value per strategy and candle
+def batch_equity_curve(closes, candidate_mask, balance_hist, position_hist) -> np.ndarray:
+    # number of candidates at or before each candle selects the state of that candle,
+    # which never goes past a strategy's own candidate count
+    state_idx = np.cumsum(candidate_mask, axis=1)
+    balance_arr = np.take_along_axis(balance_hist, state_idx, axis=1)
+    position_arr = np.take_along_axis(position_hist, state_idx, axis=1)
+    return balance_arr + position_arr * closes
+
+# Batched equity curves built chunk by chunk, dropping strategies once they breach drawdown_limit
+def batch_equity_within_drawdown(closes, candidate_mask, balance_hist, position_hist, drawdown_limit, chunk_size=2048) -> tuple:
+
+    '''
+    Returns (equity_matrix, max_drawdowns, breached). Rows of breached strategies are only filled
+    up to the chunk that breached the limit, the other rows match batch_equity_curve exactly.
+    '''
+
+    n_strategies, n = candidate_mask.shape
+    equity = np.empty((n_strategies, n), dtype=np.float64)
+    peaks = np.full(n_strategies, -np.inf)
+    max_drawdowns = np.full(n_strategies, np.inf)
+    offsets = np.zeros(n_strategies, dtype=np.int64)
+    breached = np.zeros(n_strategies, dtype=bool)
+
+    rows = np.arange(n_strategies)
+    for start in range(0, n, chunk_size):
+        if len(rows) == 0:
+            break
+        stop = min(start + chunk_size, n)
+
+        mask = candidate_mask[rows, start:stop]
+        state_idx = offsets[rows, None] + np.cumsum(mask, axis=1)
+        chunk = np.take_along_axis(balance_hist[rows], state_idx, axis=1) + np.take_along_axis(position_hist[rows], state_idx, axis=1) * closes[start:stop]
+        equity[rows, start:stop] = chunk
+
+        chunk_peaks = np.maximum.accumulate(np.maximum(chunk, peaks[rows, None]), axis=1)
+        chunk_drawdown = ((chunk / chunk_peaks - 1) * 100).min(axis=1)
+        max_drawdowns[rows] = np.minimum(max_drawdowns[rows], chunk_drawdown)
+        peaks[rows] = chunk_peaks[:, -1]
+        offsets[rows] = state_idx[:, -1]
+
+        newly_breached = max_drawdowns[rows] < drawdown_limit
+        breached[rows[newly_breached]] = True
+        rows = rows[~newly_breached]
+
+    return equity, max_drawdowns, breached
+
+# Runs the backtest for many strategies at once over the same candles
+def simulate_batch(closes, buy_matrix, sell_matrix, buy_props, sell_props, balance, position, fee) -> tuple:
+
+    '''
+    Batched version of simulate for a (strategies x candles) pair of signal matrices, see
+    simulate_batch_trades. Returns (equity_matrix, final_balances, final_positions).
+    '''
+
+    balance_hist, position_hist, balances, positions = simulate_batch_trades(
+        closes, buy_matrix, sell_matrix, buy_props, sell_props, balance, position, fee
+    )
+    equity = batch_equity_curve(closes, buy_matrix | sell_matrix, balance_hist, position_hist)
+    return equity, balances, positions
@@ -0,0 +1,37 @@
+import numpy as np
+
+# --------------------- SIGNAL BITSETS ---------------------
+
+# Signals are packed 64 candles per uint64 word, candle i is bit i % 64 of word i // 64.
+# Bits past the last candle are always zero, so AND/OR of two bitsets is just & / | of the words.
+
+# Set bits of every byte value 0..255, used when numpy has no bitwise_count
+_BYTE_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int64)
+
+# Packs a boolean array, or an (n x candles) matrix of them, into uint64 bitsets
+def pack(signal) -> np.ndarray:
+    packed = np.packbits(np.asarray(signal, dtype=bool), axis=-1, bitorder='little')
+    padding = -packed.shape[-1] % 8
+    if padding:
+        packed = np.concatenate((packed, np.zeros(packed.shape[:-1] + (padding,), dtype=np.uint8)), axis=-1)
+    return np.ascontiguousarray(packed).view('<u8')
+
+# Unpacks a bitset, or an (n x words) matrix of bitsets, into booleans of the given length
+def unpack(bits, length) -> np.ndarray:
+    packed = np.ascontiguousarray(bits, dtype='<u8').view(np.uint8)
+    return np.unpackbits(packed, axis=-1, count=length, bitorder='little').view(bool)
+
+# Bitsets of candles start..stop of a bitset, or of every row of a matrix of bitsets
+def window(bits, length, start, stop) -> np.ndarray:
+    return pack(unpack(bits, length)[..., start:stop])
+
+# Number of set bits of a bitset, or of every row of a matrix of bitsets
+def popcount(bits):
+    bits = np.asarray(bits, dtype='<u8')
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits).sum(axis=-1, dtype=np.int64)
+    return _BYTE_POPCOUNT[bits.view(np.uint8)].sum(axis=-1)
+
+# Bitset with no candle set
+def empty(length) -> np.ndarray:
+    return np.zeros(-(-length // 64), dtype='<u8')
@@ -0,0 +1,74 @@
+import argparse
+import json
+import numpy as np
+import config
+from candle_store import open_store
+
+SECONDS_PER_YEAR = 365 * 86400
+
+# --------------------- CANDLE INTEGRITY INDEX ---------------------
+
+# Returns an (n_gaps x 2) array of the first and last missing candle timestamp of every gap
+def gap_index(timestamps, granularity=config.GRANULARITY) -> np.ndarray:
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(timestamps) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+
+    diffs = np.diff(timestamps)
+    gaps = np.flatnonzero(diffs > granularity)
+    return np.column_stack((timestamps[gaps] + granularity, timestamps[gaps + 1] - granularity))
+
+# Returns the fraction of expected candles present between the first and last candle
+def coverage(timestamps, granularity=config.GRANULARITY) -> float:
+    if len(timestamps) < 2:
+        return 1.0
+    span = int(timestamps[-1]) - int(timestamps[0])
+    return (len(timestamps) - 1) * granularity / span if span > 0 else 1.0
+
+# Number of bars per year actually observed in a series, PERIODS_PER_YEAR scaled down by its gaps
+def effective_periods_per_year(timestamps, periods_per_year=config.PERIODS_PER_YEAR) -> float:
+    granularity = SECONDS_PER_YEAR // periods_per_year
+    return periods_per_year * coverage(timestamps, granularity)
+
+# Machine-readable integrity report of a candle series
+def integrity_report(data_file=config.CSV_FILE, granularity=config.GRANULARITY) -> dict:
+
+    '''
+    Gaps are runs of missing candles, each given by its first and last missing timestamp.
+    Irregular steps are out-of-order, duplicate or off-grid timestamps, which no refetch can
+    fix and which mean the store has to be rebuilt.
+    '''
+
+    timestamps = np.asarray(open_store(data_file).load(['timestamp'])['timestamp'], dtype=np.int64)
+    gaps = gap_index(timestamps, granularity)
+    diffs = np.diff(timestamps)
+    missing = int(((gaps[:, 1] - gaps[:, 0]) // granularity + 1).sum()) if len(gaps) else 0
+
+    return {
+        "data_file": data_file,
+        "granularity": granularity,
+        "candles": int(len(timestamps)),
+        "first": int(timestamps[0]) if len(timestamps) else None,
+        "last": int(timestamps[-1]) if len(timestamps) else None,
+        "missing": missing,
+        "coverage": coverage(timestamps, granularity),
+        "irregular": int(((diffs <= 0) | (diffs % granularity != 0)).sum()),
+        "gaps": [
+            {"start": int(start), "end": int(end), "candles": int((end - start) // granularity + 1)}
+            for start, end in gaps
+        ]
+    }
+
+# True when a report has no gaps and no irregular steps
+def is_intact(report) -> bool:
+    return report["missing"] == 0 and report["irregular"] == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the integrity report of candle series as JSON")
+    parser.add_argument("data_files", nargs="*", default=[config.CSV_FILE])
+    parser.add_argument("--granularity", type=int, default=config.GRANULARITY)
+    args = parser.parse_args()
+
+    reports = [integrity_report(data_file, args.granularity) for data_file in args.data_files]
+    print(json.dumps(reports, indent=2))
@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# --------------------- COLUMNAR CANDLE STORE ---------------------
+
+META_FILE = "meta.json"
+STORE_VERSION = 1
+
+# Returns the store directory of a candle series, e.g. data/eth_usd_1h.csv -> data/eth_usd_1h.store
+def store_path(data_file) -> str:
+    return os.path.splitext(data_file)[0] + ".store"
+
+# Converts a DataFrame or dict of arrays into a dict of int64/float64 numpy columns
+def to_columns(data) -> dict:
+    if isinstance(data, pd.DataFrame):
+        data = {name: data[name].to_numpy() for name in data.columns}
+
+    columns = {}
+    for name, values in data.items():
+        values = np.asarray(values)
+        if values.dtype.kind in 'iub':
+            columns[name] = values.astype('<i8')
+        elif values.dtype.kind == 'f':
+            columns[name] = values.astype('<f8')
+        elif values.dtype.kind == 'O':
+            # numeric data read back as objects, e.g. after concatenating with a live candle
+            try:
+                columns[name] = values.astype('<f8')
+            except (TypeError, ValueError):
+                continue
+        # dates and strings are derived data and are not stored
+    return columns
+
+class ColumnStore:
+
+    '''
+    Directory of raw little-endian column files (<column>.bin) plus a small meta.json header with
+    the row count and dtype of every column. Columns are loaded as read-only memory maps without
+    any parsing. Appended rows are written to the end of each column file and only become visible
+    once the header is rewritten, so a crash mid-append never exposes a partial row.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = self._read_meta()
+
+    def _meta_file(self):
+        return os.path.join(self.path, META_FILE)
+
+    def _column_file(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _read_meta(self):
+        if not os.path.exists(self._meta_file()):
+            return {"version": STORE_VERSION, "length": 0, "columns": {}}
+
+        with open(self._meta_file(), "r") as f:
+            return json.load(f)
+
+    # Header is replaced atomically, it is the commit point of every write
+    def _write_meta(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_file = self._meta_file() + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_file, self._meta_file())
+
+    def exists(self) -> bool:
+        return os.path.exists(self._meta_file())
+
+    def __len__(self):
+        return self.meta["length"]
+
+    @property
+    def columns(self) -> list:
+        return list(self.meta["columns"])
+
+    # Returns a dict of column arrays, memory mapped by default
+    def load(self, columns=None, mmap=True) -> dict:
+        length = self.meta["length"]
+        arrays = {}
+        for name in columns or self.columns:
+            dtype = np.dtype(self.meta["columns"][name])
+            if length == 0:
+                arrays[name] = np.empty(0, dtype=dtype)
+            elif mmap:
+                arrays[name] = np.memmap(self._column_file(name), dtype=dtype, mode='r', shape=(length,))
+            else:
+                arrays[name] = np.fromfile(self._column_file(name), dtype=dtype, count=length)
+        return arrays
+
+    # Appends rows to the end of every column, columns missing from data are filled with NaN
+    def append(self, data):
+        columns = to_columns(data)
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("All appended columns must have the same length")
+        n_new = lengths.pop() if lengths else 0
+        if n_new == 0:
+            return
+
+        if not self.meta["columns"]:
+            self.meta["columns"] = {name: values.dtype.str for name, values in columns.items()}
+
+        unknown = set(columns) - set(self.meta["columns"])
+        if unknown:
+            raise ValueError(f"Columns {sorted(unknown)} are not in the store {self.path}")
+
+        os.makedirs(self.path, exist_ok=True)
+        length = self.meta["length"]
+        for name, dtype in self.meta["columns"].items():
+            dtype = np.dtype(dtype)
+            values = columns.get(name)
+            if values is None:
+                if dtype.kind != 'f':
+                    raise ValueError(f"Missing values for integer column {name}")
+                values = np.full(n_new, np.nan, dtype=dtype)
+
+            column_file = self._column_file(name)
+
+            # drop bytes left behind by an append that never reached the header
+            if os.path.exists(column_file):
+                os.truncate(column_file, length * dtype.itemsize)
+
+            with open(column_file, "ab") as f:
+                f.write(values.astype(dtype).tobytes())
+
+        self.meta["length"] = length + n_new
+        self._write_meta()
+
+    # Overwrites the values of existing columns from row start on, e.g. indicators of appended rows
+    def overwrite(self, start, data):
+        columns = to_columns(data)
+        for name, values in columns.items():
+            if name not in self.meta["columns"]:
+                raise ValueError(f"Column {name} is not in the store {self.path}")
+            if start + len(values) > self.meta["length"]:
+                raise ValueError(f"Rows {start}..{start + len(values)} are past the end of the store {self.path}")
+
+        for name, values in columns.items():
+            dtype = np.dtype(self.meta["columns"][name])
+            with open(self._column_file(name), "r+b") as f:
+                f.seek(start * dtype.itemsize)
+                f.write(values.astype(dtype).tobytes())
+
+    # Replaces the whole store with new columns
+    def write(self, data):
+        columns = to_columns(data)
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("All written columns must have the same length")
+
+        os.makedirs(self.path, exist_ok=True)
+        for name, values in columns.items():
+            tmp_file = self._column_file(name) + ".tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(values.tobytes())
+            os.replace(tmp_file, self._column_file(name))
+
+        for name in set(self.meta["columns"]) - set(columns):
+            os.remove(self._column_file(name))
+
+        self.meta = {
+            "version": STORE_VERSION,
+            "length": lengths.pop() if lengths else 0,
+            "columns": {name: values.dtype.str for name, values in columns.items()}
+        }
+        self._write_meta()
+
+    # Returns the store as a DataFrame, with the date column rebuilt from the timestamps
+    def to_frame(self, columns=None) -> pd.DataFrame:
+        df = pd.DataFrame({name: np.array(values) for name, values in self.load(columns).items()})
+        if 'timestamp' in df.columns:
+            position = df.columns.get_loc('volume') + 1 if 'volume' in df.columns else len(df.columns)
+            df.insert(position, 'date', pd.to_datetime(df['timestamp'], unit='s'))
+        return df
+
+    def import_csv(self, csv_file):
+        self.write(pd.read_csv(csv_file, index_col=0, float_precision="round_trip"))
+
+    def export_csv(self, csv_file):
+        self.to_frame().to_csv(csv_file)
+
+# Opens the store of a candle series, importing its legacy CSV file the first time
+def open_store(data_file) -> ColumnStore:
+    store = ColumnStore(store_path(data_file))
+    if not store.exists() and os.path.exists(data_file):
+        store.import_csv(data_file)
+    return store
+
+# Loads a candle series as a DataFrame
+def load_candles(data_file, columns=None) -> pd.DataFrame:
+    store = open_store(data_file)
+    if not store.exists():
+        raise FileNotFoundError(f"No candle store or CSV file found for {data_file}")
+    return store.to_frame(columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert candle series between CSV files and the columnar store")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("csv_file", help="CSV path of the series, e.g. data/eth_usd_1h.csv")
+    args = parser.parse_args()
+
+    store = ColumnStore(store_path(args.csv_file))
+    if args.command == "import":
+        store.import_csv(args.csv_file)
+        print(f"Imported {len(store)} candles into {store.path}")
+    else:
+        store.export_csv(args.csv_file)
+        print(f"Exported {len(store)} candles to {args.csv_file}")
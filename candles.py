@@ -1,103 +1,108 @@
 import requests
 import pandas as pd
 import time
-import os
 import config
 from analysis import calculate_indicators
+from candle_store import open_store, load_candles
+from indicator_cube import with_cube
+from candle_integrity import integrity_report, is_intact
 
 # CONFIG
 columns = ['timestamp', 'low', 'high', 'open', 'close', 'volume']
 
 SIX_MONTHS = 15778376  # seconds in six months
 
-# Fetch historical candle data from Coinbase Pro API
-def get_candles(start=None, end=None, symbol=config.SYMBOL, granularity=config.GRANULARITY):
-    url = f"https://api.exchange.coinbase.com/products/{symbol}/candles"
+TIMEFRAME_NAMES = {3600: '1h', 14400: '4h', 86400: '1d'}
+
+# Returns the data file of a symbol's candles, e.g. ETH-USD -> data/eth_usd_1h.csv
+def candle_file(symbol, granularity=config.GRANULARITY) -> str:
+    return f"data/{symbol.split('-')[0].lower()}_usd_{TIMEFRAME_NAMES[granularity]}.csv"
+
+# Fetch historical candle data from Coinbase Pro API, optionally over a keep-alive session
+def get_candles(start=None, end=None, symbol=config.SYMBOL, granularity=config.GRANULARITY, session=None, base_url=config.CANDLES_API_URL):
+    url = f"{base_url}/products/{symbol}/candles"
     params = {
         "granularity": granularity,
         "start": start,
         "end": end
     }
-    response = requests.get(url, params=params)
+    response = (session or requests).get(url, params=params)
+    response.raise_for_status()
     data = response.json()
     return data
 
-def verify_candles(data_file=config.CSV_FILE):
-    df = pd.read_csv(data_file, index_col=0)
-    timestamps = df['timestamp']
-    time_diffs = timestamps.diff().dropna()
-    if time_diffs.nunique() == 1 and time_diffs.iloc[0] == 3600.0:
+# Prints a summary of the gap index of a candle series and returns its integrity report
+def verify_candles(data_file=config.CSV_FILE, granularity=config.GRANULARITY) -> dict:
+    report = integrity_report(data_file, granularity)
+    if is_intact(report):
         print("All candles are present and correctly spaced.")
     else:
         print("Missing or irregular candles detected.")
-        print(time_diffs.value_counts())
+        print(f"{report['missing']} missing candles in {len(report['gaps'])} gaps, {report['irregular']} irregular steps")
+    return report
 
 def update_candles(data_file=config.CSV_FILE, granularity=config.GRANULARITY, symbol=config.SYMBOL):
     current_time = int(time.time())
-    if not os.path.exists(data_file):
-        start = current_time - SIX_MONTHS * 10  # start 10 six-month periods ago (5 years)
-        end = start + 86400*10  # 10 days of candles per request
-
-        found_start = False
-        while not found_start:
-            
-            candles = get_candles(start, end, symbol=symbol, granularity=granularity)
-
-            if candles:
-                candles.sort(key=lambda x: x[0])  # sort by timestamp
-
-                # Construct DataFrame and send it to CSV file
-                df = pd.DataFrame(candles, columns=columns)
-                df['date'] = pd.to_datetime(df['timestamp'], unit='s')
-                df.to_csv(data_file)
-
-                found_start = True
-                break
-            else:
-                start += 86400 * 10  # move forward 10 days
-                end = start + 86400 * 10
-
-    df = pd.read_csv(data_file, index_col=0)
-    last_timestamp = df.iloc[-1]['timestamp']
+    store = open_store(data_file)
+    if len(store) == 0:
+        # imported here since the backfill scheduler builds on the helpers of this module
+        from backfill import backfill
+        backfill([symbol], granularity=granularity, now=current_time, data_files={symbol: data_file}, finish=False)
+        store = open_store(data_file)
+        if len(store) == 0:
+            print(f"No candles of {symbol} found")
+            return
+
+    last_timestamp = store.load(['timestamp'])['timestamp'][-1]
     while last_timestamp < current_time - granularity:
         start = last_timestamp + 1
         end = min(start + 86400 * 10, current_time)
         new_candles = get_candles(start, end, symbol=symbol, granularity=granularity)
         if not new_candles:
             break
-        
-        df = pd.concat([df, pd.DataFrame(new_candles, columns=columns)], ignore_index=True)
-        df['date'] = pd.to_datetime(df['timestamp'], unit='s')
+
+        # only append candles newer than the store, in timestamp order
+        df = pd.DataFrame(new_candles, columns=columns)
         df = df.drop_duplicates(subset="timestamp").sort_values("timestamp")
-        df.to_csv(data_file)
+        df = df[df['timestamp'] > last_timestamp]
+        if df.empty:
+            break
+
+        store.append(df)
         last_timestamp = df.iloc[-1]['timestamp']
 
     calculate_indicators(data_file=data_file)
 
-    verify_candles(data_file=data_file)
+    verify_candles(data_file=data_file, granularity=granularity)
+
+    # higher timeframes are aggregated from the new hourly candles instead of fetched
+    if granularity == config.GRANULARITY:
+        from resample import resample_timeframes
+        resample_timeframes(data_file)
 
 def get_main_currencies():
-    update_candles(data_file="data/btc_usd_1h.csv", granularity=3600, symbol="BTC-USD")
-    update_candles(data_file="data/eth_usd_1h.csv", granularity=3600, symbol="ETH-USD")
-    update_candles(data_file="data/ltc_usd_1h.csv", granularity=3600, symbol="LTC-USD")
-    update_candles(data_file="data/xrp_usd_1h.csv", granularity=3600, symbol="XRP-USD")
-    update_candles(data_file="data/sol_usd_1h.csv", granularity=3600, symbol="SOL-USD")
-    update_candles(data_file="data/ada_usd_1h.csv", granularity=3600, symbol="ADA-USD")
-    update_candles(data_file="data/doge_usd_1h.csv", granularity=3600, symbol="DOGE-USD")
-    update_candles(data_file="data/hbar_usd_1h.csv", granularity=3600, symbol="HBAR-USD")
+    # imported here since the backfill scheduler builds on the helpers of this module
+    from backfill import backfill
+    backfill(config.MAIN_SYMBOLS, granularity=3600)
 
 # Load all candle data into dictionary for faster access
 def cache_data(currencies=config.TEST_CURRENCIES, candle_cutoff=config.CANDLE_CUTOFF): 
     cached_data = {}
 
+    # candle_cutoff counts 1h candles, higher timeframes skip the same span of time
+    timeframe_seconds = {name: seconds for seconds, name in TIMEFRAME_NAMES.items()}[config.TIMEFRAME]
+    candle_cutoff = candle_cutoff * config.GRANULARITY // timeframe_seconds
+
     # For each currency, if it is not already cached, load its data
     for currency in currencies:
         if currency not in cached_data:
             try:
-                df = pd.read_csv(f'data/{currency}_usd_{config.TIMEFRAME}.csv', index_col=0).iloc[candle_cutoff:].reset_index(drop=True)
+                # window variants of the indicators come precomputed from the indicator cube
+                data_file = f'data/{currency}_usd_{config.TIMEFRAME}.csv'
+                df = with_cube(load_candles(data_file), data_file).iloc[candle_cutoff:].reset_index(drop=True)
                 cached_data[currency] = df
             except FileNotFoundError:
-                print(f"Warning: {currency}_usd_{config.TIMEFRAME}.csv not found")
+                print(f"Warning: {currency}_usd_{config.TIMEFRAME} candles not found")
                 continue   
 
     return cached_data
@@ -0,0 +1,173 @@
+import json
+import os
+import random
+import struct
+import threading
+import zlib
+import config
+from log_strategies import tree_to_json, json_to_strategy
+
+# --------------------- GA CHECKPOINTS ---------------------
+
+MAGIC = b"GACK"
+CHECKPOINT_VERSION = 1
+HEADER = struct.Struct("<4sHI")  # magic, version, length of the compressed payload
+
+# Strategy dict with its trees in the log_strategies JSON encoding
+def encode_strategy(strategy) -> dict:
+    return {
+        "buy_tree": tree_to_json(strategy["buy_tree"]),
+        "sell_tree": tree_to_json(strategy["sell_tree"]),
+        "buy_proportion": strategy["buy_proportion"],
+        "sell_proportion": strategy["sell_proportion"]
+    }
+
+def decode_strategy(record) -> dict:
+    return json_to_strategy({"strategy": record})
+
+# Serializes a GA state into the compact binary checkpoint format
+def encode_state(state) -> bytes:
+    payload = dict(state)
+    if payload.get("population") is not None:
+        payload["population"] = [encode_strategy(strategy) for strategy in payload["population"]]
+    if payload.get("islands") is not None:
+        payload["islands"] = [
+            dict(island, population=[encode_strategy(strategy) for strategy in island["population"]])
+            for island in payload["islands"]
+        ]
+    compressed = zlib.compress(json.dumps(payload, separators=(',', ':')).encode(), 1)
+    return HEADER.pack(MAGIC, CHECKPOINT_VERSION, len(compressed)) + compressed
+
+def decode_state(data) -> dict:
+    magic, version, length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != CHECKPOINT_VERSION:
+        raise ValueError(f"Not a version {CHECKPOINT_VERSION} GA checkpoint")
+
+    state = json.loads(zlib.decompress(data[HEADER.size:HEADER.size + length]))
+    if state.get("population") is not None:
+        state["population"] = [decode_strategy(record) for record in state["population"]]
+    for island in state.get("islands") or []:
+        island["population"] = [decode_strategy(record) for record in island["population"]]
+    return state
+
+# The random module state as plain lists, and back
+def rng_state() -> list:
+    version, internal, gauss = random.getstate()
+    return [version, list(internal), gauss]
+
+def restore_rng(state):
+    version, internal, gauss = state
+    random.setstate((version, tuple(internal), gauss))
+
+class Checkpointer:
+
+    '''
+    Writes GA checkpoints from a background thread so the generation loop only pays for taking
+    the snapshot. Only the latest snapshot matters: one handed over while the previous is still
+    being written replaces any snapshot waiting behind it. Files are replaced atomically, so a
+    crash mid-write leaves the previous checkpoint intact.
+
+    A snapshot holds the iteration and generation counters, the population, the random module
+    state and the fitness cache entries added since the cache file was last saved. iteration is set by the caller running several GA runs.
+    A snapshot of an island run holds the population and random state of every island instead.
+    '''
+
+    def __init__(self, path=config.CHECKPOINT_FILE, interval=config.CHECKPOINT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.iteration = 0
+        self.writes = 0
+        self._pending = None
+        self._writing = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    # Snapshot of the GA after a generation, written in the background. population is None
+    # between two iterations, the next one then starts from a new random population
+    def save(self, generation, population, fitness_cache=None):
+        state = {
+            "iteration": self.iteration,
+            "generation": generation,
+            "population": list(population) if population is not None else None,
+            "rng": rng_state(),
+            "fitness_cache": fitness_cache.unsaved() if fitness_cache is not None else {}
+        }
+        self._hand_over(state)
+
+    # Snapshot of an island run after the migration at generation, islands holds the population
+    # and random state of every island
+    def save_islands(self, generation, islands, topology_seed, fitness_cache=None):
+        self._hand_over({
+            "iteration": self.iteration,
+            "generation": generation,
+            "population": None,
+            "islands": [{"population": list(island["population"]), "rng": island["rng"]} for island in islands],
+            "topology_seed": topology_seed,
+            "rng": rng_state(),
+            "fitness_cache": fitness_cache.unsaved() if fitness_cache is not None else {}
+        })
+
+    def _hand_over(self, state):
+        with self._condition:
+            self._pending = state
+            self._condition.notify()
+
+    # Checkpoints after every interval generations, not after the last one of a run
+    def generation_done(self, generation, generations, population, fitness_cache=None):
+        if self.interval and (generation + 1) % self.interval == 0 and generation + 1 < generations:
+            self.save(generation + 1, population, fitness_cache)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                state, self._pending = self._pending, None
+                self._writing = True
+
+            try:
+                self._write(state)
+            except Exception as e:
+                print(f"Error writing checkpoint {self.path}: {e}")
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def _write(self, state):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encode_state(state))
+        os.replace(tmp_path, self.path)
+        self.writes += 1
+
+    # Waits until every snapshot handed over so far is on disk
+    def flush(self):
+        with self._condition:
+            while self._pending is not None or self._writing:
+                self._condition.wait()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# Reads a checkpoint, None if there is none or it cannot be read
+def load_checkpoint(path=config.CHECKPOINT_FILE):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return decode_state(f.read())
+    except (ValueError, struct.error, zlib.error) as e:
+        print(f"Checkpoint {path} is unreadable ({e}). Starting over.")
+        return None
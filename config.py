@@ -5,6 +5,19 @@ COIN = "ETH"
 CSV_FILE = f"data/{COIN.lower()}_usd_1h.csv"
 GRANULARITY = 3600
 
+# Products followed by the live gateway and kept up to date in data/
+MAIN_SYMBOLS = ["BTC-USD", "ETH-USD", "LTC-USD", "XRP-USD", "SOL-USD", "ADA-USD", "DOGE-USD", "HBAR-USD"]
+
+# --------------- HISTORICAL BACKFILL CONFIG ---------------
+
+CANDLES_API_URL = "https://api.exchange.coinbase.com"
+API_RATE_LIMIT = 10  # public endpoint requests per second
+API_BURST = 15       # requests allowed in a burst
+BACKFILL_WORKERS = 8
+BACKFILL_MAX_RETRIES = 5
+FIRST_CANDLE_FILE = "data/first_candles.json"  # cached listing date of every symbol
+RESAMPLE_GRANULARITIES = [14400, 86400]  # 4h and 1d candles derived from the stored 1h candles
+
 # --------------- GENERATE STRATEGY PARAMETERS ---------------
 
 OVERSOLD_LOWER = 10
@@ -17,16 +30,41 @@ SELL_PROPORTION_CHOICES = [0.5, 0.66, 0.75, 1.0]
 
 DEPTH = 3
 
+THRESHOLD_DECIMALS = 2  # thresholds are generated on this decimal grid, leaves are evaluated at their exact threshold
+
 # --------------- GENETIC PROGRAMMING PARAMETERS ---------------
 POPULATION_SIZE = 200
 GENERATIONS = 100
 MUTATION_RATE = 0.15
 ELITE_FRACTION = 0.05  # top 5% kept unchanged
+SELECTION = "truncation"  # truncation (the top half breeds) or tournament
+TOURNAMENT_SIZE = 3  # strategies competing for each parent place in tournament selection
 SHARPE_WEIGHT = 0.5
 RETURN_WEIGHT = 0.4
 DRAWDOWN_WEIGHT = 0.1
+EVAL_BATCH_SIZE = 50  # strategies backtested together in one batched call per worker, before any timing is measured
+FITNESS_CACHE_FILE = "fitness_cache.json"  # evaluated strategies persisted across runs, None to keep in memory
+FITNESS_CACHE_MAX_PER_SLICE = 20000  # results kept per data slice when the cache is saved, the highest Sharpe first
+STRATEGY_DB_FILE = "strategies.db"  # SQLite repository of the best strategies found, shared by concurrent GA runs
+MAX_SAVED_STRATEGIES = 100  # the repository keeps this many strategies with the highest fitness
+CHECKPOINT_FILE = "ga_checkpoint.bin"  # state of the running GA, written in the background, resumed with --resume
+CHECKPOINT_INTERVAL = 5  # generations between two checkpoints
+
+# --------------- ISLAND MODEL CONFIG ---------------
+ISLANDS = 1  # 1 runs the single population GA, more evolves that many sub-populations in parallel worker processes (opt-in with --islands)
+ISLAND_POPULATION_SIZE = 50  # strategies per island
+MIGRATION_INTERVAL = 10  # generations between two migrations
+MIGRANTS = 2  # best strategies each island sends to every island it migrates to
+MIGRATION_TOPOLOGY = "ring"  # ring (to the next island), all (to every other island) or random (a new pairing every migration)
+
+# --------------- PARALLEL EXECUTOR CONFIG ---------------
+EXECUTOR = "persistent"  # serial, thread, process (new pool per GA run) or persistent (one pool reused across runs)
+EXECUTOR_WORKERS = 0  # 0 uses every core
+CHUNK_TARGET_SECONDS = 0.5  # adaptive batches aim for this much work per task
+CHUNKS_PER_WORKER = 4  # minimum tasks per worker per generation, for load balancing
 
 # --------------- EVAL STRATEGY PARAMETERS ---------------
+SIGNAL_CACHE_MAX_BYTES = 128 * 1024 * 1024  # memory cap of the per-process indicator signal cache
 CANDLE_CUTOFF = 30000  # Starting candle index to evaluate from
 TEST_CURRENCIES = ['ltc', 'eth']
 TIMEFRAME = '1h'
@@ -47,4 +85,20 @@ POSITION = 0.0 # amount of {SYMBOL} held
 MAKER_FEE = 0.0035
 TAKER_FEE = 0.0075
 
-RISK_FREE_ANNUAL = 0.0
\ No newline at end of file
+RISK_FREE_ANNUAL = 0.0
+
+# TRADE LEDGER
+LEDGER_CAPACITY = 4096  # trades preallocated per ledger, doubled when full
+LEDGER_FLUSH_ROWS = 65536  # buffered trades written at once to the store of a ledger
+
+# --------------- WALK FORWARD CONFIG ---------------
+WALK_FORWARD_FOLDS = 5  # train/test folds per currency
+WALK_FORWARD_MODE = "rolling"  # rolling (fixed train window), anchored (train from the first candle) or kfold
+
+# --------------- INDICATOR GRID CONFIG ---------------
+# window variants precomputed into the indicator cube, variant 0 is the default of the candle store
+RSI_WINDOWS = [14, 7, 21, 28]  # RSI and StochRSI window
+MACD_WINDOWS = [(12, 26, 9), (8, 17, 9), (5, 35, 5), (19, 39, 9)]  # (fast, slow, signal)
+ADX_WINDOWS = [14, 7, 21, 28]
+BB_WINDOWS = [(20, 2), (20, 2.5), (10, 1.5), (50, 2)]  # (window, standard deviations)
+WINDOW_VARIANT_RATE = 0.5  # chance that a generated indicator uses a window other than the default
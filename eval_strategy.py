@@ -1,36 +1,48 @@
 import pandas as pd
 import numpy as np
 import config
+from backtest import simulate, simulate_trades, simulate_batch_trades, equity_within_drawdown, batch_equity_within_drawdown, period_returns
+from signal_cache import dataset_id
+from candle_integrity import effective_periods_per_year
+from tree_compiler import compiled, compile_population, run_program, run_roots
+import bitset
 
 # --------------------- GP STRATEGY SCRIPT ---------------------
 
-# Evaluates a strategy tree recursively and returns a pd.Series of boolean values for each candle
+# Evaluates a strategy tree and returns a pd.Series of boolean values for each candle
 def eval_tree(node, df) -> pd.Series:
     
     '''
     Determines if a trading signal should be triggered by returning a pd.Series of boolean values
     for each candle in the DataFrame based on the provided strategy tree.
+
+    The tree is compiled into a flat instruction list (see tree_compiler) and evaluated on uint64
+    bitsets. Leaf and AND/OR subtree results are memoized in the per-process SIGNAL_CACHE, keyed
+    by the candle data they were computed on. The Series is only built here, the evaluators below
+    work on the bitsets and boolean arrays directly.
     '''
 
-    # If node is a logical operator (check if string is the first element of a tuple of length > 0)
-    if isinstance(node, tuple) and len(node) > 0 and isinstance(node[0], str):
-        op = node[0]
-        if op == 'AND':
-            # Evaluate both subtrees and return logical AND
-            return eval_tree(node[1], df) & eval_tree(node[2], df)
-        elif op == 'OR':
-            # Evaluate both subtrees and return logical OR
-            return eval_tree(node[1], df) | eval_tree(node[2], df)
-
-    # Otherwise, node is an indicator function (leaf node)
-    func, threshold = node
-
-    try:
-        # Returns a pd.Series of boolean values for each candle
-        return func(df, threshold)
-    except Exception as e:
-        print(f"Error evaluating {func.__name__} with threshold {threshold}: {e}")
-        return False
+    return pd.Series(eval_signal(node, df), index=df.index)
+
+# Evaluates a strategy tree into a uint64 bitset of the candles where it fires
+def eval_bits(node, df) -> np.ndarray:
+    return run_program(compiled(node), df, dataset_id(df))
+
+# Evaluates a strategy tree into a boolean array with one value per candle
+def eval_signal(node, df) -> np.ndarray:
+    return bitset.unpack(eval_bits(node, df), len(df))
+
+# Bars per year of a candle series, fewer than periods_per_year when the series has gaps
+def series_periods_per_year(df, periods_per_year=config.PERIODS_PER_YEAR) -> float:
+    if 'timestamp' not in df.columns:
+        return periods_per_year
+    return effective_periods_per_year(df['timestamp'].values, periods_per_year)
+
+# Candle bounds of a window given as (start, stop) fractions of a series of length candles
+def window_bounds(length, window) -> tuple:
+    if window is None:
+        return 0, length
+    return int(round(window[0] * length)), int(round(window[1] * length))
 
 # Calculates fitness score as an average percent return of any given strategy passed in as a dictionary
 def evaluate_strategy(
@@ -61,27 +73,14 @@ def evaluate_strategy(
         # Price data for each currency and drops the first CANDLE_CUTOFF rows
         df = cached_data[currency]
 
-        # pd.Series of when to buy/sell
-        buy_signal = eval_tree(buy_tree, df)
-        sell_signal = eval_tree(sell_tree, df)
-
-        # convert to numpy arrays for speed
+        # boolean arrays of when to buy/sell
         closes = df['close'].values
-        buy_signal_arr = buy_signal.values
-        sell_signal_arr = sell_signal.values
-
-        for i in range(len(buy_signal_arr)):
-            price = closes[i]
-
-            if buy_signal_arr[i] and current_balance > 0:
-                cost = current_balance * buy_prop
-                coins = (cost / price) * (1 - fee)
-                current_position += coins
-                current_balance -= cost
-            elif sell_signal_arr[i] and current_position > 0:
-                revenue = (current_position * price) * sell_prop * (1 - fee)
-                current_balance += revenue
-                current_position *= (1 - sell_prop)
+        buy_signal_arr = eval_signal(buy_tree, df)
+        sell_signal_arr = eval_signal(sell_tree, df)
+
+        _, current_balance, current_position = simulate(
+            closes, buy_signal_arr, sell_signal_arr, buy_prop, sell_prop, current_balance, current_position, fee
+        )
 
         percent_return = (((current_balance + (current_position * float(closes[-1]))) - balance) / balance) * 100
         percent_returns.append(percent_return)
@@ -94,6 +93,51 @@ def evaluate_strategy(
     return sum(percent_returns) / len(percent_returns)
 
 
+# Fitness returned for strategies that are rejected by the evaluation
+PENALTY_RESULT = {
+    "avg_sharpe": -1e6,
+    "max_drawdown": -1e6,
+    "avg_percent_return": -1e6,
+    "avg_num_trades": -1e6
+}
+
+# Results of one evaluate_population call, stats holds how its trees were deduplicated in the
+# DAG compiled for the call. Pickled with the list, so it travels back from executor workers
+class BatchResults(list):
+
+    def __init__(self, results=(), stats=None):
+        super().__init__(results)
+        self.stats = stats
+
+# Rejection rules of the Sharpe evaluation
+MIN_TRADES = 15           # per currency
+MAX_DRAWDOWN = -50.0      # percent, per currency
+MIN_AVG_RETURN = 15       # percent, averaged over the currencies
+DRAWDOWN_CHUNK = 2048     # candles simulated between two drawdown checks
+
+# Strategies rejected on each currency by this process, the likeliest rejections are checked first
+_rejections = {}
+
+# Returns the currencies ordered by how often they rejected strategies so far
+def rejection_order(currencies) -> list:
+    return sorted(currencies, key=lambda currency: -_rejections.get(currency, 0))
+
+def _reject(currency, count=1):
+    _rejections[currency] = _rejections.get(currency, 0) + int(count)
+
+# Backtests a strategy on every currency of ledgers and records its trades in that currency's ledger
+def record_trades(cached_data, strategy, ledgers, balance=config.BALANCE, position=config.POSITION, fee=config.TAKER_FEE):
+    for currency, ledger in ledgers.items():
+        df = cached_data[currency]
+        closes = df['close'].values
+        buy_signal_arr = eval_signal(strategy['buy_tree'], df)
+        sell_signal_arr = eval_signal(strategy['sell_tree'], df)
+
+        trade_indices, balances, positions = simulate_trades(
+            closes, buy_signal_arr, sell_signal_arr, float(strategy['buy_proportion']), float(strategy['sell_proportion']), balance, position, fee
+        )
+        ledger.record_backtest(df['timestamp'].values, closes, trade_indices, balances, positions, balance, position)
+
 # Calculates fitness score of any given strategy passed in as a dictionary
 def evaluate_strategy_sharpe(
         cached_data,
@@ -103,120 +147,89 @@ def evaluate_strategy_sharpe(
         position=config.POSITION, 
         fee=config.TAKER_FEE,
         risk_free_annual=config.RISK_FREE_ANNUAL,
-        periods_per_year=config.PERIODS_PER_YEAR
+        periods_per_year=config.PERIODS_PER_YEAR,
+        ledgers=None
     ) -> dict:
 
     """
     Evaluate a strategy using annualized Sharpe ratio as fitness.
     Higher is better.
+
+    Any rejection on any currency gives the penalty result, so the evaluation is staged from
+    the cheapest check to the most expensive one and stops at the first rejection: signal counts
+    of every currency first, then the final return of the trade state machine, then the equity
+    curve, which is abandoned as soon as its drawdown breaches the limit. Currencies are visited
+    in rejection order, results are still averaged in the order of currencies.
+
+    ledgers optionally maps currencies to trade_ledger.TradeLedger objects that receive the
+    trades of the strategy on that currency (see record_trades). They are recorded before the
+    evaluation, so every ledger holds the full backtest whether or not the strategy is rejected.
+    Without it nothing is recorded and nothing is added to the backtest; the batched
+    evaluate_population never records trades.
     """
 
+    if ledgers is not None:
+        record_trades(cached_data, strategy, ledgers, balance, position, fee)
+
     # Get strategy parameters
     buy_tree = strategy['buy_tree']
     sell_tree = strategy['sell_tree']
     buy_prop = float(strategy['buy_proportion'])
     sell_prop = float(strategy['sell_proportion'])
 
-    results = {
-        "avg_sharpe": 0.0,
-        "max_drawdown": 0.0,
-        "avg_percent_return": 0.0,
-        "avg_num_trades": 0
-    }
+    order = rejection_order(currencies)
 
-    # use Python lists instead of np.array + np.append
-    sharpe_ratios = []
-    max_drawdowns = []
-    percent_returns = []
-    num_trades_list = []
+    # Stage 1: penalize too few trades, straight from the signals
+    signals = {}
+    for currency in order:
+        df = cached_data[currency]
 
-    # evaluate each strategy on a list of currencies
-    for currency in currencies:
+        # bitsets of when to buy/sell, counted without unpacking them
+        buy_bits = eval_bits(buy_tree, df)
+        sell_bits = eval_bits(sell_tree, df)
 
-        # all_returns as a list
-        all_returns = []
+        num_trades = bitset.popcount(buy_bits) + bitset.popcount(sell_bits)
+        if num_trades < MIN_TRADES:
+            _reject(currency)
+            return dict(PENALTY_RESULT)
 
-        # initial balance and position
-        current_balance = balance
-        current_position = position
+        signals[currency] = (buy_bits, sell_bits, num_trades)
 
-        # Price data for each currency and drops the first CANDLE_CUTOFF rows
+    # Stage 2: backtest each currency, rejecting as early as possible
+    per_currency = {}
+    for currency in order:
         df = cached_data[currency]
-
-        # pd.Series of when to buy/sell
-        buy_signal = eval_tree(buy_tree, df)
-        sell_signal = eval_tree(sell_tree, df)
-
-        num_trades = buy_signal.sum() + sell_signal.sum()
-
-        # convert to numpy arrays for speed
         closes = df['close'].values
-        buy_signal_arr = buy_signal.values
-        sell_signal_arr = sell_signal.values
-
-        prev_equity = None
-        # equity_arr as a list
-        equity_arr = []
-
-        for i in range(len(buy_signal_arr)):
-            price = closes[i]
-
-            if buy_signal_arr[i] and current_balance > 0:
-                cost = current_balance * buy_prop
-                coins = (cost / price) * (1 - fee)
-                current_position += coins
-                current_balance -= cost
-            elif sell_signal_arr[i] and current_position > 0:
-                revenue = (current_position * price) * sell_prop * (1 - fee)
-                current_balance += revenue
-                current_position *= (1 - sell_prop)
-
-            equity = current_balance + (current_position * price)
-            equity_arr.append(equity)
-            if prev_equity is not None and prev_equity > 0:
-                rt = (equity - prev_equity) / prev_equity
-                all_returns.append(rt)
-
-            prev_equity = equity
-
-        # Penalize too few trades
-        if num_trades < 15:
-            return {
-                    "avg_sharpe": -1e6,
-                    "max_drawdown": -1e6,
-                    "avg_percent_return": -1e6,
-                    "avg_num_trades": -1e6
-                }
-
-        # convert equity_arr to numpy array for vector math
-        equity_arr = np.array(equity_arr)
-        drawdowns = (equity_arr / np.maximum.accumulate(equity_arr) - 1) * 100
-        max_drawdown = drawdowns.min()
+        buy_bits, sell_bits, num_trades = signals[currency]
+        buy_signal_arr = bitset.unpack(buy_bits, len(closes))
+        sell_signal_arr = bitset.unpack(sell_bits, len(closes))
 
-        percent_return = (((current_balance + (current_position * float(closes[-1]))) - balance) / balance) * 100
+        trade_indices, balances, positions = simulate_trades(
+            closes, buy_signal_arr, sell_signal_arr, buy_prop, sell_prop, balance, position, fee
+        )
+        current_balance = balances[-1] if balances else balance
+        current_position = positions[-1] if positions else position
 
-        # Penalize negative returns
+        # Penalize negative returns, known before building the equity curve
+        percent_return = (((current_balance + (current_position * float(closes[-1]))) - balance) / balance) * 100
         if percent_return < 0:
-            return {
-                    "avg_sharpe": -1e6,
-                    "max_drawdown": -1e6,
-                    "avg_percent_return": -1e6,
-                    "avg_num_trades": -1e6
-                }
-        
-        # Penalize excessive drawdown
-        if max_drawdown < -50.0:
-            return {
-                    "avg_sharpe": -1e6,
-                    "max_drawdown": -1e6,
-                    "avg_percent_return": -1e6,
-                    "avg_num_trades": -1e6
-                }
-
-        # convert all_returns to numpy array for math
-        all_returns = np.array(all_returns)
-
-        rf_per_period = risk_free_annual / periods_per_year
+            _reject(currency)
+            return dict(PENALTY_RESULT)
+
+        # Penalize excessive drawdown, the equity curve is abandoned once it breaches the limit
+        equity_arr, max_drawdown = equity_within_drawdown(
+            closes, trade_indices, balances, positions, balance, position, MAX_DRAWDOWN, DRAWDOWN_CHUNK
+        )
+        if equity_arr is None:
+            _reject(currency)
+            return dict(PENALTY_RESULT)
+
+        # candle-to-candle returns of the equity curve
+        all_returns = period_returns(equity_arr)
+
+        # gaps make some returns span several candles, annualize by the bars actually observed
+        currency_periods = series_periods_per_year(df, periods_per_year)
+        rf_per_period = risk_free_annual / currency_periods
         excess_returns = all_returns - rf_per_period
 
         mean_rt = np.mean(excess_returns)
@@ -224,33 +237,197 @@ def evaluate_strategy_sharpe(
 
         # Penalize zero standard deviation
         if std_rt == 0:
-            return {
-                    "avg_sharpe": -1e6,
-                    "max_drawdown": -1e6,
-                    "avg_percent_return": -1e6,
-                    "avg_num_trades": -1e6
-                }
-        
+            _reject(currency)
+            return dict(PENALTY_RESULT)
+
         sharpe_per_period = mean_rt / std_rt
-        sharpe_annualized = sharpe_per_period * np.sqrt(periods_per_year)
+        sharpe_annualized = sharpe_per_period * np.sqrt(currency_periods)
 
-        sharpe_ratios.append(sharpe_annualized)
-        max_drawdowns.append(max_drawdown)
-        percent_returns.append(percent_return)
-        num_trades_list.append(num_trades)
+        per_currency[currency] = (sharpe_annualized, max_drawdown, percent_return, num_trades)
+
+    # aggregate in the order of currencies
+    sharpe_ratios, max_drawdowns, percent_returns, num_trades_list = zip(*(per_currency[currency] for currency in currencies))
+
+    results = {
+        "avg_sharpe": np.mean(sharpe_ratios),
+        "max_drawdown": np.min(max_drawdowns),
+        "avg_percent_return": np.mean(percent_returns),
+        "avg_num_trades": np.mean(num_trades_list)
+    }
+
+    # Penalize low average percent return
+    if results['avg_percent_return'] < MIN_AVG_RETURN:
+        return dict(PENALTY_RESULT)
+
+    return results
+
+# Calculates fitness scores of a whole population of strategies with one batched backtest per currency
+def evaluate_population(
+        cached_data,
+        population,
+        currencies=config.TEST_CURRENCIES,
+        balance=config.BALANCE,
+        position=config.POSITION,
+        fee=config.TAKER_FEE,
+        risk_free_annual=config.RISK_FREE_ANNUAL,
+        periods_per_year=config.PERIODS_PER_YEAR,
+        window=None
+    ) -> list:
+
+    """
+    Batched version of evaluate_strategy_sharpe. For each currency the buy/sell signals of all
+    strategies are stacked into (strategies x candles) matrices and every equity curve is
+    simulated at once. Returns one result dict per strategy, in population order.
+
+    The same staged rejection applies: strategies rejected by a cheaper check or on an earlier
+    currency are dropped from every later batch.
+
+    window, a (start, stop) pair of fractions of each currency's candles, restricts the backtest
+    to that part of the data (see walk_forward). Signals are still computed on the full series,
+    so the indicators are warmed up and the cached signals are shared by every window.
+
+    The results come as a BatchResults list, its stats count the tree nodes of the population
+    and the unique nodes left in the DAG they were compiled into.
+    """
+
+    n_strategies = len(population)
+    buy_props = np.array([float(strategy['buy_proportion']) for strategy in population])
+    sell_props = np.array([float(strategy['sell_proportion']) for strategy in population])
+
+    # strategies rejected on any currency get the penalty result
+    alive = np.ones(n_strategies, dtype=bool)
+    order = rejection_order(currencies)
+
+    # every buy/sell tree in one DAG, shared subtrees are evaluated once per currency
+    program, roots, n_nodes = compile_population(
+        [strategy['buy_tree'] for strategy in population] + [strategy['sell_tree'] for strategy in population]
+    )
+    buy_roots = np.array(roots[:n_strategies], dtype=np.int64)
+    sell_roots = np.array(roots[n_strategies:], dtype=np.int64)
+
+    # Stage 1: penalize too few trades, straight from the signals of the strategies still alive
+    signals = {}
+    for currency in order:
+        rows = np.flatnonzero(alive)
+        df = cached_data[currency]
+        if len(rows) == 0:
+            break
+
+        # (strategies x words) bitsets of when to buy/sell, counted without unpacking them
+        bits = run_roots(program, np.concatenate((buy_roots[rows], sell_roots[rows])).tolist(), df, dataset_id(df))
+        buy_bits = np.array(bits[:len(rows)])
+        sell_bits = np.array(bits[len(rows):])
+        if window is not None:
+            start, stop = window_bounds(len(df), window)
+            buy_bits = bitset.window(buy_bits, len(df), start, stop)
+            sell_bits = bitset.window(sell_bits, len(df), start, stop)
+
+        num_trades = bitset.popcount(buy_bits) + bitset.popcount(sell_bits)
+        enough = num_trades >= MIN_TRADES
+        alive[rows[~enough]] = False
+        _reject(currency, (~enough).sum())
+
+        signals[currency] = (rows[enough], buy_bits[enough], sell_bits[enough], num_trades[enough])
+
+    # per currency results, NaN for strategies that were rejected
+    sharpe_ratios = {currency: np.full(n_strategies, np.nan) for currency in currencies}
+    max_drawdowns = {currency: np.full(n_strategies, np.nan) for currency in currencies}
+    percent_returns = {currency: np.full(n_strategies, np.nan) for currency in currencies}
+    num_trades_list = {currency: np.full(n_strategies, np.nan) for currency in currencies}
+
+    # Stage 2: backtest each currency, rejecting as early as possible
+    for currency in order:
+        if currency not in signals:
+            continue
+        rows, buy_bits, sell_bits, num_trades = signals.pop(currency)
+        keep = alive[rows]
+        if not keep.any():
+            continue
+        rows, num_trades = rows[keep], num_trades[keep]
+
+        df = cached_data[currency]
+        if window is not None:
+            start, stop = window_bounds(len(df), window)
+            df = df.iloc[start:stop]
+        closes = df['close'].values
+
+        # (strategies x candles) matrices of when to buy/sell, only for the strategies still alive
+        buy_matrix = bitset.unpack(buy_bits[keep], len(closes))
+        sell_matrix = bitset.unpack(sell_bits[keep], len(closes))
+
+        balance_hist, position_hist, final_balances, final_positions = simulate_batch_trades(
+            closes, buy_matrix, sell_matrix, buy_props[rows], sell_props[rows], balance, position, fee
+        )
+
+        # Penalize negative returns, known before building the equity curves
+        percent_return = (((final_balances + final_positions * closes[-1]) - balance) / balance) * 100
+        positive = ~(percent_return < 0)
+        alive[rows[~positive]] = False
+        _reject(currency, (~positive).sum())
+        if not positive.any():
+            continue
+        rows, percent_return, num_trades = rows[positive], percent_return[positive], num_trades[positive]
+        candidate_mask = buy_matrix[positive] | sell_matrix[positive]
+
+        # Penalize excessive drawdown, equity curves are abandoned once they breach the limit
+        equity, max_drawdown, breached = batch_equity_within_drawdown(
+            closes, candidate_mask, balance_hist[positive], position_hist[positive], MAX_DRAWDOWN, DRAWDOWN_CHUNK
+        )
+        alive[rows[breached]] = False
+        _reject(currency, breached.sum())
+        if breached.all():
+            continue
+        survived = ~breached
+        rows, equity = rows[survived], equity[survived]
+
+        # candle-to-candle returns, skipping candles that follow zero equity
+        prev_equity = equity[:, :-1]
+        valid = prev_equity > 0
+        currency_periods = series_periods_per_year(df, periods_per_year)
+        rf_per_period = risk_free_annual / currency_periods
+
+        if valid.all():
+            excess_returns = (equity[:, 1:] - prev_equity) / prev_equity - rf_per_period
+            mean_rt = np.mean(excess_returns, axis=1)
+            std_rt = np.std(excess_returns, axis=1, ddof=1)
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                all_returns = np.where(valid, (equity[:, 1:] - prev_equity) / prev_equity, np.nan)
+            excess_returns = all_returns - rf_per_period
+            mean_rt = np.nanmean(excess_returns, axis=1)
+            std_rt = np.nanstd(excess_returns, axis=1, ddof=1)
+
+        # Penalize zero standard deviation
+        alive[rows[std_rt == 0]] = False
+        _reject(currency, (std_rt == 0).sum())
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe_annualized = (mean_rt / std_rt) * np.sqrt(currency_periods)
+
+        sharpe_ratios[currency][rows] = sharpe_annualized
+        max_drawdowns[currency][rows] = max_drawdown[survived]
+        percent_returns[currency][rows] = percent_return[survived]
+        num_trades_list[currency][rows] = num_trades[survived]
+
+    # aggregate in the order of currencies
+    avg_sharpe = np.mean([sharpe_ratios[currency] for currency in currencies], axis=0)
+    min_drawdown = np.min([max_drawdowns[currency] for currency in currencies], axis=0)
+    avg_percent_return = np.mean([percent_returns[currency] for currency in currencies], axis=0)
+    avg_num_trades = np.mean([num_trades_list[currency] for currency in currencies], axis=0)
 
-    results["avg_sharpe"] = np.mean(sharpe_ratios)
-    results["max_drawdown"] = np.min(max_drawdowns)
-    results["avg_percent_return"] = np.mean(percent_returns)
-    results["avg_num_trades"] = np.mean(num_trades_list)
-    
     # Penalize low average percent return
-    if results['avg_percent_return'] < 15:
-        return {
-            "avg_sharpe": -1e6,
-            "max_drawdown": -1e6,
-            "avg_percent_return": -1e6,
-            "avg_num_trades": -1e6
-        }
-
-    return results
\ No newline at end of file
+    alive &= ~(avg_percent_return < MIN_AVG_RETURN)
+
+    results_list = []
+    for j in range(n_strategies):
+        if not alive[j]:
+            results_list.append(dict(PENALTY_RESULT))
+        else:
+            results_list.append({
+                "avg_sharpe": avg_sharpe[j],
+                "max_drawdown": min_drawdown[j],
+                "avg_percent_return": avg_percent_return[j],
+                "avg_num_trades": avg_num_trades[j]
+            })
+
+    return BatchResults(results_list, {"nodes": n_nodes, "unique_nodes": len(program)})
@@ -0,0 +1,184 @@
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import math
+import multiprocessing as mp
+import os
+import time
+import config
+
+# --------------------- PARALLEL EXECUTORS ---------------------
+
+# Runs one (func, batch) task in a worker and returns how long it took along with its results
+def _call(task) -> tuple:
+    func, batch = task
+    start = time.perf_counter()
+    results = func(batch)
+    return time.perf_counter() - start, results
+
+# Picks batch sizes from the measured cost per item
+class AdaptiveChunker:
+
+    '''
+    Keeps an exponential moving average of the seconds per item measured on completed batches and
+    sizes the next batches to take about target_seconds each. Cheap items, such as strategies
+    rejected early by the evaluation, make batches grow, while the batch count never drops below
+    chunks_per_worker per worker so a slow batch cannot leave the other workers idle.
+    '''
+
+    def __init__(
+            self,
+            initial=config.EVAL_BATCH_SIZE,
+            target_seconds=config.CHUNK_TARGET_SECONDS,
+            chunks_per_worker=config.CHUNKS_PER_WORKER,
+            smoothing=0.5
+        ):
+        self.initial = initial
+        self.target_seconds = target_seconds
+        self.chunks_per_worker = chunks_per_worker
+        self.smoothing = smoothing
+        self.cost = None  # seconds per item
+
+    def size(self, n_items, workers) -> int:
+        size = self.initial if self.cost is None else max(1, int(self.target_seconds / max(self.cost, 1e-9)))
+        balanced = math.ceil(n_items / (workers * self.chunks_per_worker))
+        return max(1, min(size, balanced))
+
+    def record(self, n_items, seconds):
+        if n_items == 0:
+            return
+        cost = seconds / n_items
+        self.cost = cost if self.cost is None else self.smoothing * cost + (1 - self.smoothing) * self.cost
+
+class Executor:
+
+    '''
+    Base executor, runs batches one after the other in this process. Subclasses only change how
+    the (func, batch) tasks are mapped. map_batches splits a list of items into adaptive batches,
+    maps func over them and returns the flattened results in item order. The stats attribute of
+    each batch's results, if func returns a list that has one (e.g. eval_strategy.BatchResults),
+    is kept in batch_stats until the next call.
+
+    Each mapped function gets its own chunker, keyed by the function a partial wraps, so the cost
+    measured on walk forward windows does not size the strategy batches of a GA sharing the pool.
+    '''
+
+    name = "serial"
+    chunks_per_worker = config.CHUNKS_PER_WORKER
+
+    def __init__(self, workers=config.EXECUTOR_WORKERS):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunkers = {}
+        self.batch_stats = []
+
+    # Chunker of the tasks of func, created the first time func is mapped
+    def chunker(self, func) -> AdaptiveChunker:
+        key = getattr(func, "func", func)
+        if key not in self.chunkers:
+            self.chunkers[key] = AdaptiveChunker(chunks_per_worker=self.chunks_per_worker)
+        return self.chunkers[key]
+
+    def _map(self, tasks) -> list:
+        return [_call(task) for task in tasks]
+
+    def map_batches(self, func, items) -> list:
+        items = list(items)
+        chunker = self.chunker(func)
+        size = chunker.size(len(items), self.workers)
+        batches = [items[i:i + size] for i in range(0, len(items), size)]
+
+        results = []
+        self.batch_stats = []
+        for batch, (seconds, batch_results) in zip(batches, self._map([(func, batch) for batch in batches])):
+            chunker.record(len(batch), seconds)
+            results.extend(batch_results)
+            self.batch_stats.append(getattr(batch_results, "stats", None))
+        return results
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SerialExecutor(Executor):
+
+    chunks_per_worker = 1  # nothing to balance between workers
+
+    def __init__(self, workers=1):
+        super().__init__(1)
+
+class ThreadExecutor(Executor):
+
+    name = "thread"
+
+    def __init__(self, workers=config.EXECUTOR_WORKERS):
+        super().__init__(workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+
+    def _map(self, tasks) -> list:
+        return list(self._pool.map(_call, tasks))
+
+    def close(self):
+        self._pool.shutdown()
+
+class ProcessExecutor(Executor):
+
+    name = "process"
+
+    def __init__(self, workers=config.EXECUTOR_WORKERS):
+        super().__init__(workers)
+        self._pool = mp.Pool(processes=self.workers)
+
+    def _map(self, tasks) -> list:
+        # tasks are already sized batches, so no further chunking by the pool
+        return self._pool.map(_call, tasks, chunksize=1)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+# Process pool shared by every GA run of this process, closing it only releases the run's handle
+class PersistentExecutor(ProcessExecutor):
+
+    name = "persistent"
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+# Persistent pools by worker count, shut down when the interpreter exits
+_persistent = {}
+
+def _shutdown_persistent():
+    for executor in _persistent.values():
+        executor.shutdown()
+    _persistent.clear()
+
+atexit.register(_shutdown_persistent)
+
+EXECUTORS = {
+    "serial": SerialExecutor,
+    "thread": ThreadExecutor,
+    "process": ProcessExecutor,
+    "persistent": PersistentExecutor,
+}
+
+# Returns an executor of the given kind, the persistent one is created once and then reused
+def make_executor(kind=config.EXECUTOR, workers=config.EXECUTOR_WORKERS) -> Executor:
+    if kind not in EXECUTORS:
+        raise ValueError(f"Unknown executor {kind}, expected one of {sorted(EXECUTORS)}")
+
+    if kind == "persistent":
+        workers = workers or os.cpu_count() or 1
+        if workers not in _persistent:
+            _persistent[workers] = PersistentExecutor(workers)
+        return _persistent[workers]
+
+    return EXECUTORS[kind](workers)
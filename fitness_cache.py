@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import config
+from signal_cache import dataset_id, threshold_key
+from analysis import leaf_parts
+from indicator_cube import GRIDS
+
+# --------------------- FITNESS CACHE ---------------------
+
+# Part of every slice key, bump it whenever a change to the evaluation changes its results so
+# the results cached by the previous evaluator are never reused
+EVALUATOR_VERSION = 1
+
+# Returns a canonical JSON-serializable form of a strategy tree
+def canonical_tree(node):
+
+    '''
+    AND/OR are commutative, associative and idempotent on boolean signals, so nested nodes of the
+    same operator are flattened, duplicate children are dropped and the remaining children are
+    sorted. Thresholds are kept exact, as eval_tree evaluates them. Two trees with the same
+    canonical form always produce the same buy/sell signal.
+    '''
+
+    if isinstance(node, tuple) and len(node) > 0 and isinstance(node[0], str):
+        op = node[0]
+        children = {}
+        for child in _flatten(node, op):
+            canonical = canonical_tree(child)
+            children[json.dumps(canonical, separators=(',', ':'))] = canonical
+
+        if len(children) == 1:
+            return next(iter(children.values()))
+        return [op, [children[k] for k in sorted(children)]]
+
+    func, threshold, variant = leaf_parts(node)
+    leaf = [getattr(func, '__name__', str(func)), threshold_key(threshold)]
+    return leaf + [variant] if variant else leaf
+
+# Yields the operands of a chain of nested nodes that all use the same operator
+def _flatten(node, op):
+    for child in node[1:]:
+        if isinstance(child, tuple) and len(child) > 0 and child[0] == op:
+            yield from _flatten(child, op)
+        else:
+            yield child
+
+# Returns a hash that is identical for strategies that always trade the same way
+def strategy_hash(strategy) -> str:
+    canonical = {
+        "buy_tree": canonical_tree(strategy['buy_tree']),
+        "sell_tree": canonical_tree(strategy['sell_tree']),
+        "buy_proportion": float(strategy['buy_proportion']),
+        "sell_proportion": float(strategy['sell_proportion'])
+    }
+    return hashlib.sha1(json.dumps(canonical, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+# Returns a key for the data slice and backtest parameters a fitness was computed on
+def slice_key(
+        cached_data,
+        currencies=config.TEST_CURRENCIES,
+        balance=config.BALANCE,
+        position=config.POSITION,
+        fee=config.TAKER_FEE,
+        risk_free_annual=config.RISK_FREE_ANNUAL,
+        periods_per_year=config.PERIODS_PER_YEAR,
+        windows=None
+    ) -> str:
+
+    description = {
+        "evaluator": EVALUATOR_VERSION,
+        "datasets": [[currency, dataset_id(cached_data[currency])] for currency in currencies],
+        "params": [balance, position, fee, risk_free_annual, periods_per_year],
+        # the window variant leaves refer to depend on the grid of the indicator cube
+        "grid": GRIDS
+    }
+    # results of a run trained on walk forward windows only hold for those windows
+    if windows is not None:
+        description["windows"] = [list(window) for window in windows]
+    return hashlib.sha1(json.dumps(description, separators=(',', ':')).encode()).hexdigest()
+
+# Cache of evaluation results keyed by data slice and canonical strategy hash
+class FitnessCache:
+
+    def __init__(self, path=None, max_per_slice=config.FITNESS_CACHE_MAX_PER_SLICE):
+        self.path = path
+        self.max_per_slice = max_per_slice
+        self.hits = 0
+        self.misses = 0
+        self._results = {}
+        self._unsaved = {}  # entries not written by save() yet
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._results)
+
+    # Returns the cached result dict of a strategy hash on a data slice, or None on a miss
+    def get(self, data_slice, strategy_key):
+        result = self._results.get(f"{data_slice}:{strategy_key}")
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return dict(result)
+
+    def put(self, data_slice, strategy_key, result):
+        key = f"{data_slice}:{strategy_key}"
+        self._results[key] = self._unsaved[key] = {k: float(v) for k, v in result.items()}
+
+    # Returns the results of every strategy, only calling evaluate_batch on the ones not cached yet
+    def evaluate(self, population, data_slice, evaluate_batch) -> list:
+        keys = [strategy_hash(strategy) for strategy in population]
+
+        # unique uncached strategies, copies within the population are evaluated once
+        missing = {}
+        for key, strategy in zip(keys, population):
+            if key not in missing and f"{data_slice}:{key}" not in self._results:
+                missing[key] = strategy
+
+        if missing:
+            for key, result in zip(missing, evaluate_batch(list(missing.values()))):
+                self.put(data_slice, key, result)
+
+        self.misses += len(missing)
+        self.hits += len(population) - len(missing)
+        return [dict(self._results[f"{data_slice}:{key}"]) for key in keys]
+
+    # Copy of the entries added since the cache was last saved, e.g. for a checkpoint, which
+    # does not need to repeat the entries already in the cache file
+    def unsaved(self) -> dict:
+        return dict(self._unsaved)
+
+    # Adds entries that are not in the cache file, e.g. the unsaved entries of a checkpoint
+    def update(self, entries):
+        self._results.update(entries)
+        self._unsaved.update(entries)
+
+    def load(self, path=None):
+        path = path or self.path
+        try:
+            with open(path, "r") as f:
+                self._results.update(json.load(f))
+        except json.JSONDecodeError:
+            print(f"Fitness cache {path} is corrupted. Starting with an empty cache.")
+
+    # Keeps the max_per_slice results with the highest Sharpe of each data slice, the dropped
+    # strategies are only evaluated again if the GA comes across them again
+    def prune(self):
+        by_slice = {}
+        for key, result in self._results.items():
+            by_slice.setdefault(key.split(":", 1)[0], []).append((result["avg_sharpe"], key))
+
+        for entries in by_slice.values():
+            if len(entries) > self.max_per_slice:
+                entries.sort(reverse=True)
+                for _, key in entries[self.max_per_slice:]:
+                    del self._results[key]
+                    self._unsaved.pop(key, None)
+
+    # Writes the pruned cache to disk atomically so concurrent readers never see a partial file
+    def save(self, path=None):
+        path = path or self.path
+        if path is None:
+            return
+
+        if self.max_per_slice is not None:
+            self.prune()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._results, f)
+        os.replace(tmp_path, path)
+        self._unsaved = {}
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._results),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -1,6 +1,7 @@
 import random
 import config
-from analysis import macd_crossdown, macd_crossup, rsi_overbought, rsi_oversold, stoch_rsi_crossdown, stoch_rsi_crossup, stoch_rsi_overbought, stoch_rsi_oversold, adx_trending, adx_reversal, bollinger_bands_buy, bollinger_bands_sell
+from indicator_cube import GRIDS
+from analysis import LEAF_FAMILIES, macd_crossdown, macd_crossup, rsi_overbought, rsi_oversold, stoch_rsi_crossdown, stoch_rsi_crossup, stoch_rsi_overbought, stoch_rsi_oversold, adx_trending, adx_reversal, bollinger_bands_buy, bollinger_bands_sell
 
 BUY_INDICATORS = [
     macd_crossup, 
@@ -23,6 +24,13 @@ SELL_INDICATORS = [
 # Logical operators
 OPERATORS = ['AND', 'OR']
 
+# Adds a random window variant of the indicator cube to a leaf, default window leaves stay (func, threshold)
+def with_window_variant(func, threshold, rate=config.WINDOW_VARIANT_RATE) -> tuple:
+    variants = len(GRIDS[LEAF_FAMILIES[func.__name__]])
+    if variants > 1 and random.random() < rate:
+        return (func, threshold, random.randrange(1, variants))
+    return (func, threshold)
+
 # Returns a random trading indicator based on buy/sell
 def random_indicator(action, buy_indicators=BUY_INDICATORS, sell_indicators=SELL_INDICATORS) -> tuple:
 
@@ -31,32 +39,24 @@ def random_indicator(action, buy_indicators=BUY_INDICATORS, sell_indicators=SELL
         func = random.choice(buy_indicators)
         threshold = None
 
-        # If the buy indicator has default threshold value that is not None
-        if func.__defaults__ is not None:
-
-            # For each default parameter give it a random value
-            for d in func.__defaults__:
-                if isinstance(d, (int, float)):
-                    # Ensure buy indicators trigger on oversold conditions only
-                    threshold = random.uniform(config.OVERSOLD_LOWER, config.OVERSOLD_UPPER)
+        # If the buy indicator has default threshold value that is not None, give it a random value
+        if func.__defaults__ is not None and isinstance(func.__defaults__[0], (int, float)):
+            # Ensure buy indicators trigger on oversold conditions only
+            threshold = round(random.uniform(config.OVERSOLD_LOWER, config.OVERSOLD_UPPER), config.THRESHOLD_DECIMALS)
 
-        return (func, threshold)
+        return with_window_variant(func, threshold)
 
     elif action == 'sell':
         # Pick random sell indicator
         func = random.choice(sell_indicators)
         threshold = None
 
-        # If the sell indicator has default threshold value that is not None
-        if func.__defaults__ is not None:
-
-            # For each default parameter give it a random value
-            for d in func.__defaults__:
-                if isinstance(d, (int, float)):
-                    # Ensure sell indicators trigger on overbought conditions only
-                    threshold = random.uniform(config.OVERBOUGHT_LOWER, config.OVERBOUGHT_UPPER)
+        # If the sell indicator has default threshold value that is not None, give it a random value
+        if func.__defaults__ is not None and isinstance(func.__defaults__[0], (int, float)):
+            # Ensure sell indicators trigger on overbought conditions only
+            threshold = round(random.uniform(config.OVERBOUGHT_LOWER, config.OVERBOUGHT_UPPER), config.THRESHOLD_DECIMALS)
 
-        return (func, threshold)
+        return with_window_variant(func, threshold)
 
     else:
         print("Invalid action for random_indicator")
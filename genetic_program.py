@@ -1,83 +1,271 @@
-from eval_strategy import evaluate_strategy, evaluate_strategy_sharpe
+from eval_strategy import evaluate_strategy, evaluate_population, BatchResults
+import argparse
 import random
 import numpy as np
-import multiprocessing as mp
 import time
-from generate_strategy import random_strategy, crossover, mutate
+from generate_strategy import random_strategy
+from strategy_arrays import StrategyArrays, rank_order, breed
 import config
 from functools import partial
 from candles import cache_data
-from log_strategies import save_strategy    
+from strategy_repository import open_repository
+from fitness_cache import FitnessCache, slice_key
+from shared_data import SharedDataset, attach
+from executors import make_executor
+from walk_forward import make_folds, aggregate, train_aggregate, evaluate_windows, walk_forward, evaluate_strategy_walk_forward, print_report
+
+# Executor task, only the dataset spec and the strategies are sent to the worker, which attaches
+# the candle data from shared memory the first time it sees the dataset. With windows, each
+# strategy is scored on its results on those walk forward windows, see walk_forward.train_aggregate
+def evaluate_shared(spec, population, windows=None) -> list:
+    if windows is None:
+        return evaluate_population(attach(spec), population)
+
+    # every window compiles the same trees, so any window's dedupe stats describe the batch
+    window_results = evaluate_windows(spec, population, config.TEST_CURRENCIES, windows)
+    return BatchResults([train_aggregate(list(results)) for results in zip(*window_results)], window_results[0].stats)
+
+# Dedupe of the DAGs compiled by the evaluation batches, only the strategies evaluated are counted
+def batch_dedupe(batch_stats) -> dict:
+    nodes = sum(stats["nodes"] for stats in batch_stats)
+    unique_nodes = sum(stats["unique_nodes"] for stats in batch_stats)
+    return {
+        "batches": len(batch_stats),
+        "nodes": nodes,
+        "unique_nodes": unique_nodes,
+        "dedupe_ratio": 1 - unique_nodes / nodes if nodes else 0.0
+    }
+
+# Weighted fitness of evaluation results, higher is better
+def score_results(results_list) -> np.ndarray:
+    sharpes = np.array([result['avg_sharpe'] for result in results_list])
+    returns = np.array([result['avg_percent_return'] for result in results_list]) / 100.0
+    drawdowns = np.array([result['max_drawdown'] for result in results_list]) / 100.0 
+
+    return config.SHARPE_WEIGHT * sharpes + config.RETURN_WEIGHT * returns - config.DRAWDOWN_WEIGHT * np.abs(drawdowns)
+
+# Sorts a population by fitness, best first, and returns it with the sorted fitness scores
+def rank_population(population, fitness_scores) -> tuple:
+    order = rank_order(fitness_scores)
+    return [population[i] for i in order], list(np.asarray(fitness_scores)[order])
+
+# Breeds the next generation of a ranked population in bulk over its array encoding, see strategy_arrays.breed
+def next_generation(population, population_size=config.POPULATION_SIZE, mutation_rate=config.MUTATION_RATE) -> list:
+    return breed(StrategyArrays.from_strategies(population), population_size, mutation_rate).strategies()
 
 def genetic_programming(
         cached_data,
         population_size=config.POPULATION_SIZE, 
         generations=config.GENERATIONS, 
         mutation_rate=config.MUTATION_RATE, 
-        depth=config.DEPTH
-    ) -> dict:
+        depth=config.DEPTH,
+        fitness_cache=None,
+        dataset=None,
+        executor=None,
+        population=None,
+        start_generation=0,
+        checkpoint=None,
+        windows=None
+    ) -> tuple:
+
+    '''
+    Returns the top ten strategies of the last generation and their fitness scores. Workers
+    attach the candle data of dataset (published from cached_data if not given) from shared
+    memory once, so each generation only sends them the strategies to evaluate. Strategies are
+    evaluated on executor, the one configured by config.EXECUTOR if not given.
+
+    A run resumed from a checkpoint.Checkpointer snapshot passes its population and generation
+    as population and start_generation, checkpoint snapshots the run every few generations.
+
+    windows, a list of (start, stop) fractions of each currency's candles, trains on those parts
+    of the data only, e.g. the train windows of a walk forward fold.
+    '''
 
     # List of candidate strategies
-    population = [random_strategy(depth=depth) for _ in range(population_size)]
+    if population is None:
+        population = [random_strategy(depth=depth) for _ in range(population_size)]
+
+    published = dataset is None
+    if published:
+        dataset = SharedDataset(cached_data)
+
+    owns_executor = executor is None
+    if owns_executor:
+        executor = make_executor()
+    evaluate_shared_batch = partial(evaluate_shared, dataset.spec, windows=windows)
 
-    worker = partial(evaluate_strategy_sharpe, cached_data)
+    # keeps the dedupe stats of the batches evaluated by the workers for the generation report
+    batch_stats = []
+    def evaluate_batch(strategies):
+        results = executor.map_batches(evaluate_shared_batch, strategies)
+        batch_stats.extend(stats for stats in executor.batch_stats if stats is not None)
+        return results
 
-    with mp.Pool(processes=mp.cpu_count()//4) as pool:
+    # strategies already scored on this data (elites, copies from crossover) are not re-evaluated
+    if fitness_cache is None:
+        fitness_cache = FitnessCache()
+    data_slice = slice_key(dataset.frames(), windows=windows)
+
+    top_ten_strategies = []
+    top_ten_fitnesses = []
+
+    try:
         # for each generation/iteration, evaluate each strategy and retain top 50%
-        for gen in range(generations):
-            results_list = pool.map(worker, population)
+        for gen in range(start_generation, generations):
+            batch_stats.clear()
+            results_list = fitness_cache.evaluate(population, data_slice, evaluate_batch)
+            population, sorted_fitness = rank_population(population, score_results(results_list))
+
+            top_ten_strategies = population[:10]
+            top_ten_fitnesses = sorted_fitness[:10]
 
-            sharpes = np.array([result['avg_sharpe'] for result in results_list])
-            returns = np.array([result['avg_percent_return'] for result in results_list]) / 100.0
-            drawdowns = np.array([result['max_drawdown'] for result in results_list]) / 100.0 
+            # share of tree nodes the evaluation batches did not have to run, as measured by the workers
+            dedupe = batch_dedupe(batch_stats)
 
-            fitness_scores = config.SHARPE_WEIGHT * sharpes + config.RETURN_WEIGHT * returns - config.DRAWDOWN_WEIGHT * np.abs(drawdowns)
+            print(f"Generation {gen}: Best Fitness = {sorted_fitness[0]}, "
+                  f"Unique Nodes = {dedupe['unique_nodes']}/{dedupe['nodes']} "
+                  f"({dedupe['dedupe_ratio']:.1%} deduped in {dedupe['batches']} evaluation batches)")
 
-            population = [s for _, s in sorted(zip(fitness_scores, population), key=lambda x: x[0], reverse=True)]
-            sorted_fitness = sorted(fitness_scores, reverse=True)
+            population = next_generation(population, population_size, mutation_rate)
 
-            cached_data['top_ten_strategies'] = population[:10]
-            cached_data['top_ten_fitnesses'] = sorted_fitness[:10]
+            if checkpoint is not None:
+                checkpoint.generation_done(gen, generations, population, fitness_cache)
 
-            print(f"Generation {gen}: Best Fitness = {sorted_fitness[0]}")
+    finally:
+        if owns_executor:
+            executor.close()
+        if published:
+            dataset.close()
 
-            parents = population[:population_size // 2]
-            children = []
+    return top_ten_strategies, top_ten_fitnesses
 
-            elite_count = max(1, int(config.ELITE_FRACTION * population_size))
-            elites = population[:elite_count]
-            needed_children = population_size - elite_count
+# Walk forward optimization: evolves a strategy on the train windows of each fold and scores it
+# on the test window of that fold only, so every test result is out of sample
+def evolve_walk_forward(cached_data, folds=None, dataset=None, fitness_cache=None, **ga_params) -> tuple:
 
-            while len(children) < needed_children:
-                p1, p2 = random.sample(parents, 2)
-                c1, c2 = crossover(p1, p2)
-                if random.random() < mutation_rate:
-                    mutate(c1)
-                if random.random() < mutation_rate:
-                    mutate(c2)
-                children.extend([c1, c2])
+    '''
+    Returns the best strategy of each fold and a walk_forward style report (see print_report)
+    of each fold's winner on its own fold, with the test results aggregated over the folds.
+    Runs one GA per fold.
+    '''
 
-            population = elites + children[:needed_children]
+    if folds is None:
+        folds = make_folds()
 
-    return cached_data['top_ten_strategies']
+    published = dataset is None
+    if published:
+        dataset = SharedDataset(cached_data)
+
+    winners, fold_reports = [], []
+    try:
+        for i, fold in enumerate(folds):
+            print(f"Walk forward fold {i}: training on {fold['train']}, testing on {fold['test']}")
+            best_strategies, _ = genetic_programming(cached_data, fitness_cache=fitness_cache, dataset=dataset, windows=fold["train"], **ga_params)
+            winners.append(best_strategies[0])
+
+            report = walk_forward(cached_data, best_strategies[:1], [fold], dataset=dataset)[0]
+            fold_reports.append(dict(report["folds"][0], fold=i))
+    finally:
+        if published:
+            dataset.close()
+
+    return winners, {
+        "folds": fold_reports,
+        "train": aggregate([fold["train"] for fold in fold_reports]),
+        "test": aggregate([fold["test"] for fold in fold_reports])
+    }
 
 
 if __name__ == '__main__':
+    from islands import island_genetic_programming
+    from checkpoint import Checkpointer, load_checkpoint, restore_rng
+
+    parser = argparse.ArgumentParser(description="Evolve trading strategies")
+    parser.add_argument("--islands", type=int, default=config.ISLANDS, help="parallel sub-populations, 1 evolves a single population")
+    parser.add_argument("--resume", action="store_true", help="continue the run saved in the checkpoint file")
+    parser.add_argument("--walk-forward", action="store_true", help="evolve on the train windows of each fold and test each winner out of sample")
+    args = parser.parse_args()
 
     NUM_ITERATIONS = 10
 
-    cached_data = cache_data(currencies=config.TEST_CURRENCIES, candle_cutoff=config.CANDLE_CUTOFF)
+    # candle data published once to shared memory for the workers of every iteration
+    dataset = SharedDataset(cache_data(currencies=config.TEST_CURRENCIES, candle_cutoff=config.CANDLE_CUTOFF))
+    cached_data = dataset.frames()
+
+    # fitness cache shared by all iterations and persisted for future runs
+    fitness_cache = FitnessCache(config.FITNESS_CACHE_FILE)
+    data_slice = slice_key(cached_data)
+
+    # best strategies of every iteration, shared with other GA runs on the same machine
+    repository = open_repository()
+
+    # iteration, generation, population (or islands) and random state where a previous run stopped
+    first_iteration, population, start_generation, island_state = 0, None, 0, None
+    state = load_checkpoint() if args.resume else None
+    if state is not None:
+        first_iteration, population, start_generation = state["iteration"], state["population"], state["generation"]
+        restore_rng(state["rng"])
+        fitness_cache.update(state["fitness_cache"])
+        print(f"Resuming iteration {first_iteration} at generation {start_generation}")
+
+        # the run continues with the population layout it was checkpointed with
+        if state.get("islands") is not None:
+            island_state = {key: state[key] for key in ("generation", "islands", "topology_seed")}
+            args.islands = len(state["islands"])
+        elif population is not None:
+            args.islands = 1
+    checkpoint = Checkpointer()
 
     start = time.perf_counter()
-    for i in range(NUM_ITERATIONS):
-        best_strategies = genetic_programming(cached_data)
-        for i in range(len(best_strategies)):
-            result = evaluate_strategy_sharpe(cached_data, best_strategies[i])
-            save_strategy(cached_data['top_ten_strategies'][i], cached_data['top_ten_fitnesses'][i], result["avg_sharpe"], result["avg_percent_return"], result["max_drawdown"], result["avg_num_trades"], config.TEST_CURRENCIES)
+    for i in range(first_iteration, NUM_ITERATIONS):
+        checkpoint.iteration = i
+        if args.islands > 1:
+            # islands are seeded from the random state, or continue from their checkpointed states
+            seed = random.getrandbits(32) if island_state is None else None
+            best_strategies, best_fitnesses = island_genetic_programming(
+                cached_data, islands=args.islands, dataset=dataset, seed=seed, checkpoint=checkpoint, resume=island_state
+            )
+        else:
+            best_strategies, best_fitnesses = genetic_programming(
+                cached_data, fitness_cache=fitness_cache, dataset=dataset,
+                population=population, start_generation=start_generation, checkpoint=checkpoint
+            )
+        population, start_generation, island_state = None, 0, None
+        results = fitness_cache.evaluate(best_strategies, data_slice, partial(evaluate_population, cached_data))
+        fitness_cache.save()
+        repository.save_many([
+            (strategy, fitness, result["avg_sharpe"], result["avg_percent_return"], result["max_drawdown"], result["avg_num_trades"])
+            for strategy, fitness, result in zip(best_strategies, best_fitnesses, results)
+        ], config.TEST_CURRENCIES)
+
+        # the next iteration starts from a new random population
+        if i + 1 < NUM_ITERATIONS:
+            checkpoint.iteration = i + 1
+            checkpoint.save(0, None, fitness_cache)
 
     end = time.perf_counter()
 
-    print("Best Strategy:", cached_data['top_ten_strategies'][0])
-    print("Final fitness score after backtest:", cached_data['top_ten_fitnesses'][0])
-    print(f"Final percent return after backtest: {evaluate_strategy(cached_data, cached_data['top_ten_strategies'][0])}%")
-    print(f"Total time for {config.GENERATIONS * NUM_ITERATIONS} generations with {config.POPULATION_SIZE} population size and {config.DEPTH} depth with {len(config.TEST_CURRENCIES)} currencies: {end - start} seconds")
\ No newline at end of file
+    # the run is complete, a later --resume starts a new one
+    checkpoint.close()
+    checkpoint.remove()
+
+    print("Best Strategy:", best_strategies[0])
+    print("Final fitness score after backtest:", best_fitnesses[0])
+    print(f"Final percent return after backtest: {evaluate_strategy(cached_data, best_strategies[0])}%")
+
+    # fold by fold consistency of the best strategy. It was trained on the full window above, so
+    # these results are in sample, --walk-forward gives the out of sample results
+    print("In sample walk forward folds of the best strategy:")
+    print_report(evaluate_strategy_walk_forward(cached_data, best_strategies[0], dataset=dataset))
+
+    if args.walk_forward:
+        print("Walk forward optimization, each fold's winner tested out of sample:")
+        _, report = evolve_walk_forward(cached_data, dataset=dataset, fitness_cache=fitness_cache)
+        fitness_cache.save()
+        print_report(report)
+
+    print(f"Total time for {config.GENERATIONS * NUM_ITERATIONS} generations with {config.POPULATION_SIZE} population size and {config.DEPTH} depth with {len(config.TEST_CURRENCIES)} currencies: {end - start} seconds")
+
+    repository.close()
+    cached_data = None
+    dataset.close()
@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import config
+from candle_store import ColumnStore, open_store
+from indicator_engine import compute_indicators, FAMILY_COLUMNS
+
+# --------------------- INDICATOR WINDOW CUBE ---------------------
+
+GRID_FILE = "grid.json"
+
+# Engine windows of every variant of each indicator family, variant 0 is the one of the candle store
+GRIDS = {
+    'rsi': [{'rsi': window} for window in config.RSI_WINDOWS],
+    'macd': [{'macd': tuple(windows)} for windows in config.MACD_WINDOWS],
+    'adx': [{'adx': window} for window in config.ADX_WINDOWS],
+    'bb': [{'bb': tuple(windows)} for windows in config.BB_WINDOWS],
+}
+
+# Column of an indicator computed with a window variant, e.g. rsi@2. Variant 0 is the plain column
+def variant_column(name, variant=0) -> str:
+    return name if not variant else f"{name}@{variant}"
+
+# Every column held by the cube, the variants other than 0 of each indicator column
+def cube_columns() -> list:
+    return [
+        variant_column(name, variant)
+        for family, grid in GRIDS.items()
+        for variant in range(1, len(grid))
+        for name in FAMILY_COLUMNS[family]
+    ]
+
+# Returns the cube directory of a candle series, e.g. data/eth_usd_1h.csv -> data/eth_usd_1h.cube
+def cube_path(data_file) -> str:
+    return os.path.splitext(data_file)[0] + ".cube"
+
+# Computes the variant columns of the cube from the candle highs, lows and closes
+def compute_cube(high, low, close) -> dict:
+    cube = {}
+    for family, grid in GRIDS.items():
+        for variant in range(1, len(grid)):
+            columns, _ = compute_indicators(high, low, close, windows=grid[variant], families=(family,))
+            for name in FAMILY_COLUMNS[family]:
+                cube[variant_column(name, variant)] = columns[name]
+    return cube
+
+# Whether the cube holds the current grid for exactly the rows of the candle store
+def _is_current(cube, store, timestamps) -> bool:
+    if not cube.exists() or len(cube) != len(store):
+        return False
+
+    grid_file = os.path.join(cube.path, GRID_FILE)
+    if not os.path.exists(grid_file):
+        return False
+    with open(grid_file, "r") as f:
+        if json.load(f) != json.loads(json.dumps(GRIDS)):
+            return False
+
+    cube_timestamps = cube.load(['timestamp'])['timestamp']
+    return cube_timestamps[0] == timestamps[0] and cube_timestamps[-1] == timestamps[-1]
+
+# Computes the cube of a candle series and stores it next to its candle store
+def build_cube(data_file=config.CSV_FILE) -> ColumnStore:
+
+    '''
+    The cube holds one column per indicator and window variant, aligned row for row with the
+    candle store (same timestamps). Variants with longer windows than the default start with NaN
+    rows where their warm-up reaches past the first stored candle, and NaN never fires a signal.
+    '''
+
+    store = open_store(data_file)
+    raw = store.load(['timestamp', 'high', 'low', 'close'])
+    cube = ColumnStore(cube_path(data_file))
+    cube.write({'timestamp': raw['timestamp'], **compute_cube(raw['high'], raw['low'], raw['close'])})
+
+    with open(os.path.join(cube.path, GRID_FILE), "w") as f:
+        json.dump(GRIDS, f)
+    return cube
+
+# Memory maps the cube columns of a candle series, rebuilding the cube first if it is stale
+def load_cube(data_file=config.CSV_FILE) -> dict:
+
+    '''
+    The cube is stale when the candle store gained or lost rows since it was built, or when the
+    grid in config changed. Returns an empty dict for a series without candles.
+    '''
+
+    store = open_store(data_file)
+    if len(store) == 0:
+        return {}
+
+    cube = ColumnStore(cube_path(data_file))
+    if not _is_current(cube, store, store.load(['timestamp'])['timestamp']):
+        cube = build_cube(data_file)
+
+    return cube.load(cube_columns())
+
+# Adds the cube columns of its series to a DataFrame of the whole candle store
+def with_cube(df, data_file=config.CSV_FILE) -> pd.DataFrame:
+
+    '''
+    The variant leaves of random strategies need every cube column, so when the stored cube does
+    not match df (e.g. the live loop appended candles since df was loaded) the variants of df's
+    own candles are computed in memory instead.
+    '''
+
+    if len(df) == 0:
+        return df
+
+    cube = load_cube(data_file)
+    if not cube or len(next(iter(cube.values()))) != len(df):
+        print(f"Warning: indicator cube of {data_file} does not match its candles, computing their window variants")
+        cube = compute_cube(*(df[name].to_numpy(dtype=np.float64) for name in ('high', 'low', 'close')))
+    return pd.concat([df, pd.DataFrame(cube, index=df.index)], axis=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the indicator window cube of candle series")
+    parser.add_argument("symbols", nargs="*", default=config.TEST_CURRENCIES)
+    args = parser.parse_args()
+
+    for symbol in args.symbols:
+        data_file = f"data/{symbol}_usd_{config.TIMEFRAME}.csv"
+        start = time.perf_counter()
+        cube = build_cube(data_file)
+        print(f"{symbol}: {len(cube.columns)} columns x {len(cube)} candles in {time.perf_counter() - start:.2f} s")
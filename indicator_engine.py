@@ -0,0 +1,435 @@
+import json
+import os
+import numpy as np
+from candle_store import open_store
+
+# --------------------- VECTORIZED INDICATOR ENGINE ---------------------
+
+# Same windows as the ta calls analysis.calculate_indicators used to make
+RSI_WINDOW = 14
+STOCH_SMOOTH = 3
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGN = 9
+ADX_WINDOW = 14
+BB_WINDOW = 20
+BB_DEV = 2
+
+INDICATOR_COLUMNS = [
+    'rsi', 'stoch_rsi_k', 'stoch_rsi_d', 'macd', 'macd_signal', 'adx', '+di', '-di', 'adx_slope',
+    'bb_middle', 'bb_upper', 'bb_lower'
+]
+
+# Candles before every indicator has left its warm-up, a state is only continued after this many
+WARM_UP = 2 * ADX_WINDOW + MACD_SLOW + MACD_SIGN
+
+DEFAULT_WINDOWS = {
+    'rsi': RSI_WINDOW,
+    'stoch_smooth': STOCH_SMOOTH,
+    'macd': (MACD_FAST, MACD_SLOW, MACD_SIGN),
+    'adx': ADX_WINDOW,
+    'bb': (BB_WINDOW, BB_DEV),
+}
+
+# Indicator families and the columns each one computes
+FAMILY_COLUMNS = {
+    'rsi': ['rsi', 'stoch_rsi_k', 'stoch_rsi_d'],
+    'macd': ['macd', 'macd_signal'],
+    'adx': ['adx', '+di', '-di', 'adx_slope'],
+    'bb': ['bb_middle', 'bb_upper', 'bb_lower'],
+}
+FAMILIES = tuple(FAMILY_COLUMNS)
+
+BLOCK = 64  # candles per block of the linear recurrences
+
+STATE_FILE = "indicator_state.json"
+
+# Solves y[t] = decay * y[t - 1] + b[t] along the last axis of a (rows x candles) array
+def _recurrence(b, decay, carry=None) -> np.ndarray:
+
+    '''
+    Every block of BLOCK candles is solved at once with a matrix product against the decay
+    powers, then the value carried into each block is itself a recurrence over the blocks, solved
+    the same way. carry is y[-1] of every row, 0 if not given. NaN inputs count as 0.
+    '''
+
+    b = np.where(np.isnan(b), 0.0, b)
+    rows, n = b.shape
+    carry = np.zeros(rows) if carry is None else np.asarray(carry, dtype=np.float64)
+    if n == 0:
+        return b
+
+    n_blocks = -(-n // BLOCK)
+    blocks = np.zeros((rows, n_blocks * BLOCK))
+    blocks[:, :n] = b
+
+    # kernel[j, k] = decay ** (j - k) for k <= j, one 2D product for the blocks of every row
+    lag = np.arange(BLOCK)[:, None] - np.arange(BLOCK)[None, :]
+    kernel = np.where(lag >= 0, decay ** np.maximum(lag, 0), 0.0)
+    local = (blocks.reshape(-1, BLOCK) @ kernel.T).reshape(rows, n_blocks, BLOCK)
+
+    # y at the end of every block but the last, i.e. the value carried into the next block
+    incoming = carry[:, None]
+    if n_blocks > 1:
+        ends = _recurrence(local[:, :-1, -1], decay ** BLOCK, carry)
+        incoming = np.concatenate((incoming, ends), axis=1)
+
+    y = local + incoming[..., None] * decay ** np.arange(1, BLOCK + 1)
+    return y.reshape(rows, -1)[:, :n]
+
+# pandas .ewm(com=com, min_periods=min_periods, adjust=False).mean() of values starting at column start
+def _ewm(x, com, min_periods, start=0, carry=None) -> np.ndarray:
+    alpha = 1. / (1. + com)
+    b = alpha * x
+    if carry is None:
+        if start >= x.shape[1]:
+            return np.full(x.shape, np.nan)
+        b[:, :start] = 0.0
+        b[:, start] = x[:, start]
+    y = _recurrence(b, 1. - alpha, carry)
+    if carry is None:
+        y[:, :start + min_periods - 1] = np.nan
+    return y
+
+# Rolling ufunc reduction (np.minimum, np.maximum, np.add) over full windows along the last axis,
+# NaN until the first window is full. Shifted slices keep every pass contiguous.
+def _rolling(x, window, reduce) -> np.ndarray:
+    n = x.shape[-1]
+    out = np.full(x.shape, np.nan)
+    if n >= window:
+        acc = out[:, window - 1:]
+        acc[...] = x[:, window - 1:]
+        for k in range(1, window):
+            reduce(acc, x[:, window - 1 - k:n - k], out=acc)
+    return out
+
+# Rolling mean and population standard deviation over full windows along the last axis
+def _rolling_mean_std(x, window) -> tuple:
+    mean = _rolling(x, window, np.add) / window
+    n = x.shape[-1]
+    var = np.full(x.shape, np.nan)
+    if n >= window:
+        acc = var[:, window - 1:]
+        acc[...] = 0.0
+        for k in range(window):
+            acc += (x[:, window - 1 - k:n - k] - mean[:, window - 1:]) ** 2
+        acc /= window
+    return mean, np.sqrt(var)
+
+# Values of x shifted one candle later, with first in the first column
+def _previous(x, first) -> np.ndarray:
+    out = np.empty_like(x)
+    out[:, 0] = first
+    out[:, 1:] = x[:, :-1]
+    return out
+
+# Computes every indicator column for (symbols x candles) arrays of highs, lows and closes
+def compute_indicators(high, low, close, lengths=None, state=None, windows=None, families=FAMILIES) -> tuple:
+
+    '''
+    Returns (columns, state). Each column is an array shaped like close with the same values as
+    the ta calls of analysis.calculate_indicators, up to floating point rounding. Intermediates
+    are shared between indicators: one RSI feeds the StochRSI, one true range and one pair of
+    directional movements feed ADX, +DI and -DI.
+
+    Rows are series of several symbols aligned on their first candle, lengths gives the number
+    of candles of each row (the rest is padding and comes back as NaN). 1D inputs give 1D columns.
+
+    state is what a previous call returned for the candles right before these ones: the running
+    EMA and Wilder sums and the last few RSI and close values. Continuing a state gives the tail
+    of the full computation without going over the earlier candles again.
+
+    windows overrides entries of DEFAULT_WINDOWS and families restricts the computation to some
+    of the indicator families, e.g. for the window variants of indicator_cube.
+    '''
+
+    windows = dict(DEFAULT_WINDOWS, **(windows or {}))
+    one_dimensional = np.ndim(close) == 1
+    high, low, close = (np.atleast_2d(np.asarray(values, dtype=np.float64)) for values in (high, low, close))
+    rows, n = close.shape
+    lengths = np.full(rows, n) if lengths is None else np.asarray(lengths, dtype=np.int64)
+    valid = np.arange(n)[None, :] < lengths[:, None]
+    close = np.where(valid, close, np.nan)
+
+    if state is None:
+        carry = {}
+        prev_close = _previous(close, np.nan)
+        prev_high = _previous(high, np.nan)
+        prev_low = _previous(low, np.nan)
+    else:
+        carry = {name: np.asarray(values, dtype=np.float64) for name, values in state.items()}
+        prev_close = _previous(close, carry['close'])
+        prev_high = _previous(high, carry['high'])
+        prev_low = _previous(low, carry['low'])
+
+    # state after the last candle of every row
+    last = lengths - 1
+    row = np.arange(rows)
+    new_state = {
+        'candles': lengths + carry.get('candles', 0),
+        'close': close[row, last], 'high': high[row, last], 'low': low[row, last],
+    }
+    columns = {}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        if 'rsi' in families:
+            # RSI, Wilder smoothing of gains and losses
+            w = windows['rsi']
+            smooth = windows['stoch_smooth']
+            diff = close - prev_close
+            up = np.where(diff > 0, diff, 0.0)
+            down = np.where(diff < 0, -diff, 0.0)
+            rsi_com = (1 - 1 / w) / (1 / w)
+            emaup = _ewm(up, rsi_com, w, carry=carry.get('rsi_up'))
+            emadn = _ewm(down, rsi_com, w, carry=carry.get('rsi_down'))
+            rsi = np.where(emadn == 0, 100.0, 100 - (100 / (1 + emaup / emadn)))
+
+            # StochRSI over the RSI values, continued from the RSI values of the previous candles
+            rsi_context = carry.get('rsi_context', np.empty((rows, 0)))
+            rsi_ext = np.concatenate((rsi_context, rsi), axis=1)
+            lowest = _rolling(rsi_ext, w, np.minimum)
+            highest = _rolling(rsi_ext, w, np.maximum)
+            stoch = (rsi_ext - lowest) / (highest - lowest)
+            stoch_k = _rolling(stoch, smooth, np.add) / smooth
+            stoch_d = _rolling(stoch_k, smooth, np.add) / smooth
+            skip = rsi_context.shape[1]
+
+            columns['rsi'] = rsi
+            columns['stoch_rsi_k'] = stoch_k[:, skip:] * 100
+            columns['stoch_rsi_d'] = stoch_d[:, skip:] * 100
+            positions = lengths[:, None] + np.arange(-((w - 1) + 2 * (smooth - 1)), 0)[None, :] + skip
+            new_state.update({
+                'rsi_up': emaup[row, last], 'rsi_down': emadn[row, last],
+                'rsi_context': rsi_ext[row[:, None], positions],
+            })
+
+        if 'macd' in families:
+            # MACD from two EMAs of the close and an EMA of the MACD line
+            fast, slow, sign = windows['macd']
+            ema_fast = _ewm(close, (fast - 1) / 2., fast, carry=carry.get('ema_fast'))
+            ema_slow = _ewm(close, (slow - 1) / 2., slow, carry=carry.get('ema_slow'))
+            macd = ema_fast - ema_slow
+            macd_signal = _ewm(macd, (sign - 1) / 2., sign, start=max(fast, slow) - 1, carry=carry.get('ema_signal'))
+
+            columns['macd'] = macd
+            columns['macd_signal'] = macd_signal
+            new_state.update({
+                'ema_fast': ema_fast[row, last], 'ema_slow': ema_slow[row, last], 'ema_signal': macd_signal[row, last],
+            })
+
+        if 'adx' in families:
+            # ADX, +DI, -DI from one true range and one pair of directional movements
+            w = windows['adx']
+            true_range = np.maximum(high, prev_close) - np.minimum(low, prev_close)
+            diff_up = high - prev_high
+            diff_down = prev_low - low
+            pos = np.where((diff_up > diff_down) & (diff_up > 0), diff_up, 0.0)
+            neg = np.where((diff_down > diff_up) & (diff_down > 0), diff_down, 0.0)
+
+            decay = 1 - 1 / float(w)
+            if state is None:
+                # Wilder sums seeded with the plain sum of the first window, 0 before it
+                seeds = []
+                for values in (true_range, pos, neg):
+                    b = values.copy()
+                    b[:, :w] = 0.0
+                    if n > w:
+                        b[:, w] = values[:, 1:w + 1].sum(axis=1)
+                    seeds.append(_recurrence(b, decay))
+                trs, dip, din = seeds
+            else:
+                trs = _recurrence(true_range, decay, carry['trs'])
+                dip = _recurrence(pos, decay, carry['dip'])
+                din = _recurrence(neg, decay, carry['din'])
+
+            dip_pct = np.where(trs != 0, 100 * (dip / trs), 0.0)
+            din_pct = np.where(trs != 0, 100 * (din / trs), 0.0)
+            dx = np.where(dip_pct + din_pct != 0, 100 * np.abs((dip_pct - din_pct) / (dip_pct + din_pct)), 0.0)
+
+            if state is None:
+                # ADX seeded with the mean DX of its first window, 0 before it
+                b = dx / float(w)
+                b[:, :2 * w - 1] = 0.0
+                if n > 2 * w - 1:
+                    b[:, 2 * w - 1] = dx[:, w:2 * w].mean(axis=1)
+                adx = _recurrence(b, (w - 1) / float(w))
+                plus_di = np.where(np.arange(n) > w, dip_pct, 0.0)
+                minus_di = np.where(np.arange(n) > w, din_pct, 0.0)
+                prev_adx = _previous(adx, np.nan)
+            else:
+                adx = _recurrence(dx / float(w), (w - 1) / float(w), carry['adx'])
+                plus_di, minus_di = dip_pct, din_pct
+                prev_adx = _previous(adx, carry['adx'])
+
+            columns['adx'] = adx
+            columns['+di'] = plus_di
+            columns['-di'] = minus_di
+            columns['adx_slope'] = (adx - prev_adx) / 60
+            new_state.update({'trs': trs[row, last], 'dip': dip[row, last], 'din': din[row, last], 'adx': adx[row, last]})
+
+        if 'bb' in families:
+            # Bollinger bands, continued from the closes of the previous candles
+            w, dev = windows['bb']
+            close_context = carry.get('close_context', np.empty((rows, 0)))
+            close_ext = np.concatenate((close_context, close), axis=1)
+            bb_middle, bb_std = _rolling_mean_std(close_ext, w)
+            skip = close_context.shape[1]
+
+            columns['bb_middle'] = bb_middle[:, skip:]
+            columns['bb_upper'] = (bb_middle + dev * bb_std)[:, skip:]
+            columns['bb_lower'] = (bb_middle - dev * bb_std)[:, skip:]
+            positions = lengths[:, None] + np.arange(-(w - 1), 0)[None, :] + skip
+            new_state['close_context'] = close_ext[row[:, None], positions]
+
+    for name, values in columns.items():
+        values = np.where(valid, values, np.nan)
+        columns[name] = values[0] if one_dimensional else values
+
+    return columns, new_state
+
+# --------------------- INDICATOR STATE FILES ---------------------
+
+def _state_file(store) -> str:
+    return os.path.join(store.path, STATE_FILE)
+
+# Saves the engine state computed up to the candle at timestamp, if that is the last candle of the store
+def save_state(store, state, timestamp, row=0):
+    candles = store.load(['timestamp', 'close'])
+    too_short = np.asarray(state['candles'])[row] < WARM_UP
+    if too_short or len(candles['timestamp']) == 0 or int(candles['timestamp'][-1]) != int(timestamp):
+        if os.path.exists(_state_file(store)):
+            os.remove(_state_file(store))
+        return
+
+    entry = {
+        "length": len(store),
+        "timestamp": int(candles['timestamp'][-1]),
+        "close": float(candles['close'][-1]),
+        "state": {name: np.asarray(values)[row].tolist() for name, values in state.items()}
+    }
+    tmp_file = _state_file(store) + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp_file, _state_file(store))
+
+# Returns (length, state) of the saved state if it still describes the store, otherwise None
+def load_state(store):
+    if not os.path.exists(_state_file(store)):
+        return None
+    with open(_state_file(store), "r") as f:
+        entry = json.load(f)
+
+    length = entry["length"]
+    if length > len(store) or not set(INDICATOR_COLUMNS) <= set(store.columns):
+        return None
+
+    # the candle the state was saved after must still be the same row of the store
+    candles = store.load(['timestamp', 'close'])
+    if int(candles['timestamp'][length - 1]) != entry["timestamp"] or float(candles['close'][length - 1]) != entry["close"]:
+        return None
+
+    state = {name: np.atleast_2d(np.asarray(values, dtype=np.float64)) for name, values in entry["state"].items()}
+    state = {name: values[0] if name not in ('rsi_context', 'close_context') else values for name, values in state.items()}
+    return length, state
+
+# Computes the indicators of the candles appended to a store since its state was saved
+def update_tail(data_file) -> bool:
+
+    '''
+    Only the new rows are computed, continuing the saved state, and only their indicator values
+    are written back. Returns False when there is no usable state (new store, rewritten history),
+    in which case the whole store has to be recalculated.
+    '''
+
+    store = open_store(data_file)
+    saved = load_state(store)
+    if saved is None:
+        return False
+
+    length, state = saved
+    if length == len(store):
+        return True
+
+    tail = {name: np.array(values[length:]) for name, values in store.load(['timestamp', 'high', 'low', 'close']).items()}
+    columns, new_state = compute_indicators(tail['high'][None, :], tail['low'][None, :], tail['close'][None, :], state=state)
+    store.overwrite(length, {name: values[0] for name, values in columns.items()})
+    save_state(store, new_state, tail['timestamp'][-1])
+    return True
+
+# Recalculates several stores in one call, rows aligned on their first candle. The engine already
+# vectorizes along the candles, so for long series this is no faster than one call per store (the
+# padding of the shorter rows is computed too), it only saves the per call overhead of short ones
+def compute_batch(frames) -> list:
+    n = max(len(df) for df in frames)
+    arrays = {name: np.full((len(frames), n), np.nan) for name in ('high', 'low', 'close')}
+    for i, df in enumerate(frames):
+        for name in arrays:
+            arrays[name][i, :len(df)] = df[name].to_numpy(dtype=np.float64)
+
+    lengths = [len(df) for df in frames]
+    columns, state = compute_indicators(arrays['high'], arrays['low'], arrays['close'], lengths=lengths)
+    return [({name: values[i, :lengths[i]] for name, values in columns.items()}, state) for i in range(len(frames))]
+
+
+if __name__ == "__main__":
+    import time
+    import pandas as pd
+    import ta
+
+    # ta version of the indicators, as analysis.calculate_indicators computed them before
+    def ta_indicators(df) -> dict:
+        stochrsi = ta.momentum.StochRSIIndicator(close=df['close'], window=RSI_WINDOW, smooth1=STOCH_SMOOTH, smooth2=STOCH_SMOOTH)
+        macd = ta.trend.MACD(df['close'], window_slow=MACD_SLOW, window_fast=MACD_FAST, window_sign=MACD_SIGN)
+        adx = ta.trend.adx(df['high'], df['low'], df['close'], window=ADX_WINDOW)
+        bb = ta.volatility.BollingerBands(close=df['close'], window=BB_WINDOW, window_dev=BB_DEV)
+        return {
+            'rsi': ta.momentum.rsi(df['close'], window=RSI_WINDOW),
+            'stoch_rsi_k': stochrsi.stochrsi_k() * 100,
+            'stoch_rsi_d': stochrsi.stochrsi_d() * 100,
+            'macd': macd.macd(),
+            'macd_signal': macd.macd_signal(),
+            'adx': adx,
+            '+di': ta.trend.adx_pos(df['high'], df['low'], df['close'], window=ADX_WINDOW),
+            '-di': ta.trend.adx_neg(df['high'], df['low'], df['close'], window=ADX_WINDOW),
+            'adx_slope': (adx - adx.shift(1)) / 60,
+            'bb_middle': bb.bollinger_mavg(),
+            'bb_upper': bb.bollinger_hband(),
+            'bb_lower': bb.bollinger_lband(),
+        }
+
+    # random walk candles standing in for the stored 1h series
+    def random_candles(n, seed) -> pd.DataFrame:
+        rng = np.random.default_rng(seed)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+        open_ = np.concatenate(([close[0]], close[:-1]))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.003, n)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.003, n)))
+        return pd.DataFrame({'high': high, 'low': low, 'close': close})
+
+    # Parity with ta is checked by tests/test_indicator_engine.py, this only times the engine
+    N_SYMBOLS = 8
+    frames = [random_candles(60000 - 5000 * i, i) for i in range(N_SYMBOLS)]
+
+    start = time.perf_counter()
+    for df in frames:
+        ta_indicators(df)
+    ta_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for df in frames:
+        compute_indicators(df['high'].values, df['low'].values, df['close'].values)
+    engine_seconds = time.perf_counter() - start
+
+    # Tail update after appending one candle
+    df = frames[0]
+    _, state = compute_indicators(df['high'].values[:-1], df['low'].values[:-1], df['close'].values[:-1])
+    start = time.perf_counter()
+    compute_indicators(df['high'].values[-1:], df['low'].values[-1:], df['close'].values[-1:], state=state)
+    tail_seconds = time.perf_counter() - start
+
+    total = sum(len(df) for df in frames)
+    print(f"{N_SYMBOLS} symbols, {total} candles")
+    print(f"  ta:     {ta_seconds:.3f} s")
+    print(f"  engine: {engine_seconds:.3f} s ({ta_seconds / engine_seconds:.1f}x)")
+    print(f"  tail update of one candle: {tail_seconds * 1000:.2f} ms")
@@ -0,0 +1,221 @@
+from functools import partial
+import multiprocessing as mp
+import queue
+import random
+import config
+from eval_strategy import evaluate_population
+from fitness_cache import FitnessCache, slice_key, strategy_hash
+from generate_strategy import random_strategy
+from genetic_program import score_results, rank_population, next_generation
+from checkpoint import rng_state, restore_rng
+from shared_data import SharedDataset, attach
+
+# --------------------- ISLAND MODEL GA ---------------------
+
+TOPOLOGIES = ("ring", "all", "random")
+
+# Islands that island sends its migrants to at the given migration
+def migration_targets(topology, island, n_islands, epoch=0, seed=0) -> list:
+
+    '''
+    ring: every island sends to the next one
+    all: every island sends to every other island
+    random: islands are paired anew at every migration, each island sends to one island and
+    receives from one. The pairing only depends on seed and epoch, so every island computes the
+    same one without talking to the others.
+    '''
+
+    if n_islands < 2:
+        return []
+    if topology == "ring":
+        return [(island + 1) % n_islands]
+    if topology == "all":
+        return [other for other in range(n_islands) if other != island]
+    if topology == "random":
+        rng = random.Random(f"{seed}:{epoch}")
+        targets = list(range(n_islands))
+        while any(target == source for source, target in enumerate(targets)):
+            rng.shuffle(targets)
+        return [targets[island]]
+
+    raise ValueError(f"Unknown migration topology {topology}, expected one of {TOPOLOGIES}")
+
+# Number of islands sending migrants to island at the given migration
+def migration_sources(topology, island, n_islands, epoch=0, seed=0) -> int:
+    return sum(island in migration_targets(topology, other, n_islands, epoch, seed) for other in range(n_islands) if other != island)
+
+# Adds scored migrants to a ranked population, which keeps its size by dropping its worst strategies
+def merge_migrants(population, fitnesses, migrants) -> tuple:
+    # residents stay ahead of migrants of the same fitness
+    merged = list(zip(fitnesses, population)) + [(fitness, strategy) for strategy, fitness in migrants]
+    merged = sorted(merged, key=lambda x: x[0], reverse=True)[:len(population)]
+    return [strategy for _, strategy in merged], [fitness for fitness, _ in merged]
+
+# Worker process of one island, evolves its population and exchanges migrants with the other islands
+def run_island(island, spec, inboxes, results, params):
+
+    '''
+    The island attaches the candle data from shared memory and evaluates its own population in
+    this process with its own fitness cache, so the master only starts the islands and collects
+    their top ten. Every migration_interval generations the island sends its best migrants,
+    with their fitness, to the inboxes of its targets and waits for the migrants of its sources,
+    which take the places of its worst strategies. Fitness is computed on the same data by every
+    island, so the scores of migrants and residents compare directly.
+
+    Right after a migration the islands are in step and no migrants are in flight, so with
+    params["checkpoint"] every island then sends its population and random state to the master,
+    which checkpoints them together. params["resume"] restarts the islands from such a snapshot.
+    '''
+
+    cached_data = attach(spec)
+    fitness_cache = FitnessCache()
+    data_slice = slice_key(cached_data)
+    evaluate_batch = partial(evaluate_population, cached_data)
+
+    n_islands = len(inboxes)
+    population_size = params["population_size"]
+    generations = params["generations"]
+    interval = params["migration_interval"]
+
+    resume = params["resume"]
+    if resume is not None:
+        start_generation = resume["generation"]
+        population = resume["islands"][island]["population"]
+        restore_rng(resume["islands"][island]["rng"])
+    else:
+        random.seed(None if params["seed"] is None else f"{params['seed']}:{island}")
+        start_generation = 0
+        population = [random_strategy(depth=params["depth"]) for _ in range(population_size)]
+
+    for gen in range(start_generation, generations):
+        results_list = fitness_cache.evaluate(population, data_slice, evaluate_batch)
+        population, sorted_fitness = rank_population(population, score_results(results_list))
+        print(f"Island {island} Generation {gen}: Best Fitness = {sorted_fitness[0]}")
+
+        # no migration after the last generation, its population is not evolved any further
+        if gen + 1 == generations:
+            break
+
+        migration = interval and (gen + 1) % interval == 0
+        if migration:
+            epoch = (gen + 1) // interval
+            migrants = list(zip(population[:params["migrants"]], sorted_fitness[:params["migrants"]]))
+            for target in migration_targets(params["topology"], island, n_islands, epoch, params["topology_seed"]):
+                inboxes[target].put(migrants)
+
+            arrivals = []
+            for _ in range(migration_sources(params["topology"], island, n_islands, epoch, params["topology_seed"])):
+                arrivals.extend(inboxes[island].get())
+            population, sorted_fitness = merge_migrants(population, sorted_fitness, arrivals)
+
+        population = next_generation(population, population_size, params["mutation_rate"])
+
+        if migration and params["checkpoint"]:
+            results.put(("state", island, gen + 1, population, rng_state()))
+
+    results.put(("result", island, population[:10], [float(fitness) for fitness in sorted_fitness[:10]]))
+
+# Evolves islands of strategies in parallel processes and returns the top ten of all islands
+def island_genetic_programming(
+        cached_data,
+        islands=config.ISLANDS,
+        population_size=config.ISLAND_POPULATION_SIZE,
+        generations=config.GENERATIONS,
+        mutation_rate=config.MUTATION_RATE,
+        depth=config.DEPTH,
+        migration_interval=config.MIGRATION_INTERVAL,
+        migrants=config.MIGRANTS,
+        topology=config.MIGRATION_TOPOLOGY,
+        dataset=None,
+        seed=None,
+        checkpoint=None,
+        resume=None
+    ) -> tuple:
+
+    '''
+    Same result as genetic_programming: the top ten strategies and their fitness scores, here
+    over the last generation of every island. The candle data of dataset (published from
+    cached_data if not given) is attached by the islands from shared memory. Migrants travel
+    through one local queue per island. seed makes the islands and the random topology
+    reproducible.
+
+    checkpoint, a checkpoint.Checkpointer, snapshots every island at each migration. resume is
+    such a snapshot (its generation, islands and topology_seed) to continue from, the islands
+    then pick up their own populations and random states and seed is not used.
+    '''
+
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"Unknown migration topology {topology}, expected one of {TOPOLOGIES}")
+
+    published = dataset is None
+    if published:
+        dataset = SharedDataset(cached_data)
+
+    params = {
+        "population_size": population_size,
+        "generations": generations,
+        "mutation_rate": mutation_rate,
+        "depth": depth,
+        "migration_interval": migration_interval,
+        "migrants": migrants,
+        "topology": topology,
+        "topology_seed": resume["topology_seed"] if resume is not None else random.random() if seed is None else seed,
+        "seed": seed,
+        "checkpoint": checkpoint is not None,
+        "resume": resume
+    }
+
+    inboxes = [mp.Queue() for _ in range(islands)]
+    results = mp.Queue()
+    workers = [
+        mp.Process(target=run_island, args=(island, dataset.spec, inboxes, results, params), daemon=True)
+        for island in range(islands)
+    ]
+
+    try:
+        for worker in workers:
+            worker.start()
+
+        # results are collected before joining, a worker only exits once its result was read
+        island_results = []
+        states = {}
+        while len(island_results) < islands:
+            try:
+                message = results.get(timeout=1)
+            except queue.Empty:
+                failed = [worker for worker in workers if worker.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f"Island worker exited with code {failed[0].exitcode}")
+                continue
+
+            if message[0] == "result":
+                island_results.append(message[1:])
+                continue
+
+            # islands are checkpointed together once all of them reached the same migration
+            _, island, generation, population, rng = message
+            states.setdefault(generation, {})[island] = {"population": population, "rng": rng}
+            if len(states[generation]) == islands:
+                snapshot = states.pop(generation)
+                checkpoint.save_islands(generation, [snapshot[island] for island in range(islands)], params["topology_seed"])
+
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        if published:
+            dataset.close()
+
+    # best of every island, a strategy that migrated to several islands is counted once
+    ranked = sorted(
+        ((fitness, island, strategy) for island, strategies, fitnesses in island_results for strategy, fitness in zip(strategies, fitnesses)),
+        key=lambda x: (-x[0], x[1])
+    )
+    top_ten = {}
+    for fitness, _, strategy in ranked:
+        top_ten.setdefault(strategy_hash(strategy), (strategy, fitness))
+        if len(top_ten) == 10:
+            break
+    return [strategy for strategy, _ in top_ten.values()], [fitness for _, fitness in top_ten.values()]
@@ -1,100 +1,49 @@
-import pandas as pd
+import asyncio
 import time
-from analysis import calculate_indicators
-from candles import get_main_currencies, update_candles
-from websocket import create_connection
-import json
-from datetime import datetime
+from candle_store import load_candles
+from streaming_indicators import StreamingIndicators
+from candles import get_main_currencies, update_candles, candle_file
+from market_gateway import MarketDataGateway
 import config
 
 get_main_currencies()
 
 # --------------------- WEBSOCKET SCRIPT ---------------------
 
-ws = create_connection("wss://ws-feed.exchange.coinbase.com")
-ws.send(
-    json.dumps(
-        {
-            "type": "subscribe",
-            "product_ids": [config.SYMBOL],
-            "channels": ["ticker"],
-        }
-    )
-)
-
-print("Connected:", ws.connected)
-
-live_candle = {
-    'timestamp': None,
-    'low': 0,
-    'high': 0,
-    'open': 0,
-    'close': 0
-}
-
-# Main loop for live candle
-while True:
-    try:
-        data = json.loads(ws.recv())
-        if data.get("type") == "ticker" and "price" in data:
-            price = float(data["price"])
-        else:
-            continue
-        
-        now = datetime.now()
-
-        # Floor timestamp to nearest 60-minute boundary
-        candle_start = now.replace(minute=(now.minute // 60) * 60, second=0, microsecond=0)
-
-        # If new candle interval, reset live candle
-        if live_candle['timestamp'] != candle_start:
-            live_candle = {
-                'timestamp': candle_start,
-                'low': price,
-                'high': price,
-                'open': price,
-                'close': price
-            }
-        else:
-            live_candle['high'] = max(live_candle['high'], price)
-            live_candle['low'] = min(live_candle['low'], price)
-            live_candle['close'] = price
-
-        df = pd.read_csv(config.CSV_FILE, index_col=0)
-        s = pd.Series(live_candle)
-        df = pd.concat([df, s.to_frame().T], ignore_index=True)
-     
-        indicator_df = calculate_indicators(df=df, modify=False)
-        live_candle['rsi'] = indicator_df['rsi'].iloc[-1].item()
-        live_candle['stoch_rsi_k'] = indicator_df['stoch_rsi_k'].iloc[-1].item()
-        live_candle['stoch_rsi_d'] = indicator_df['stoch_rsi_d'].iloc[-1].item()
-        live_candle['macd'] = indicator_df['macd'].iloc[-1].item()
-        live_candle['macd_signal'] = indicator_df['macd_signal'].iloc[-1].item()
-        live_candle['adx'] = indicator_df['adx'].iloc[-1].item()
-        live_candle['+di'] = indicator_df['+di'].iloc[-1].item()
-        live_candle['-di'] = indicator_df['-di'].iloc[-1].item()
-        live_candle['adx_slope'] = indicator_df['adx_slope'].iloc[-1].item()
-
+async def run_live():
+
+    # Rolling indicator state per symbol warmed up on the closed candles, each tick only costs one step
+    current_candle = int(time.time()) // config.GRANULARITY * config.GRANULARITY
+    indicators = {
+        symbol: StreamingIndicators.from_candles(load_candles(candle_file(symbol)), before=current_candle)
+        for symbol in config.MAIN_SYMBOLS
+    }
+
+    gateway = MarketDataGateway(config.MAIN_SYMBOLS, indicators=indicators)
+    store_updates = set()
+
+    # Stores the exchange's candles of a symbol, then commits the closed ones to its indicators.
+    # Candles built from the ticker are never committed, they can miss trades
+    async def store_and_commit(symbol):
+        data_file = candle_file(symbol)
+        await asyncio.to_thread(update_candles, data_file=data_file, granularity=config.GRANULARITY, symbol=symbol)
+        df = await asyncio.to_thread(load_candles, data_file)
+        gateway.builders[symbol].commit_candles(df)
+
+    # Forgets a finished background update, printing the error it failed with
+    def store_update_done(task):
+        store_updates.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error storing candles: {task.exception()!r}")
+
+    # Main loop for live candles of every symbol
+    async for live_candle in gateway:
         print(live_candle)
 
-        update_candles(data_file=config.CSV_FILE, granularity=config.GRANULARITY, symbol=config.SYMBOL)
-        time.sleep(3)
-    except Exception as e:
-        print("Error:", e)
-        print("Reconnecting...")
-
-        ws = create_connection("wss://ws-feed.exchange.coinbase.com")
-        ws.send(
-            json.dumps(
-                {
-                    "type": "subscribe",
-                    "product_ids": [config.SYMBOL],
-                    "channels": ["ticker"],
-                }
-            )
-        )
-
-        print("Connected:", ws.connected)
-        time.sleep(5)
-        continue
+        # Once a candle has closed, store and commit the exchange's candles in the background
+        if live_candle['closed']:
+            task = asyncio.create_task(store_and_commit(live_candle['symbol']))
+            store_updates.add(task)
+            task.add_done_callback(store_update_done)
 
+asyncio.run(run_live())
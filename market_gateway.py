@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+import websockets
+import config
+
+COINBASE_WS_URL = "wss://ws-feed.exchange.coinbase.com"
+
+# --------------------- MARKET DATA GATEWAY ---------------------
+
+# Returns the exchange time of a ticker message in epoch seconds, falling back to the local clock
+def tick_time(message) -> float:
+    if message.get("time"):
+        return datetime.fromisoformat(message["time"].replace("Z", "+00:00")).timestamp()
+    return time.time()
+
+# Builds the live candle of one symbol from ticker prices
+class CandleBuilder:
+
+    '''
+    Candles built from the ticker are provisional: the builder only sees the trades since it
+    started (or since the last reconnect), so its first candle misses the earlier trades of that
+    interval. Indicator values of built candles are evaluated without touching the rolling state,
+    which only takes the exchange's own candles through commit_candles. The first candle after a
+    start or reset is flagged partial.
+    '''
+
+    def __init__(self, symbol, granularity=config.GRANULARITY, indicators=None):
+        self.symbol = symbol
+        self.granularity = granularity
+        self.indicators = indicators  # optional StreamingIndicators of the symbol
+        self.candle = None
+        self.partial = True
+
+    # Forgets the live candle after trades may have been missed, the next candle is partial again
+    def reset(self):
+        self.candle = None
+        self.partial = True
+
+    # Commits the exchange's closed candles older than the live candle to the indicators
+    def commit_candles(self, df):
+        if self.indicators is None:
+            return None
+        before = self.candle['timestamp'] if self.candle is not None else None
+        return self.indicators.commit_candles(df, before=before)
+
+    # Applies one trade and returns the updates it produces, the closed candle first if the trade starts a new one
+    def on_tick(self, price, timestamp, size=0.0) -> list:
+        candle_start = int(timestamp) // self.granularity * self.granularity
+        updates = []
+
+        # late trade of a candle that is already closed
+        if self.candle is not None and candle_start < self.candle['timestamp']:
+            return updates
+
+        # If new candle interval, close the previous candle with its provisional indicator values
+        if self.candle is not None and candle_start > self.candle['timestamp']:
+            closed = dict(self.candle, closed=True)
+            if self.indicators is not None:
+                closed.update(self.indicators.update(closed))
+            updates.append(closed)
+            self.candle = None
+            self.partial = False
+
+        if self.candle is None:
+            self.candle = {
+                'type': 'candle',
+                'symbol': self.symbol,
+                'timestamp': candle_start,
+                'low': price,
+                'high': price,
+                'open': price,
+                'close': price,
+                'volume': 0.0,
+                'closed': False,
+                'partial': self.partial
+            }
+        else:
+            self.candle['high'] = max(self.candle['high'], price)
+            self.candle['low'] = min(self.candle['low'], price)
+            self.candle['close'] = price
+        self.candle['volume'] += size
+
+        live = dict(self.candle)
+        if self.indicators is not None:
+            live.update(self.indicators.update(live))
+        updates.append(live)
+        return updates
+
+class MarketDataGateway:
+
+    '''
+    Follows the ticker channel of several products over one websocket connection and turns the
+    trades into per-symbol candle (and indicator) updates, consumed with `async for`.
+
+    Messages are dispatched to the symbol's CandleBuilder as they arrive and the updates go to a
+    bounded queue that drops the oldest update instead of blocking the receive loop. Malformed
+    messages are counted and skipped. Dropped, closed or rejected connections are retried with
+    exponential backoff and the products are resubscribed, the live candles then start over as
+    partial candles. Any other error ends the connection loop and is raised by the iterator.
+    '''
+
+    def __init__(
+            self,
+            symbols=config.MAIN_SYMBOLS,
+            url=COINBASE_WS_URL,
+            granularity=config.GRANULARITY,
+            indicators=None,
+            queue_size=10000,
+            max_backoff=60,
+            record_file=None
+        ):
+        indicators = indicators or {}
+        self.url = url
+        self.builders = {symbol: CandleBuilder(symbol, granularity, indicators.get(symbol)) for symbol in symbols}
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.max_backoff = max_backoff
+        self.record_file = record_file
+        self.dropped = 0
+        self.malformed = 0
+        self.reconnects = 0
+        self._task = None
+        self._closed = False
+
+    def subscribe_message(self) -> dict:
+        return {
+            "type": "subscribe",
+            "product_ids": list(self.builders),
+            "channels": ["ticker"],
+        }
+
+    # Connection loop, reconnects with exponential backoff and jitter until closed
+    async def run(self):
+        attempt = 0
+        while not self._closed:
+            try:
+                async with websockets.connect(self.url) as ws:
+                    await ws.send(json.dumps(self.subscribe_message()))
+                    print(f"Connected: {self.url} ({len(self.builders)} products)")
+                    attempt = 0
+                    async for raw in ws:
+                        self.dispatch(raw)
+            except (websockets.WebSocketException, OSError) as e:
+                print("Error:", e)
+
+            if self._closed:
+                break
+
+            # trades are missed until the connection is back, the live candles cannot be trusted
+            for builder in self.builders.values():
+                builder.reset()
+
+            delay = min(self.max_backoff, 2 ** attempt) * random.uniform(0.5, 1.0)
+            attempt += 1
+            self.reconnects += 1
+            print(f"Reconnecting in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
+
+    # Routes one raw websocket message to its symbol's candle builder
+    def dispatch(self, raw):
+        if self.record_file is not None:
+            self.record_file.write(raw + "\n")
+
+        try:
+            message = json.loads(raw)
+            if message.get("type") != "ticker" or "price" not in message:
+                return
+
+            builder = self.builders.get(message.get("product_id"))
+            if builder is None:
+                return
+
+            price, timestamp, size = float(message["price"]), tick_time(message), float(message.get("last_size") or 0.0)
+        except (ValueError, TypeError, AttributeError) as e:
+            self.malformed += 1
+            print(f"Skipping malformed message: {e}")
+            return
+
+        updates = builder.on_tick(price, timestamp, size)
+        for update in updates:
+            self.publish(update)
+
+    def publish(self, update):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(update)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    # Async iterator of candle/indicator updates, starts the connection on first use. Ends once
+    # the gateway is closed and raises the error that stopped the connection loop, if any
+    async def updates(self):
+        self.start()
+        while True:
+            if self._task.done() and self.queue.empty():
+                if not self._task.cancelled():
+                    self._task.result()
+                return
+
+            get = asyncio.ensure_future(self.queue.get())
+            await asyncio.wait((get, self._task), return_when=asyncio.FIRST_COMPLETED)
+            if get.done():
+                yield get.result()
+            else:
+                get.cancel()
+
+    def __aiter__(self):
+        return self.updates()
+
+# Local stand-in for the exchange feed that replays recorded messages to every subscriber and
+# then closes the connection. The subscribe messages received are appended to subscriptions
+async def serve_replay(messages, host="localhost", port=8765, delay=0.0, subscriptions=None):
+    async def handler(ws):
+        subscribe = json.loads(await ws.recv())
+        if subscriptions is not None:
+            subscriptions.append(subscribe)
+        for message in messages:
+            await ws.send(message if isinstance(message, str) else json.dumps(message))
+            if delay:
+                await asyncio.sleep(delay)
+
+    return await websockets.serve(handler, host, port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print live candle updates of the configured products")
+    parser.add_argument("--replay", help="JSONL file of recorded ticker messages to serve locally instead of the exchange feed")
+    parser.add_argument("--record", help="JSONL file to record the raw websocket messages to")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    async def print_updates():
+        url = COINBASE_WS_URL
+        if args.replay:
+            with open(args.replay, "r") as f:
+                messages = [line.strip() for line in f if line.strip()]
+            await serve_replay(messages, port=args.port, delay=0.001)
+            url = f"ws://localhost:{args.port}"
+
+        record_file = open(args.record, "a") if args.record else None
+        gateway = MarketDataGateway(url=url, record_file=record_file)
+        try:
+            async for update in gateway:
+                print(update)
+        finally:
+            await gateway.close()
+            if record_file is not None:
+                record_file.close()
+
+    asyncio.run(print_updates())
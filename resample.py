@@ -0,0 +1,110 @@
+import argparse
+import os
+import numpy as np
+import config
+from analysis import calculate_indicators
+from candle_store import open_store
+from indicator_engine import WARM_UP
+from candles import candle_file, verify_candles, columns, TIMEFRAME_NAMES
+
+# --------------------- MULTI TIMEFRAME RESAMPLING ---------------------
+
+# Returns the data file of another timeframe of the same series, e.g. data/eth_usd_1h.csv -> data/eth_usd_4h.csv
+def timeframe_file(data_file, granularity) -> str:
+    root, ext = os.path.splitext(data_file)
+    return f"{root.rsplit('_', 1)[0]}_{TIMEFRAME_NAMES[granularity]}{ext}"
+
+# Aggregates candles into buckets of granularity seconds aligned on the epoch (00:00 UTC for 1d)
+def aggregate_candles(candles, granularity) -> dict:
+
+    '''
+    candles is a dict of timestamp-sorted raw columns. Each bucket opens at the open of its first
+    candle and closes at the close of its last one, with the lowest low, highest high and summed
+    volume in between. The bucket timestamp is its start, like the exchange's candles.
+    '''
+
+    timestamps = np.asarray(candles['timestamp'], dtype=np.int64)
+    if len(timestamps) == 0:
+        return {name: np.empty(0, dtype=np.int64 if name == 'timestamp' else np.float64) for name in columns}
+
+    buckets = timestamps - timestamps % granularity
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.append(starts[1:], len(timestamps)) - 1
+
+    return {
+        'timestamp': buckets[starts],
+        'low': np.minimum.reduceat(np.asarray(candles['low'], dtype=np.float64), starts),
+        'high': np.maximum.reduceat(np.asarray(candles['high'], dtype=np.float64), starts),
+        'open': np.asarray(candles['open'], dtype=np.float64)[starts],
+        'close': np.asarray(candles['close'], dtype=np.float64)[ends],
+        'volume': np.add.reduceat(np.asarray(candles['volume'], dtype=np.float64), starts),
+    }
+
+# Appends the higher timeframe candles completed since the last run, returns how many were added
+def resample_candles(data_file=config.CSV_FILE, granularity=14400, source_granularity=config.GRANULARITY, rebuild=False) -> int:
+
+    '''
+    Only the source candles after the last stored bucket are read (the source is memory mapped),
+    and a bucket is only stored once its whole period has elapsed in the source, so the bucket
+    still in progress is aggregated again on the next run instead of being stored half built.
+    On the first run a leading bucket the source only partly covers is skipped. rebuild replaces
+    the stored buckets, e.g. after gaps of the source were repaired.
+    '''
+
+    if granularity % source_granularity:
+        raise ValueError(f"Granularity {granularity} is not a multiple of the source granularity {source_granularity}")
+
+    source = open_store(data_file)
+    if len(source) == 0:
+        return 0
+    target = open_store(timeframe_file(data_file, granularity))
+
+    raw = source.load(columns)
+    timestamps = raw['timestamp']
+
+    # first source candle of the bucket after the last stored one
+    if len(target) and not rebuild:
+        next_bucket = int(target.load(['timestamp'])['timestamp'][-1]) + granularity
+    else:
+        next_bucket = -(-int(timestamps[0]) // granularity) * granularity
+    first = int(np.searchsorted(timestamps, next_bucket, side='left'))
+
+    buckets = aggregate_candles({name: values[first:] for name, values in raw.items()}, granularity)
+
+    # buckets whose period has fully elapsed in the source
+    complete = buckets['timestamp'] + granularity <= int(timestamps[-1]) + source_granularity
+    new_candles = {name: values[complete] for name, values in buckets.items()}
+    if len(new_candles['timestamp']) == 0:
+        return 0
+
+    if rebuild:
+        target.write(new_candles)
+    else:
+        target.append(new_candles)
+    return len(new_candles['timestamp'])
+
+# Brings every higher timeframe of a series up to date, then recalculates their indicators
+def resample_timeframes(data_file=config.CSV_FILE, granularities=config.RESAMPLE_GRANULARITIES, source_granularity=config.GRANULARITY, rebuild=False) -> dict:
+    added = {}
+    for granularity in granularities:
+        added[granularity] = resample_candles(data_file, granularity, source_granularity, rebuild)
+        if added[granularity]:
+            target_file = timeframe_file(data_file, granularity)
+            target = open_store(target_file)
+
+            # the warm-up rows are dropped the first time, so wait for enough buckets to keep some
+            if 'rsi' in target.columns or len(target) >= WARM_UP:
+                calculate_indicators(data_file=target_file)
+            verify_candles(data_file=target_file, granularity=granularity)
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Derive higher timeframe candles from the stored 1h candles")
+    parser.add_argument("symbols", nargs="*", default=config.MAIN_SYMBOLS)
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the higher timeframes from scratch")
+    args = parser.parse_args()
+
+    for symbol in args.symbols:
+        added = resample_timeframes(candle_file(symbol, config.GRANULARITY), rebuild=args.rebuild)
+        print(symbol, ", ".join(f"{TIMEFRAME_NAMES[granularity]}: {n} new candles" for granularity, n in added.items()))
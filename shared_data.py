@@ -0,0 +1,115 @@
+from multiprocessing import shared_memory
+import threading
+import numpy as np
+import pandas as pd
+from candle_store import to_columns
+
+# --------------------- SHARED MEMORY DATASET ---------------------
+
+# Rounds a byte offset up so that every column starts 64-byte aligned
+def _align(offset) -> int:
+    return (offset + 63) // 64 * 64
+
+class SharedDataset:
+
+    '''
+    Publishes the numeric columns of every currency in cached_data once into one shared memory
+    block per currency. The spec is a small picklable description of the blocks (name, length and
+    column layout) that worker processes pass to attach() to get DataFrames over zero-copy,
+    read-only NumPy views instead of unpickling the DataFrames on every map call.
+
+    Derived columns that are not numbers (e.g. date) are not published. The publisher owns the
+    blocks and unlinks them on close(), workers only close their mappings.
+    '''
+
+    def __init__(self, cached_data):
+        self.spec = {}
+        self._blocks = []
+
+        try:
+            for currency, df in cached_data.items():
+                columns = to_columns(df)
+
+                layout = []
+                size = 0
+                for name, values in columns.items():
+                    size = _align(size)
+                    layout.append((name, values.dtype.str, size))
+                    size += values.nbytes
+
+                block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+                self._blocks.append(block)
+                for (name, dtype, offset), values in zip(layout, columns.values()):
+                    view = np.ndarray(len(values), dtype=dtype, buffer=block.buf, offset=offset)
+                    view[:] = values
+
+                self.spec[currency] = {"name": block.name, "length": len(df), "columns": layout}
+        except BaseException:
+            self.close()
+            raise
+
+        self._frames = None
+
+    # DataFrames of the publishing process, over the same shared memory as the workers
+    def frames(self) -> dict:
+        if self._frames is None:
+            self._frames = frames_from_blocks(self.spec, {block.name: block for block in self._blocks})
+        return self._frames
+
+    def close(self):
+        self._frames = None
+        for block in self._blocks:
+            try:
+                block.close()
+            except BufferError:
+                pass  # frames still referenced elsewhere, the memory is freed once they are gone
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Builds one DataFrame per currency over read-only views of the shared memory blocks
+def frames_from_blocks(spec, blocks) -> dict:
+    frames = {}
+    for currency, entry in spec.items():
+        buf = blocks[entry["name"]].buf
+        columns = {}
+        for name, dtype, offset in entry["columns"]:
+            view = np.ndarray(entry["length"], dtype=dtype, buffer=buf, offset=offset)
+            view.flags.writeable = False
+            columns[name] = view
+        frames[currency] = pd.DataFrame(columns, copy=False)
+    return frames
+
+# Shared memory blocks and frames attached by this worker process, for the dataset it last evaluated
+_attached_blocks = {}
+_attached_frames = {}
+_attach_lock = threading.Lock()
+
+# Attaches the DataFrames described by a SharedDataset spec, reusing them while the spec stays the same
+def attach(spec) -> dict:
+    key = tuple(sorted(entry["name"] for entry in spec.values()))
+    with _attach_lock:
+        frames = _attached_frames.get(key)
+        if frames is not None:
+            return frames
+
+        # a new dataset was published, release the mappings of the previous one
+        _attached_frames.clear()
+        for name in set(_attached_blocks) - set(key):
+            try:
+                _attached_blocks.pop(name).close()
+            except BufferError:
+                pass  # frames of the old dataset still in use, unmapped once they are gone
+
+        for name in key:
+            if name not in _attached_blocks:
+                _attached_blocks[name] = shared_memory.SharedMemory(name=name)
+
+        frames = frames_from_blocks(spec, _attached_blocks)
+        _attached_frames[key] = frames
+        return frames
@@ -0,0 +1,100 @@
+from collections import OrderedDict
+import hashlib
+import weakref
+import numpy as np
+import config
+
+# --------------------- SIGNAL CACHE ---------------------
+
+# Fingerprints of the DataFrames seen by this process, keyed by id() and dropped when the DataFrame is freed
+_dataset_ids = {}
+
+# Returns an id for the candle data in df so that the same data always maps to the same cache entries
+def dataset_id(df) -> str:
+    key = id(df)
+    cached = _dataset_ids.get(key)
+    if cached is not None:
+        return cached
+
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(repr((df.shape, list(df.columns))).encode())
+    digest.update(np.ascontiguousarray(df['close'].values, dtype=np.float64).tobytes())
+    if 'timestamp' in df.columns:
+        digest.update(np.ascontiguousarray(df['timestamp'].values, dtype=np.int64).tobytes())
+    data_id = digest.hexdigest()
+
+    _dataset_ids[key] = data_id
+    weakref.finalize(df, _dataset_ids.pop, key, None)
+    return data_id
+
+# Leaf threshold as used in cache keys and evaluation, the exact value as a Python float so that
+# 30, 30.0 and np.float64(30) share entries. It is not rounded: a strategy stored with more
+# decimals than THRESHOLD_DECIMALS must backtest at the threshold it was stored with
+def threshold_key(threshold):
+    if threshold is None:
+        return None
+    return float(threshold)
+
+# Memory-capped LRU cache of signals stored as uint64 bitsets (see bitset.py)
+class SignalCache:
+
+    def __init__(self, max_bytes=config.SIGNAL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Returns the cached bitset for key, or None on a miss
+    def get(self, key):
+        bits = self._entries.get(key)
+        if bits is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return bits
+
+    # Stores a bitset, evicting the least recently used entries over the memory cap
+    def put(self, key, bits):
+        if bits.nbytes > self.max_bytes:
+            return
+
+        # entries are shared by every lookup, so they must never change
+        bits = bits.copy() if bits.flags.writeable else bits
+        bits.flags.writeable = False
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+
+        self._entries[key] = bits
+        self.nbytes += bits.nbytes
+
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+# Per-process cache shared by every strategy evaluated in this process
+SIGNAL_CACHE = SignalCache()
@@ -0,0 +1,219 @@
+import random
+import time
+import numpy as np
+import config
+from generate_strategy import random_tree
+
+# --------------------- ARRAY ENCODED POPULATION ---------------------
+
+class StrategyArrays:
+
+    '''
+    A population as four parallel arrays: the buy and sell tree of each strategy as indices into
+    a shared table of trees, and its buy and sell proportions. Trees are immutable and crossover
+    only swaps whole trees and proportions, so reproduction never touches a tree and runs as
+    array operations over the whole population. Trees are interned by identity, the same tree
+    object shared by many strategies is stored once.
+    '''
+
+    def __init__(self, trees, buy, sell, buy_props, sell_props):
+        self.trees = trees
+        self.buy = buy
+        self.sell = sell
+        self.buy_props = buy_props
+        self.sell_props = sell_props
+
+    def __len__(self):
+        return len(self.buy)
+
+    @classmethod
+    def from_strategies(cls, strategies) -> "StrategyArrays":
+        n = len(strategies)
+        objects = [s['buy_tree'] for s in strategies] + [s['sell_tree'] for s in strategies]
+
+        # one table entry per distinct tree object, found by sorting the object ids
+        ids = np.fromiter(map(id, objects), dtype=np.int64, count=len(objects))
+        _, first, index = np.unique(ids, return_index=True, return_inverse=True)
+
+        return cls(
+            [objects[i] for i in first.tolist()],
+            index[:n],
+            index[n:],
+            np.array([s['buy_proportion'] for s in strategies], dtype=np.float64),
+            np.array([s['sell_proportion'] for s in strategies], dtype=np.float64)
+        )
+
+    # Strategies at the given indices, sharing the tree table
+    def take(self, indices) -> "StrategyArrays":
+        return StrategyArrays(self.trees, self.buy[indices], self.sell[indices], self.buy_props[indices], self.sell_props[indices])
+
+    # Adds new trees to the table and returns their indices
+    def add_trees(self, trees) -> np.ndarray:
+        start = len(self.trees)
+        self.trees.extend(trees)
+        return np.arange(start, len(self.trees), dtype=np.int64)
+
+    def strategies(self) -> list:
+        trees = self.trees
+        return [
+            {'buy_tree': trees[b], 'sell_tree': trees[s], 'buy_proportion': bp, 'sell_proportion': sp}
+            for b, s, bp, sp in zip(self.buy.tolist(), self.sell.tolist(), self.buy_props.tolist(), self.sell_props.tolist())
+        ]
+
+# Concatenates populations that share one tree table
+def concat(parts) -> StrategyArrays:
+    return StrategyArrays(
+        parts[0].trees,
+        np.concatenate([part.buy for part in parts]),
+        np.concatenate([part.sell for part in parts]),
+        np.concatenate([part.buy_props for part in parts]),
+        np.concatenate([part.sell_props for part in parts])
+    )
+
+# --------------------- BULK SELECTION AND REPRODUCTION ---------------------
+
+# Order of the strategies by fitness, best first, ties kept in population order
+def rank_order(fitness_scores) -> np.ndarray:
+    return np.argsort(-np.asarray(fitness_scores, dtype=np.float64), kind='stable')
+
+# Indices of the k best strategies, best first, without sorting the whole population
+def top_indices(fitness_scores, k) -> np.ndarray:
+    scores = -np.asarray(fitness_scores, dtype=np.float64)
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+
+    top = np.argpartition(scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return top[np.lexsort((top, scores[top]))]
+
+# Parent pairs for n_pairs crossovers of a population ranked best first
+def select_parents(n_population, n_pairs, rng, selection=config.SELECTION, tournament_size=config.TOURNAMENT_SIZE) -> tuple:
+
+    '''
+    truncation: both parents are drawn uniformly from the top half, never the same one twice
+    in a pair, like random.sample(parents, 2).
+    tournament: each parent is the best of tournament_size strategies drawn from the whole
+    population. In a ranked population the best is the lowest index, so a tournament is a min.
+    '''
+
+    if selection == "truncation":
+        n_parents = n_population // 2
+        first = rng.integers(n_parents, size=n_pairs)
+        second = (first + rng.integers(1, n_parents, size=n_pairs)) % n_parents
+        return first, second
+
+    if selection == "tournament":
+        entrants = rng.integers(n_population, size=(2, n_pairs, tournament_size))
+        first, second = entrants.min(axis=2)
+        return first, second
+
+    raise ValueError(f"Unknown selection {selection}, expected truncation or tournament")
+
+# Children of the parent pairs, each pair swapping each of its four genes with probability 1/2
+def crossover_arrays(population, first, second, rng) -> StrategyArrays:
+    p1, p2 = population.take(first), population.take(second)
+    swaps = rng.random((4, len(first))) < 0.5
+
+    genes = []
+    for swap, a, b in zip(swaps, (p1.buy, p1.sell, p1.buy_props, p1.sell_props), (p2.buy, p2.sell, p2.buy_props, p2.sell_props)):
+        # children alternate c1, c2 of each pair, as the crossover loop appended them
+        children = np.empty(2 * len(first), dtype=a.dtype)
+        children[0::2] = np.where(swap, b, a)
+        children[1::2] = np.where(swap, a, b)
+        genes.append(children)
+
+    return StrategyArrays(population.trees, *genes)
+
+# Mutates children in place: each one, with probability mutation_rate, gets one gene redrawn
+def mutate_arrays(children, mutation_rate, rng, depth=config.DEPTH):
+    mutated = np.flatnonzero(rng.random(len(children)) < mutation_rate)
+    genes = rng.integers(4, size=len(mutated))
+
+    # new trees are only grown for the children whose mutation hit a tree
+    buy = mutated[genes == 0]
+    sell = mutated[genes == 1]
+    children.buy[buy] = children.add_trees([random_tree('buy', depth=depth) for _ in range(len(buy))])
+    children.sell[sell] = children.add_trees([random_tree('sell', depth=depth) for _ in range(len(sell))])
+
+    buy_props = mutated[genes == 2]
+    sell_props = mutated[genes == 3]
+    children.buy_props[buy_props] = rng.choice(config.BUY_PROPORTION_CHOICES, size=len(buy_props))
+    children.sell_props[sell_props] = rng.choice(config.SELL_PROPORTION_CHOICES, size=len(sell_props))
+
+# Breeds the next generation of a population ranked best first
+def breed(
+        population,
+        population_size=config.POPULATION_SIZE,
+        mutation_rate=config.MUTATION_RATE,
+        rng=None,
+        selection=config.SELECTION,
+        tournament_size=config.TOURNAMENT_SIZE,
+        depth=config.DEPTH
+    ) -> StrategyArrays:
+
+    '''
+    The elites are kept unchanged and the other places go to the children of selected parent
+    pairs. rng is a NumPy Generator, drawn from the random module if not given so that seeding
+    random (and the random state saved in checkpoints) also covers the bulk operations.
+    '''
+
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+
+    elite_count = max(1, int(config.ELITE_FRACTION * population_size))
+    needed_children = population_size - elite_count
+    n_pairs = -(-needed_children // 2)
+
+    first, second = select_parents(len(population), n_pairs, rng, selection, tournament_size)
+    children = crossover_arrays(population, first, second, rng).take(np.arange(needed_children))
+    mutate_arrays(children, mutation_rate, rng, depth)
+
+    return concat([population.take(np.arange(elite_count)), children])
+
+
+if __name__ == "__main__":
+    from generate_strategy import random_strategy, crossover, mutate
+
+    # per strategy loop of the GA before the array encoding, for comparison
+    def loop_generation(population, fitness_scores, population_size, mutation_rate):
+        population = [s for _, s in sorted(zip(fitness_scores, population), key=lambda x: x[0], reverse=True)]
+        sorted(fitness_scores, reverse=True)
+        parents = population[:population_size // 2]
+        elite_count = max(1, int(config.ELITE_FRACTION * population_size))
+        children = []
+        while len(children) < population_size - elite_count:
+            c1, c2 = crossover(*random.sample(parents, 2))
+            if random.random() < mutation_rate:
+                mutate(c1)
+            if random.random() < mutation_rate:
+                mutate(c2)
+            children.extend([c1, c2])
+        return population[:elite_count] + children[:population_size - elite_count]
+
+    def array_generation(population, fitness_scores, population_size, mutation_rate):
+        order = rank_order(fitness_scores)
+        return breed(StrategyArrays.from_strategies(population).take(order), population_size, mutation_rate).strategies()
+
+    random.seed(0)
+    pool = [random_strategy() for _ in range(5000)]
+
+    # master side time of a generation besides evaluation, the per strategy loop against the
+    # array operations. Without mutations the time left is selection and crossover, mutations add
+    # the growth of new trees
+    for mutation_rate in (config.MUTATION_RATE, 0.0):
+        print(f"Master side time of one generation, mutation rate {mutation_rate}:")
+        for population_size in [1000, 5000, 20000, 50000]:
+            population = [dict(pool[i % len(pool)]) for i in range(population_size)]
+            fitness_scores = np.random.default_rng(0).normal(size=population_size)
+
+            timings = []
+            for step in (
+                    lambda: loop_generation(population, fitness_scores, population_size, mutation_rate),
+                    lambda: array_generation(population, fitness_scores, population_size, mutation_rate)
+                ):
+                start = time.perf_counter()
+                step()
+                timings.append(time.perf_counter() - start)
+
+            before, after = timings
+            print(f"  {population_size:>6} strategies: loop {before * 1e3:8.1f} ms, arrays {after * 1e3:7.1f} ms ({before / after:.1f}x)")
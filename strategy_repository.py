@@ -0,0 +1,188 @@
+import argparse
+import json
+import math
+import os
+import sqlite3
+import time
+import config
+from fitness_cache import strategy_hash
+from log_strategies import strategy_to_json, json_to_strategy, JSON_FILE
+
+# --------------------- STRATEGY REPOSITORY ---------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS strategies (
+    hash TEXT NOT NULL,
+    currencies TEXT NOT NULL,
+    fitness REAL NOT NULL,
+    avg_sharpe REAL,
+    avg_return REAL,
+    max_drawdown REAL,
+    trades REAL,
+    strategy TEXT NOT NULL,
+    saved_at REAL NOT NULL,
+    PRIMARY KEY (hash, currencies)
+);
+CREATE INDEX IF NOT EXISTS strategies_by_fitness ON strategies (fitness DESC);
+"""
+
+# a strategy found again on the same currencies keeps its best result
+UPSERT = """
+INSERT INTO strategies (hash, currencies, fitness, avg_sharpe, avg_return, max_drawdown, trades, strategy, saved_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (hash, currencies) DO UPDATE SET
+    fitness = excluded.fitness,
+    avg_sharpe = excluded.avg_sharpe,
+    avg_return = excluded.avg_return,
+    max_drawdown = excluded.max_drawdown,
+    trades = excluded.trades,
+    strategy = excluded.strategy,
+    saved_at = excluded.saved_at
+WHERE excluded.fitness > strategies.fitness
+"""
+
+PRUNE = """
+DELETE FROM strategies WHERE rowid NOT IN (
+    SELECT rowid FROM strategies ORDER BY fitness DESC LIMIT ?
+)
+"""
+
+COLUMNS = "fitness, avg_sharpe, avg_return, max_drawdown, trades, currencies, strategy"
+
+class StrategyRepository:
+
+    '''
+    SQLite database of the best strategies found. The primary key is the canonical strategy hash
+    of fitness_cache (plus the currencies it was scored on), so a strategy already saved is found
+    through the index instead of a scan, and the fitness index answers top N queries without
+    sorting. A batch of strategies is saved in one transaction, and the database runs in WAL mode
+    so GA processes sharing it write atomically while readers keep reading.
+    '''
+
+    def __init__(self, path=config.STRATEGY_DB_FILE, max_strategies=config.MAX_SAVED_STRATEGIES):
+        self.path = path
+        self.max_strategies = max_strategies
+
+        # autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM strategies").fetchone()[0]
+
+    # Saves strategy records as made by strategy_to_json in one transaction, returns how many were new or improved.
+    # Records without a finite fitness cannot be ranked and are skipped
+    def save_records(self, records) -> int:
+        now = time.time()
+        rows = []
+        for record in records:
+            if not math.isfinite(float(record["fitness"])):
+                print(f"Skipping strategy with fitness {record['fitness']}")
+                continue
+
+            rows.append((
+                strategy_hash(json_to_strategy(record)),
+                json.dumps(record["currencies"]),
+                float(record["fitness"]),
+                float(record["avg_sharpe"]),
+                float(record["avg_return"]),
+                float(record["max_drawdown"]),
+                float(record["trades"]),
+                json.dumps(record["strategy"]),
+                now
+            ))
+
+        # the write lock is taken up front so concurrent writers queue instead of failing to upgrade
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            before = self.connection.total_changes
+            self.connection.executemany(UPSERT, rows)
+            saved = self.connection.total_changes - before
+            if self.max_strategies is not None:
+                self.connection.execute(PRUNE, (self.max_strategies,))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return saved
+
+    # Saves a batch of (strategy, fitness, avg_sharpe, avg_return, max_drawdown, trades) results
+    def save_many(self, results, currencies=config.TEST_CURRENCIES) -> int:
+        return self.save_records([strategy_to_json(*result, currencies) for result in results])
+
+    def save(self, strategy, fitness, avg_sharpe, avg_return, max_drawdown, trades, currencies=config.TEST_CURRENCIES) -> int:
+        return self.save_many([(strategy, fitness, avg_sharpe, avg_return, max_drawdown, trades)], currencies)
+
+    # Returns the records of the n strategies with the highest fitness, all of them if n is None
+    def top_records(self, n=None) -> list:
+        query = f"SELECT {COLUMNS} FROM strategies ORDER BY fitness DESC"
+        rows = self.connection.execute(query + " LIMIT ?", (n,)) if n is not None else self.connection.execute(query)
+
+        return [
+            {
+                "fitness": fitness,
+                "avg_sharpe": avg_sharpe,
+                "avg_return": avg_return,
+                "max_drawdown": max_drawdown,
+                "trades": trades,
+                "currencies": json.loads(currencies),
+                "strategy": json.loads(strategy)
+            }
+            for fitness, avg_sharpe, avg_return, max_drawdown, trades, currencies, strategy in rows
+        ]
+
+    # Returns the n strategies with the highest fitness as strategy dicts
+    def top(self, n=None) -> list:
+        return [json_to_strategy(record) for record in self.top_records(n)]
+
+    # Imports a strategies.json file, returns how many strategies were new or improved
+    def import_json(self, json_file=JSON_FILE) -> int:
+        try:
+            with open(json_file, "r") as f:
+                records = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Strategies file {json_file} is corrupted. Nothing imported.")
+            return 0
+        return self.save_records(records)
+
+    # Exports the strategies to a file in the strategies.json format, best first
+    def export_json(self, json_file=JSON_FILE, n=None):
+        tmp_file = f"{json_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.top_records(n), f, indent=4)
+        os.replace(tmp_file, json_file)
+
+    def close(self):
+        self.connection.close()
+
+# Opens the strategy repository, importing the legacy strategies.json file the first time
+def open_repository(path=config.STRATEGY_DB_FILE, json_file=JSON_FILE) -> StrategyRepository:
+    new = not os.path.exists(path)
+    repository = StrategyRepository(path)
+    if new and json_file is not None and os.path.exists(json_file):
+        repository.import_json(json_file)
+    return repository
+
+# Loads the saved strategies with the highest fitness first
+def load_strategies(n=None, path=config.STRATEGY_DB_FILE) -> list:
+    repository = open_repository(path)
+    try:
+        return repository.top(n)
+    finally:
+        repository.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import or export the strategy repository in the strategies.json format")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("json_file", nargs="?", default=JSON_FILE)
+    parser.add_argument("--top", type=int, default=None, help="export only the best N strategies")
+    args = parser.parse_args()
+
+    repository = StrategyRepository()
+    if args.command == "import":
+        print(f"{repository.import_json(args.json_file)} strategies imported, {len(repository)} in the repository")
+    else:
+        repository.export_json(args.json_file, args.top)
+    repository.close()
@@ -0,0 +1,250 @@
+from collections import deque
+import copy
+import math
+import numpy as np
+
+# --------------------- STREAMING INDICATOR ENGINE ---------------------
+
+# Exponentially weighted mean with the same recurrence as pandas .ewm(adjust=False).mean()
+class _EWM:
+
+    def __init__(self, com, min_periods):
+        # pandas turns span/alpha into a center of mass first, alpha is derived back from it
+        alpha = 1. / (1. + com)
+        self.old_wt_factor = 1. - alpha
+        self.new_wt = alpha
+        self.min_periods = min_periods
+        self.weighted = math.nan
+        self.old_wt = 1.
+        self.nobs = 0
+        self.started = False
+
+    def update(self, value) -> float:
+        is_observation = value == value
+
+        if not self.started:
+            self.started = True
+            self.weighted = value
+        else:
+            if self.weighted == self.weighted:
+                self.old_wt *= self.old_wt_factor
+                if is_observation:
+                    if self.weighted != value:
+                        self.weighted = self.old_wt * self.weighted + self.new_wt * value
+                        self.weighted /= (self.old_wt + self.new_wt)
+                    self.old_wt = 1.
+            elif is_observation:
+                self.weighted = value
+
+        self.nobs += is_observation
+        return self.weighted if self.nobs >= self.min_periods else math.nan
+
+# Fixed-size window that only produces a value once it is full of non-NaN values
+class _Window:
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque(maxlen=size)
+
+    def update(self, value) -> bool:
+        self.values.append(value)
+        return len(self.values) == self.size and not any(v != v for v in self.values)
+
+    def mean(self) -> float:
+        return math.fsum(self.values) / self.size
+
+    def std(self) -> float:
+        mean = self.mean()
+        return math.sqrt(math.fsum((v - mean) ** 2 for v in self.values) / self.size)
+
+# Rolling state of every indicator computed by analysis.calculate_indicators
+class _IndicatorState:
+
+    def __init__(self, rsi_window=14, stoch_smooth=3, macd_fast=12, macd_slow=26, macd_sign=9, adx_window=14, bb_window=20, bb_dev=2):
+        self.count = 0
+        self.timestamp = None
+        self.prev_close = math.nan
+        self.prev_high = math.nan
+        self.prev_low = math.nan
+
+        # RSI, Wilder smoothing of gains and losses
+        self.rsi_up = _EWM((1 - 1 / rsi_window) / (1 / rsi_window), rsi_window)
+        self.rsi_down = _EWM((1 - 1 / rsi_window) / (1 / rsi_window), rsi_window)
+
+        # StochRSI over the RSI values, then smoothed twice
+        self.rsi_values = _Window(rsi_window)
+        self.stoch_values = _Window(stoch_smooth)
+        self.k_values = _Window(stoch_smooth)
+
+        # MACD from two EMAs of the close and an EMA of the MACD line
+        self.ema_fast = _EWM((macd_fast - 1) / 2., macd_fast)
+        self.ema_slow = _EWM((macd_slow - 1) / 2., macd_slow)
+        self.ema_signal = _EWM((macd_sign - 1) / 2., macd_sign)
+
+        # ADX, Wilder sums of true range and directional movement seeded by a plain sum
+        self.adx_window = adx_window
+        self.seed_tr = []
+        self.seed_pos = []
+        self.seed_neg = []
+        self.trs = 0.0
+        self.dip = 0.0
+        self.din = 0.0
+        self.seed_dx = []
+        self.adx = 0.0
+        self.prev_adx = 0.0
+
+        # Bollinger bands
+        self.bb_values = _Window(bb_window)
+        self.bb_dev = bb_dev
+
+    # Feeds one candle and returns the indicator values of that candle
+    def step(self, high, low, close) -> dict:
+        i = self.count
+        w = self.adx_window
+
+        # RSI
+        diff = close - self.prev_close
+        up = diff if diff > 0 else 0.0
+        down = -(diff if diff < 0 else 0.0)
+        emaup = self.rsi_up.update(up)
+        emadn = self.rsi_down.update(down)
+        if emadn == 0:
+            rsi = 100.0
+        else:
+            rsi = 100 - (100 / (1 + emaup / emadn)) if emadn == emadn else math.nan
+
+        # StochRSI
+        stoch = math.nan
+        if self.rsi_values.update(rsi):
+            lowest = min(self.rsi_values.values)
+            highest = max(self.rsi_values.values)
+            stoch = (rsi - lowest) / (highest - lowest) if highest != lowest else math.nan
+
+        stoch_k = self.stoch_values.mean() if self.stoch_values.update(stoch) else math.nan
+        stoch_d = self.k_values.mean() if self.k_values.update(stoch_k) else math.nan
+
+        # MACD
+        macd = self.ema_fast.update(close) - self.ema_slow.update(close)
+        macd_signal = self.ema_signal.update(macd)
+
+        # ADX, +DI, -DI
+        true_range = max(high, self.prev_close) - min(low, self.prev_close) if i > 0 else math.nan
+        diff_up = high - self.prev_high
+        diff_down = self.prev_low - low
+        pos = abs(diff_up) if (diff_up > diff_down and diff_up > 0) else 0.0
+        neg = abs(diff_down) if (diff_down > diff_up and diff_down > 0) else 0.0
+
+        plus_di = 0.0
+        minus_di = 0.0
+        if 0 < i <= w:
+            self.seed_tr.append(true_range)
+            self.seed_pos.append(pos)
+            self.seed_neg.append(neg)
+            if i == w:
+                self.trs = np.sum(np.array(self.seed_tr))
+                self.dip = np.sum(np.array(self.seed_pos))
+                self.din = np.sum(np.array(self.seed_neg))
+        elif i > w:
+            self.trs = self.trs - (self.trs / float(w)) + true_range
+            self.dip = self.dip - (self.dip / float(w)) + pos
+            self.din = self.din - (self.din / float(w)) + neg
+
+        adx = 0.0
+        if i >= w:
+            dip_pct = 100 * (self.dip / self.trs) if self.trs != 0 else 0
+            din_pct = 100 * (self.din / self.trs) if self.trs != 0 else 0
+            if i > w:
+                plus_di = dip_pct
+                minus_di = din_pct
+
+            dx = 100 * abs((dip_pct - din_pct) / (dip_pct + din_pct)) if dip_pct + din_pct != 0 else 0
+            if i < 2 * w - 1:
+                self.seed_dx.append(dx)
+            elif i == 2 * w - 1:
+                self.seed_dx.append(dx)
+                self.adx = np.array(self.seed_dx).mean()
+            else:
+                self.adx = ((self.adx * (w - 1)) + dx) / float(w)
+            adx = self.adx if i >= 2 * w - 1 else 0.0
+
+        adx_slope = (adx - self.prev_adx) / 60 if i > 0 else math.nan
+
+        # Bollinger bands
+        bb_middle = bb_upper = bb_lower = math.nan
+        if self.bb_values.update(close):
+            bb_middle = self.bb_values.mean()
+            bb_std = self.bb_values.std()
+            bb_upper = bb_middle + self.bb_dev * bb_std
+            bb_lower = bb_middle - self.bb_dev * bb_std
+
+        self.count += 1
+        self.prev_close = close
+        self.prev_high = high
+        self.prev_low = low
+        self.prev_adx = adx
+
+        return {
+            'rsi': rsi,
+            'stoch_rsi_k': stoch_k * 100,
+            'stoch_rsi_d': stoch_d * 100,
+            'macd': macd,
+            'macd_signal': macd_signal,
+            'adx': float(adx),
+            '+di': float(plus_di),
+            '-di': float(minus_di),
+            'adx_slope': float(adx_slope),
+            'bb_middle': bb_middle,
+            'bb_upper': bb_upper,
+            'bb_lower': bb_lower
+        }
+
+class StreamingIndicators:
+
+    '''
+    Incremental version of analysis.calculate_indicators for the live candle. Every indicator
+    keeps O(1) rolling state (Wilder smoothing, EMA state, fixed-size windows), so a new price
+    only costs one step instead of recomputing the full history.
+
+    update() evaluates the in-progress candle provisionally without touching the state, commit()
+    feeds a closed candle into the state. Values are the same as calculate_indicators on the
+    same candles, before its warm-up rows are dropped.
+    '''
+
+    def __init__(self, **params):
+        self._state = _IndicatorState(**params)
+        self.last_values = None
+
+    @property
+    def last_timestamp(self):
+        return self._state.timestamp
+
+    # Provisional indicator values for the in-progress candle, the committed state is untouched
+    def update(self, candle) -> dict:
+        state = copy.deepcopy(self._state)
+        return state.step(float(candle['high']), float(candle['low']), float(candle['close']))
+
+    # Feeds a closed candle into the rolling state and returns its indicator values
+    def commit(self, candle) -> dict:
+        self.last_values = self._state.step(float(candle['high']), float(candle['low']), float(candle['close']))
+        if 'timestamp' in candle:
+            self._state.timestamp = candle['timestamp']
+        return self.last_values
+
+    # Commits every candle of a DataFrame newer than the last committed one and older than before
+    def commit_candles(self, df, before=None):
+        if self._state.timestamp is not None:
+            df = df[df['timestamp'] > self._state.timestamp]
+        if before is not None:
+            df = df[df['timestamp'] < before]
+
+        for timestamp, high, low, close in zip(df['timestamp'].values, df['high'].values, df['low'].values, df['close'].values):
+            self.commit({'timestamp': timestamp, 'high': high, 'low': low, 'close': close})
+
+        return self.last_values
+
+    # Builds an engine warmed up on a history of candles
+    @classmethod
+    def from_candles(cls, df, before=None, **params):
+        engine = cls(**params)
+        engine.commit_candles(df, before=before)
+        return engine
@@ -0,0 +1,278 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import json
+import random
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pytest
+import requests
+import backfill
+from backfill import TokenBucket, SessionPool, fetch_window, plan_windows, backfill as run_backfill, WINDOW_SECONDS
+from candle_store import open_store, load_candles
+from candles import candle_file
+
+GRANULARITY = 3600
+NOW = 1_700_006_400  # a candle boundary
+
+# --------------------- FAKE CANDLES SERVER ---------------------
+
+class FakeCandlesServer:
+
+    '''
+    Local stand-in for the exchange's candles endpoint. Every symbol has candles every hour from
+    its listing timestamp up to NOW, served newest first like the exchange. failures maps a symbol
+    to the HTTP statuses its next requests fail with, and delay makes requests finish in random
+    order. Requests are logged as (symbol, start, end, time).
+    '''
+
+    def __init__(self, listings, delay=0.0):
+        self.listings = listings
+        self.delay = delay
+        self.failures = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def handle(self, handler):
+        url = urlparse(handler.path)
+        symbol = url.path.split("/")[2]
+        query = parse_qs(url.query)
+        start, end = int(query["start"][0]), int(query["end"][0])
+
+        with self.lock:
+            self.requests.append((symbol, start, end, time.monotonic()))
+            failures = self.failures.get(symbol)
+            status = failures.pop(0) if failures else 200
+
+        if self.delay:
+            time.sleep(random.uniform(0, self.delay))
+
+        if status != 200 or symbol not in self.listings:
+            handler.send_response(status if status != 200 else 404)
+            handler.end_headers()
+            return
+
+        first = max(start, self.listings[symbol])
+        first = -(-first // GRANULARITY) * GRANULARITY
+        candles = [expected_candle(t) for t in range(first, min(end, NOW) + 1, GRANULARITY)]
+
+        body = json.dumps(candles[::-1]).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+# [timestamp, low, high, open, close, volume] of the candle at t, a deterministic random walk
+def expected_candle(t) -> list:
+    k = (t // GRANULARITY) % 1000
+    close = 100 + 10 * np.sin(k / 17) + k % 7
+    return [t, close - 1.5, close + 1.5, close - 0.5, close, 10.0 + k % 13]
+
+@pytest.fixture
+def server():
+    server = FakeCandlesServer({"ETH-USD": NOW - 86400 * 25, "BTC-USD": NOW - 86400 * 40})
+    yield server
+    server.close()
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    # retries happen at once, the sleeps they asked for are kept
+    sleeps = []
+    monkeypatch.setattr(backfill.time, "sleep", sleeps.append)
+    return sleeps
+
+def fast_limiter() -> TokenBucket:
+    return TokenBucket(rate=1e6, capacity=1e6)
+
+# --------------------- WINDOW PLANNING ---------------------
+
+def test_plan_windows_of_empty_store_start_at_listing(tmp_path):
+    store = open_store(str(tmp_path / "eth_usd_1h.csv"))
+    listing = NOW - 86400 * 25
+
+    windows = plan_windows(store, GRANULARITY, NOW, first_candle=listing)
+    assert windows[0][0] == listing
+    assert all(end - start <= WINDOW_SECONDS for start, end in windows)
+    assert all(next_start == start + WINDOW_SECONDS for (start, _), (next_start, _) in zip(windows, windows[1:]))
+    assert windows[-1][1] == NOW
+
+    # without a listing date the plan starts five years back
+    assert len(plan_windows(store, GRANULARITY, NOW)) > len(windows)
+
+def test_plan_windows_resume_after_last_candle(tmp_path, server, no_backoff):
+    data_file = str(tmp_path / "eth_usd_1h.csv")
+    run_backfill(["ETH-USD"], GRANULARITY, base_url=server.url, workers=2, limiter=fast_limiter(), now=NOW - 86400 * 5,
+                 first_candle_file=str(tmp_path / "first.json"), data_files={"ETH-USD": data_file}, finish=False)
+    store = open_store(data_file)
+    last = int(store.load(["timestamp"])["timestamp"][-1])
+
+    windows = plan_windows(store, GRANULARITY, NOW)
+    assert windows[0][0] == last + 1
+    assert windows[-1][1] == NOW
+    assert plan_windows(store, GRANULARITY, last + GRANULARITY) == []
+
+# --------------------- RATE LIMITING ---------------------
+
+def test_token_bucket_limits_the_request_rate():
+    limiter = TokenBucket(rate=50, capacity=5)
+    start = time.monotonic()
+    for _ in range(30):
+        limiter.acquire()
+
+    # the burst goes through at once, the other 25 requests wait for tokens
+    assert time.monotonic() - start >= 25 / 50 * 0.95
+
+def test_token_bucket_is_shared_by_threads():
+    limiter = TokenBucket(rate=100, capacity=1)
+    times = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(10):
+            limiter.acquire()
+            with lock:
+                times.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 40 requests at 100 per second take about 0.39 seconds whatever the number of threads
+    assert len(times) == 40
+    assert max(times) - min(times) >= 39 / 100 * 0.95
+
+def test_backfill_respects_the_rate_limit(tmp_path, server):
+    run_backfill(["BTC-USD"], GRANULARITY, base_url=server.url, workers=4, limiter=TokenBucket(rate=20, capacity=1), now=NOW,
+                 first_candle_file=str(tmp_path / "first.json"), data_files={"BTC-USD": str(tmp_path / "btc_usd_1h.csv")}, finish=False)
+
+    times = sorted(request[3] for request in server.requests)
+    assert len(times) > 5
+    assert (len(times) - 1) / (times[-1] - times[0]) <= 20 * 1.1
+
+# --------------------- RETRIES ---------------------
+
+def test_rate_limited_and_server_errors_are_retried(server, no_backoff):
+    server.failures["ETH-USD"] = [429, 503, 500]
+    sessions = SessionPool(1)
+    try:
+        candles = fetch_window("ETH-USD", NOW - 86400, NOW, GRANULARITY, sessions, fast_limiter(), server.url, max_retries=3)
+    finally:
+        sessions.close()
+
+    assert len(candles) == 25
+    assert len(server.requests) == 4
+
+    # jittered exponential backoff between the attempts
+    assert len(no_backoff) == 3
+    assert all(0.5 * 2 ** attempt * 0.5 <= sleep <= 0.5 * 2 ** attempt * 1.5 for attempt, sleep in enumerate(no_backoff))
+
+def test_retries_give_up_after_max_retries(server, no_backoff):
+    server.failures["ETH-USD"] = [500] * 10
+    sessions = SessionPool(1)
+    try:
+        with pytest.raises(requests.HTTPError) as error:
+            fetch_window("ETH-USD", NOW - 86400, NOW, GRANULARITY, sessions, fast_limiter(), server.url, max_retries=2)
+    finally:
+        sessions.close()
+
+    assert error.value.response.status_code == 500
+    assert len(server.requests) == 3
+
+def test_client_errors_raise_without_retrying(server, no_backoff):
+    # raise_for_status of get_candles surfaces a 4xx other than 429 straight away
+    sessions = SessionPool(1)
+    try:
+        with pytest.raises(requests.HTTPError) as error:
+            fetch_window("NOPE-USD", NOW - 86400, NOW, GRANULARITY, sessions, fast_limiter(), server.url, max_retries=3)
+    finally:
+        sessions.close()
+
+    assert error.value.response.status_code == 404
+    assert len(server.requests) == 1
+    assert no_backoff == []
+
+def test_dropped_connections_are_retried(no_backoff):
+    # nothing listens on a port that was just released
+    probe = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+    url = f"http://127.0.0.1:{probe.server_address[1]}"
+    probe.server_close()
+
+    sessions = SessionPool(1)
+    try:
+        with pytest.raises(requests.ConnectionError):
+            fetch_window("ETH-USD", NOW - 86400, NOW, GRANULARITY, sessions, fast_limiter(), url, max_retries=2)
+    finally:
+        sessions.close()
+    assert len(no_backoff) == 2
+
+# --------------------- BACKFILL ---------------------
+
+def test_backfill_assembles_out_of_order_windows(tmp_path, monkeypatch, no_backoff):
+    monkeypatch.chdir(tmp_path)
+    listings = {"ETH-USD": NOW - 86400 * 25, "BTC-USD": NOW - 86400 * 40}
+    server = FakeCandlesServer(listings, delay=0.02)
+    server.failures["BTC-USD"] = [429, 502]
+    try:
+        appended = run_backfill(list(listings), GRANULARITY, base_url=server.url, workers=6, limiter=fast_limiter(), now=NOW,
+                                first_candle_file=str(tmp_path / "first.json"))
+    finally:
+        server.close()
+
+    for symbol, listing in listings.items():
+        expected = np.arange(listing, NOW + 1, GRANULARITY)
+        assert appended[symbol] == len(expected)
+
+        # the indicators were calculated, which drops their warm-up candles from the store
+        candles = load_candles(candle_file(symbol, GRANULARITY))
+        assert "rsi" in candles.columns
+        assert len(expected) - len(candles) < 50
+        expected = expected[len(expected) - len(candles):]
+        assert np.array_equal(candles["timestamp"].values, expected)
+        assert np.array_equal(candles["close"].values, [expected_candle(t)[4] for t in expected])
+
+    # listing dates were discovered and cached for the next run
+    with open(tmp_path / "first.json") as f:
+        assert json.load(f) == {f"{symbol}:{GRANULARITY}": listing for symbol, listing in listings.items()}
+
+@pytest.mark.parametrize("listing_cached", [True, False])
+def test_failing_symbol_does_not_stop_the_others(tmp_path, monkeypatch, no_backoff, listing_cached):
+    monkeypatch.chdir(tmp_path)
+    listings = {"ETH-USD": NOW - 86400 * 25, "BTC-USD": NOW - 86400 * 40}
+    first_candle_file = tmp_path / "first.json"
+    if listing_cached:
+        with open(first_candle_file, "w") as f:
+            json.dump({f"{symbol}:{GRANULARITY}": listing for symbol, listing in listings.items()}, f)
+
+    server = FakeCandlesServer(listings)
+    server.failures["ETH-USD"] = [404] * 1000
+    try:
+        appended = run_backfill(list(listings), GRANULARITY, base_url=server.url, workers=4, limiter=fast_limiter(), now=NOW,
+                                first_candle_file=str(first_candle_file))
+    finally:
+        server.close()
+
+    assert appended["ETH-USD"] is None
+    assert len(open_store(candle_file("ETH-USD", GRANULARITY))) == 0
+    assert appended["BTC-USD"] == len(np.arange(listings["BTC-USD"], NOW + 1, GRANULARITY))
+    assert "rsi" in load_candles(candle_file("BTC-USD", GRANULARITY)).columns
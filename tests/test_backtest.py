@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+from backtest import (
+    simulate_trades, equity_curve, period_returns, simulate, equity_within_drawdown,
+    simulate_batch_trades, batch_equity_curve, batch_equity_within_drawdown, simulate_batch
+)
+
+# --------------------- REFERENCE LOOP ---------------------
+
+# Per candle loop of evaluate_strategy_sharpe before the backtest engine, the engine must match it bit for bit
+def reference_backtest(closes, buy_signal_arr, sell_signal_arr, buy_prop, sell_prop, balance, position, fee) -> tuple:
+    equity_arr = []
+    all_returns = []
+    prev_equity = None
+
+    for i in range(len(buy_signal_arr)):
+        price = closes[i]
+
+        if buy_signal_arr[i] and balance > 0:
+            cost = balance * buy_prop
+            coins = (cost / price) * (1 - fee)
+            position += coins
+            balance -= cost
+        elif sell_signal_arr[i] and position > 0:
+            revenue = (position * price) * sell_prop * (1 - fee)
+            balance += revenue
+            position *= (1 - sell_prop)
+
+        equity = balance + (position * price)
+        equity_arr.append(equity)
+        if prev_equity is not None and prev_equity > 0:
+            all_returns.append((equity - prev_equity) / prev_equity)
+        prev_equity = equity
+
+    equity_arr = np.array(equity_arr)
+    max_drawdown = ((equity_arr / np.maximum.accumulate(equity_arr) - 1) * 100).min()
+    return equity_arr, np.array(all_returns), balance, position, max_drawdown
+
+# --------------------- RANDOM SIGNALS ---------------------
+
+N_CANDLES = 3000
+FEE = 0.006
+
+# Random walk closes and buy/sell signals of the given densities
+def random_case(seed, buy_density, sell_density, balance=1000.0, position=0.0) -> tuple:
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, N_CANDLES)))
+    buy_signal_arr = rng.random(N_CANDLES) < buy_density
+    sell_signal_arr = rng.random(N_CANDLES) < sell_density
+    buy_prop = float(rng.choice([0.25, 0.5, 0.75, 1.0]))
+    sell_prop = float(rng.choice([0.25, 0.5, 0.75, 1.0]))
+    return closes, buy_signal_arr, sell_signal_arr, buy_prop, sell_prop, balance, position, FEE
+
+CASES = [
+    (seed, buy_density, sell_density, position)
+    for seed, (buy_density, sell_density) in enumerate([(0.0, 0.0), (0.001, 0.001), (0.01, 0.05), (0.1, 0.1), (0.5, 0.5), (1.0, 1.0), (0.3, 0.0)])
+    for position in (0.0, 5.0)
+]
+
+@pytest.mark.parametrize("seed, buy_density, sell_density, position", CASES)
+def test_simulate_matches_reference(seed, buy_density, sell_density, position):
+    case = random_case(seed, buy_density, sell_density, position=position)
+    ref_equity, ref_returns, ref_balance, ref_position, _ = reference_backtest(*case)
+
+    equity, final_balance, final_position = simulate(*case)
+    assert np.array_equal(equity, ref_equity)
+    assert final_balance == ref_balance
+    assert final_position == ref_position
+    assert np.array_equal(period_returns(equity), ref_returns)
+
+@pytest.mark.parametrize("seed, buy_density, sell_density, position", CASES)
+def test_equity_curve_into_preallocated_buffer(seed, buy_density, sell_density, position):
+    case = random_case(seed, buy_density, sell_density, position=position)
+    closes, balance = case[0], case[5]
+    ref_equity = reference_backtest(*case)[0]
+
+    trade_indices, balances, positions = simulate_trades(*case)
+    out = np.full(len(closes), np.nan)
+    equity = equity_curve(closes, trade_indices, balances, positions, balance, position, out=out)
+    assert equity is out
+    assert np.array_equal(equity, ref_equity)
+
+@pytest.mark.parametrize("seed, buy_density, sell_density, position", CASES)
+def test_equity_within_drawdown_matches_reference(seed, buy_density, sell_density, position):
+    case = random_case(seed, buy_density, sell_density, position=position)
+    closes, balance = case[0], case[5]
+    ref_equity, _, _, _, ref_drawdown = reference_backtest(*case)
+    trade_indices, balances, positions = simulate_trades(*case)
+
+    # a limit that is never reached gives the full curve and its drawdown
+    equity, max_drawdown = equity_within_drawdown(closes, trade_indices, balances, positions, balance, position, -np.inf, chunk_size=256)
+    assert np.array_equal(equity, ref_equity)
+    assert max_drawdown == ref_drawdown
+
+    # a limit above the drawdown abandons the curve
+    if ref_drawdown < 0:
+        equity, max_drawdown = equity_within_drawdown(closes, trade_indices, balances, positions, balance, position, ref_drawdown / 2, chunk_size=256)
+        assert equity is None
+        assert max_drawdown < ref_drawdown / 2
+
+def test_batch_matches_reference():
+    cases = [random_case(seed, buy_density, sell_density) for seed, buy_density, sell_density, _ in CASES]
+    closes = cases[0][0]
+    buy_matrix = np.array([case[1] for case in cases])
+    sell_matrix = np.array([case[2] for case in cases])
+    buy_props = [case[3] for case in cases]
+    sell_props = [case[4] for case in cases]
+
+    equity, balances, positions = simulate_batch(closes, buy_matrix, sell_matrix, buy_props, sell_props, 1000.0, 0.0, FEE)
+    balance_hist, position_hist, _, _ = simulate_batch_trades(closes, buy_matrix, sell_matrix, buy_props, sell_props, 1000.0, 0.0, FEE)
+    limited, drawdowns, breached = batch_equity_within_drawdown(closes, buy_matrix | sell_matrix, balance_hist, position_hist, -np.inf, chunk_size=256)
+    assert not breached.any()
+    assert np.array_equal(batch_equity_curve(closes, buy_matrix | sell_matrix, balance_hist, position_hist), equity)
+
+    for j, case in enumerate(cases):
+        ref_equity, _, ref_balance, ref_position, ref_drawdown = reference_backtest(closes, *case[1:])
+        assert np.array_equal(equity[j], ref_equity)
+        assert np.array_equal(limited[j], ref_equity)
+        assert balances[j] == ref_balance
+        assert positions[j] == ref_position
+        assert drawdowns[j] == ref_drawdown
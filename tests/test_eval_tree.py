@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+from analysis import rsi_oversold, rsi_overbought, stoch_rsi_overbought, stoch_rsi_oversold, adx_trending
+from eval_strategy import eval_signal
+from fitness_cache import strategy_hash
+from indicator_engine import compute_indicators
+
+# Random walk candles with the indicator columns of the store
+def indicator_frame(n=3000, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    high, low = close * (1 + np.abs(rng.normal(0, 0.003, n))), close * (1 - np.abs(rng.normal(0, 0.003, n)))
+    columns, _ = compute_indicators(high, low, close)
+    return pd.DataFrame({'timestamp': 1_600_000_000 + 3600 * np.arange(n), 'high': high, 'low': low, 'close': close, **columns})
+
+# --------------------- TESTS ---------------------
+
+@pytest.mark.parametrize("func, column", [
+    (rsi_oversold, 'rsi'), (rsi_overbought, 'rsi'), (stoch_rsi_overbought, 'stoch_rsi_k'),
+    (stoch_rsi_oversold, 'stoch_rsi_k'), (adx_trending, 'adx')
+])
+def test_leaves_fire_at_their_exact_threshold(func, column):
+    df = indicator_frame()
+
+    # indicator values that move when rounded onto the generation grid, so a leaf evaluated at the
+    # rounded threshold would fire on different candles
+    values = df[column].dropna().to_numpy()
+    off_grid = values[np.abs(np.round(values, 2) - values) > 1e-4][:20]
+    for threshold in off_grid:
+        expected = func(df, threshold).fillna(False).to_numpy(dtype=bool)
+        np.testing.assert_array_equal(eval_signal((func, threshold), df), expected, err_msg=f"{func.__name__} {threshold}")
+
+def test_off_grid_thresholds_hash_apart():
+    strategy = {"buy_tree": (rsi_oversold, 30.0), "sell_tree": (rsi_overbought, 70.0), "buy_proportion": 0.5, "sell_proportion": 0.5}
+    shifted = dict(strategy, buy_tree=(rsi_oversold, 30.004))
+    assert strategy_hash(shifted) != strategy_hash(strategy)
+    assert strategy_hash(dict(strategy, buy_tree=(rsi_oversold, 30))) == strategy_hash(strategy)
@@ -0,0 +1,32 @@
+import time
+from functools import partial
+import pytest
+from executors import make_executor
+
+# --------------------- TASKS ---------------------
+
+def double(batch) -> list:
+    return [2 * item for item in batch]
+
+def slow_square(delay, batch) -> list:
+    time.sleep(delay * len(batch))
+    return [item * item for item in batch]
+
+# --------------------- TESTS ---------------------
+
+@pytest.mark.parametrize("kind", ["serial", "thread"])
+def test_map_batches_keeps_item_order(kind):
+    with make_executor(kind, workers=2) as executor:
+        assert executor.map_batches(double, range(50)) == [2 * item for item in range(50)]
+
+def test_each_function_keeps_its_own_chunker():
+    with make_executor("thread", workers=2) as executor:
+        executor.map_batches(partial(slow_square, 0.002), range(20))
+        executor.map_batches(double, range(200))
+        executor.map_batches(partial(slow_square, 0.002), range(20))
+
+        slow, fast = executor.chunker(partial(slow_square, 0)), executor.chunker(double)
+        assert slow is not fast
+        assert slow.cost > 100 * fast.cost
+        # a later partial of the same function reuses the chunker measured on the earlier ones
+        assert executor.chunker(partial(slow_square, 0.5)) is slow
@@ -0,0 +1,31 @@
+import json
+import pandas as pd
+import fitness_cache
+from fitness_cache import FitnessCache, slice_key
+
+# --------------------- TESTS ---------------------
+
+def test_slice_key_changes_with_the_evaluator_version(monkeypatch):
+    cached_data = {"eth": pd.DataFrame({"timestamp": [1, 2, 3], "close": [1.0, 2.0, 3.0]})}
+    key = slice_key(cached_data, currencies=["eth"])
+    assert slice_key(cached_data, currencies=["eth"]) == key
+
+    monkeypatch.setattr(fitness_cache, "EVALUATOR_VERSION", fitness_cache.EVALUATOR_VERSION + 1)
+    assert slice_key(cached_data, currencies=["eth"]) != key
+
+def test_save_keeps_the_best_results_of_each_slice(tmp_path):
+    path = str(tmp_path / "fitness_cache.json")
+    cache = FitnessCache(path, max_per_slice=3)
+    for i in range(10):
+        cache.put("a", f"s{i}", {"avg_sharpe": i})
+    cache.put("b", "s0", {"avg_sharpe": -5})
+    cache.save()
+
+    with open(path) as f:
+        saved = json.load(f)
+    assert sorted(saved) == ["a:s7", "a:s8", "a:s9", "b:s0"]
+    assert len(cache) == 4 and cache.unsaved() == {}
+
+    reloaded = FitnessCache(path, max_per_slice=3)
+    assert reloaded.get("a", "s9") == {"avg_sharpe": 9.0}
+    assert reloaded.get("a", "s0") is None
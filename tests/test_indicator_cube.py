@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+from candle_store import open_store, load_candles
+from indicator_cube import with_cube, cube_columns, compute_cube
+
+# Random walk candles of a store, hourly from a fixed start
+def random_candles(n=600, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    return pd.DataFrame({
+        'timestamp': 1_600_000_000 + 3600 * np.arange(n), 'low': close * 0.995, 'high': close * 1.005,
+        'open': close, 'close': close, 'volume': np.ones(n)
+    })
+
+# --------------------- TESTS ---------------------
+
+def test_with_cube_builds_the_missing_cube(tmp_path):
+    data_file = str(tmp_path / "eth_usd_1h.csv")
+    open_store(data_file).append(random_candles())
+
+    df = with_cube(load_candles(data_file), data_file)
+    assert set(cube_columns()) <= set(df.columns)
+    # the cube was written next to the store and is reused as is
+    assert (tmp_path / "eth_usd_1h.cube").exists()
+    pd.testing.assert_frame_equal(with_cube(load_candles(data_file), data_file), df)
+
+def test_with_cube_computes_the_variants_of_candles_newer_than_the_store(tmp_path, capsys):
+    data_file = str(tmp_path / "eth_usd_1h.csv")
+    candles = random_candles()
+    open_store(data_file).append(candles.iloc[:500])
+    with_cube(load_candles(data_file), data_file)
+
+    # the caller's frame holds candles the store and its cube have not seen
+    df = with_cube(candles, data_file)
+    assert "does not match" in capsys.readouterr().out
+    expected = compute_cube(candles['high'].values, candles['low'].values, candles['close'].values)
+    for name in cube_columns():
+        np.testing.assert_array_equal(df[name].values, expected[name], err_msg=name)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+import ta
+from indicator_engine import (
+    compute_indicators, compute_batch, INDICATOR_COLUMNS, RSI_WINDOW, STOCH_SMOOTH, MACD_FAST, MACD_SLOW,
+    MACD_SIGN, ADX_WINDOW, BB_WINDOW, BB_DEV
+)
+
+# Sums of rounded terms come out in a different order than in ta and pandas
+TOLERANCE = 1e-9
+
+# Random walk candles standing in for the stored 1h series
+def random_candles(n=3000, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.003, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.003, n)))
+    return pd.DataFrame({'high': high, 'low': low, 'close': close})
+
+# ta version of the indicators, as analysis.calculate_indicators computed them before the engine
+def ta_indicators(df) -> dict:
+    stochrsi = ta.momentum.StochRSIIndicator(close=df['close'], window=RSI_WINDOW, smooth1=STOCH_SMOOTH, smooth2=STOCH_SMOOTH)
+    macd = ta.trend.MACD(df['close'], window_slow=MACD_SLOW, window_fast=MACD_FAST, window_sign=MACD_SIGN)
+    adx = ta.trend.adx(df['high'], df['low'], df['close'], window=ADX_WINDOW)
+    bb = ta.volatility.BollingerBands(close=df['close'], window=BB_WINDOW, window_dev=BB_DEV)
+    return {
+        'rsi': ta.momentum.rsi(df['close'], window=RSI_WINDOW),
+        'stoch_rsi_k': stochrsi.stochrsi_k() * 100,
+        'stoch_rsi_d': stochrsi.stochrsi_d() * 100,
+        'macd': macd.macd(),
+        'macd_signal': macd.macd_signal(),
+        'adx': adx,
+        '+di': ta.trend.adx_pos(df['high'], df['low'], df['close'], window=ADX_WINDOW),
+        '-di': ta.trend.adx_neg(df['high'], df['low'], df['close'], window=ADX_WINDOW),
+        'adx_slope': (adx - adx.shift(1)) / 60,
+        'bb_middle': bb.bollinger_mavg(),
+        'bb_upper': bb.bollinger_hband(),
+        'bb_lower': bb.bollinger_lband(),
+    }
+
+# Same values and the same NaN warm-up rows as ta, for every column
+def assert_matches_ta(columns, expected):
+    for name in INDICATOR_COLUMNS:
+        np.testing.assert_allclose(columns[name], expected[name].to_numpy(dtype=np.float64),
+                                   rtol=TOLERANCE, atol=TOLERANCE, err_msg=name)
+
+# --------------------- TESTS ---------------------
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_full_compute_matches_ta(seed):
+    df = random_candles(seed=seed)
+    columns, _ = compute_indicators(df['high'].values, df['low'].values, df['close'].values)
+    assert_matches_ta(columns, ta_indicators(df))
+
+@pytest.mark.parametrize("appended", [1, 5, 200])
+def test_tail_update_continues_the_full_compute(appended):
+    df = random_candles()
+    full, _ = compute_indicators(df['high'].values, df['low'].values, df['close'].values)
+
+    split = len(df) - appended
+    _, state = compute_indicators(df['high'].values[:split], df['low'].values[:split], df['close'].values[:split])
+    tail, _ = compute_indicators(df['high'].values[split:], df['low'].values[split:], df['close'].values[split:], state=state)
+
+    for name in INDICATOR_COLUMNS:
+        np.testing.assert_allclose(tail[name], full[name][split:], rtol=TOLERANCE, atol=TOLERANCE, err_msg=name)
+
+def test_compute_batch_matches_ta_for_each_padded_row():
+    frames = [random_candles(n, seed) for seed, n in enumerate([3000, 1200, 80, 2500])]
+    batched = compute_batch(frames)
+
+    assert len(batched) == len(frames)
+    for df, (columns, _) in zip(frames, batched):
+        assert all(len(columns[name]) == len(df) for name in INDICATOR_COLUMNS)
+        assert_matches_ta(columns, ta_indicators(df))
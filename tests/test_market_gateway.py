@@ -0,0 +1,94 @@
+import asyncio
+import json
+from market_gateway import MarketDataGateway, serve_replay
+
+HOUR = 1_700_000_000 // 3600 * 3600
+
+# ISO time of a trade seconds after the first candle of the feed
+def iso(seconds) -> str:
+    from datetime import datetime, timezone
+    return datetime.fromtimestamp(HOUR + seconds, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+def ticker(product_id, price, seconds, size=1.0) -> dict:
+    return {"type": "ticker", "product_id": product_id, "price": str(price), "last_size": str(size), "time": iso(seconds)}
+
+# Recorded two symbol feed: a full candle of each symbol and the first trade of their next candle,
+# interleaved with a subscription confirmation and malformed messages
+FEED = [
+    {"type": "subscriptions", "channels": [{"name": "ticker", "product_ids": ["ETH-USD", "BTC-USD"]}]},
+    ticker("ETH-USD", 10.0, 60),
+    ticker("BTC-USD", 100.0, 61),
+    ticker("ETH-USD", 12.0, 600, 2.0),
+    "not json",
+    ticker("BTC-USD", 90.0, 700),
+    {"type": "ticker", "product_id": "ETH-USD", "price": "abc", "time": iso(800)},
+    ticker("ETH-USD", 9.0, 1800),
+    {"type": "ticker", "product_id": "BTC-USD", "price": "95", "time": "yesterday"},
+    ticker("BTC-USD", 105.0, 2000),
+    ticker("ETH-USD", 11.0, 3500),
+    ticker("DOGE-USD", 1.0, 3550),
+    ticker("ETH-USD", 13.0, 3600 + 5),
+    ticker("BTC-USD", 104.0, 3600 + 10),
+]
+MALFORMED = 3
+UPDATES_PER_CONNECTION = 11  # one per valid trade of the two symbols plus their two closed candles
+
+# Replays the feed until the gateway has reconnected once and collects every update
+async def replay(n_connections=2):
+    subscriptions = []
+    server = await serve_replay(FEED, host="127.0.0.1", port=0, subscriptions=subscriptions)
+    port = server.sockets[0].getsockname()[1]
+
+    gateway = MarketDataGateway(["ETH-USD", "BTC-USD"], url=f"ws://127.0.0.1:{port}", max_backoff=0.01)
+    updates = []
+    try:
+        async def collect():
+            async for update in gateway:
+                updates.append(update)
+                if len(subscriptions) == n_connections and gateway.reconnects >= n_connections - 1 and len(updates) >= n_connections * UPDATES_PER_CONNECTION:
+                    return
+        await asyncio.wait_for(collect(), timeout=10)
+    finally:
+        await gateway.close()
+        server.close()
+        await server.wait_closed()
+    return gateway, updates, subscriptions
+
+def test_replayed_feed_builds_candles_per_symbol():
+    gateway, updates, subscriptions = asyncio.run(replay())
+    first_connection = updates[:UPDATES_PER_CONNECTION]
+
+    closed = {update["symbol"]: update for update in first_connection if update["closed"]}
+    assert set(closed) == {"ETH-USD", "BTC-USD"}
+
+    eth = closed["ETH-USD"]
+    assert (eth["timestamp"], eth["open"], eth["high"], eth["low"], eth["close"], eth["volume"]) == (HOUR, 10.0, 12.0, 9.0, 11.0, 5.0)
+    btc = closed["BTC-USD"]
+    assert (btc["timestamp"], btc["open"], btc["high"], btc["low"], btc["close"], btc["volume"]) == (HOUR, 100.0, 105.0, 90.0, 105.0, 3.0)
+
+    # the first candle of a connection misses earlier trades and is flagged partial, the next one is complete
+    assert eth["partial"] and btc["partial"]
+    next_candles = [update for update in first_connection if update["timestamp"] == HOUR + 3600]
+    assert {update["symbol"] for update in next_candles} == {"ETH-USD", "BTC-USD"}
+    assert not any(update["closed"] or update["partial"] for update in next_candles)
+
+    # live updates of the open candle carry its running values
+    live = [update for update in first_connection if update["symbol"] == "ETH-USD" and not update["closed"] and update["timestamp"] == HOUR]
+    assert [update["close"] for update in live] == [10.0, 12.0, 9.0, 11.0]
+
+def test_malformed_messages_are_skipped_and_counted():
+    gateway, updates, _ = asyncio.run(replay())
+    assert gateway.malformed >= MALFORMED
+    assert gateway.malformed % MALFORMED == 0
+    assert all(update["symbol"] in ("ETH-USD", "BTC-USD") for update in updates)
+
+def test_products_are_resubscribed_after_the_server_drops_the_connection():
+    gateway, updates, subscriptions = asyncio.run(replay())
+    assert gateway.reconnects >= 1
+    assert len(subscriptions) >= 2
+    assert all(subscription["product_ids"] == ["ETH-USD", "BTC-USD"] and subscription["channels"] == ["ticker"] for subscription in subscriptions)
+
+    # after the reconnect the live candles start over, the replayed hour is partial again
+    second_connection = updates[UPDATES_PER_CONNECTION:]
+    assert second_connection[0]["timestamp"] == HOUR
+    assert second_connection[0]["partial"]
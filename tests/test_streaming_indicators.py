@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+import ta
+from streaming_indicators import StreamingIndicators
+
+COLUMNS = ['rsi', 'stoch_rsi_k', 'stoch_rsi_d', 'macd', 'macd_signal', 'adx', '+di', '-di', 'adx_slope', 'bb_middle', 'bb_upper', 'bb_lower']
+
+# Rolling sums make StochRSI and the Bollinger bands differ from ta in the last bits only
+TOLERANCE = 1e-9
+
+# Random walk candles
+def random_candles(n=2000, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.003, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.003, n)))
+    return pd.DataFrame({'timestamp': 1_600_000_000 + 3600 * np.arange(n), 'high': high, 'low': low, 'close': close})
+
+# The ta calls analysis.calculate_indicators was written against, warm-up rows kept
+def ta_indicators(df) -> pd.DataFrame:
+    out = pd.DataFrame(index=df.index)
+    out['rsi'] = ta.momentum.rsi(df['close'], window=14)
+
+    stochrsi = ta.momentum.StochRSIIndicator(close=df['close'], window=14, smooth1=3, smooth2=3)
+    out['stoch_rsi_k'] = stochrsi.stochrsi_k() * 100
+    out['stoch_rsi_d'] = stochrsi.stochrsi_d() * 100
+
+    macd = ta.trend.MACD(df['close'], window_slow=26, window_fast=12, window_sign=9)
+    out['macd'] = macd.macd()
+    out['macd_signal'] = macd.macd_signal()
+
+    out['adx'] = ta.trend.adx(df['high'], df['low'], df['close'], window=14)
+    out['+di'] = ta.trend.adx_pos(df['high'], df['low'], df['close'], window=14)
+    out['-di'] = ta.trend.adx_neg(df['high'], df['low'], df['close'], window=14)
+    out['adx_slope'] = (out['adx'] - out['adx'].shift(1)) / 60
+
+    bb_indicator = ta.volatility.BollingerBands(close=df['close'], window=20, window_dev=2)
+    out['bb_middle'] = bb_indicator.bollinger_mavg()
+    out['bb_upper'] = bb_indicator.bollinger_hband()
+    out['bb_lower'] = bb_indicator.bollinger_lband()
+    return out
+
+# Indicator values of every candle, committed one by one
+def streamed(df, engine=None) -> pd.DataFrame:
+    engine = engine or StreamingIndicators()
+    rows = [
+        engine.commit({'timestamp': timestamp, 'high': high, 'low': low, 'close': close})
+        for timestamp, high, low, close in zip(df['timestamp'], df['high'], df['low'], df['close'])
+    ]
+    return pd.DataFrame(rows, index=df.index)
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matches_ta(seed):
+    df = random_candles(seed=seed)
+    expected = ta_indicators(df)
+    got = streamed(df)
+
+    for column in COLUMNS:
+        np.testing.assert_allclose(got[column].values, expected[column].values, rtol=0, atol=TOLERANCE, err_msg=column)
+
+def test_matches_ta_with_flat_prices():
+    # flat stretches give zero losses (RSI 100), equal RSI extremes and zero true ranges
+    df = random_candles(600, seed=3)
+    for column in ['high', 'low', 'close']:
+        df.loc[200:260, column] = df.loc[200, 'close']
+
+    expected = ta_indicators(df)
+    got = streamed(df)
+    for column in COLUMNS:
+        np.testing.assert_allclose(got[column].values, expected[column].values, rtol=0, atol=TOLERANCE, err_msg=column)
+
+def test_provisional_update_leaves_state_untouched():
+    df = random_candles(300)
+    engine = StreamingIndicators.from_candles(df.iloc[:-1])
+    last = df.iloc[-1].to_dict()
+
+    provisional = [engine.update(dict(last, close=last['close'] * factor)) for factor in (0.99, 1.01)]
+    assert provisional[0]['rsi'] != provisional[1]['rsi']
+
+    # committing after any number of provisional updates gives the same values as without them
+    committed = engine.commit(last)
+    reference = streamed(df).iloc[-1]
+    for column in COLUMNS:
+        assert committed[column] == pytest.approx(reference[column], abs=TOLERANCE, nan_ok=True)
+    assert engine.last_timestamp == last['timestamp']
+
+def test_commit_candles_only_commits_new_closed_candles():
+    df = random_candles(500)
+    engine = StreamingIndicators.from_candles(df.iloc[:300])
+
+    # candles already committed and the live candle (before) are skipped
+    engine.commit_candles(df, before=df['timestamp'].iloc[400])
+    assert engine.last_timestamp == df['timestamp'].iloc[399]
+
+    reference = StreamingIndicators.from_candles(df.iloc[:400])
+    assert engine.last_values == reference.last_values
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from trade_ledger import TradeLedger, LEDGER_COLUMNS
+
+# Logs n alternating trades, trade i at timestamp 3600 * i
+def fill(ledger, n):
+    for i in range(n):
+        ledger.append(3600 * i, "buy" if i % 2 == 0 else "sell", 100.0 + i, 0.5, 50.0 + i, 1000.0 - i, 0.5 * i, float(i))
+
+# --------------------- TESTS ---------------------
+
+@pytest.mark.parametrize("stored", [False, True])
+def test_rows_match_the_columns(tmp_path, stored):
+    ledger = TradeLedger(str(tmp_path / "ledger") if stored else None, capacity=4, flush_rows=10)
+    fill(ledger, 25)  # with a store: 20 trades flushed, 5 buffered
+    columns = ledger.columns()
+
+    rows = list(ledger)
+    assert len(rows) == len(ledger) == 25
+    for index in range(-25, 25):
+        row = ledger[index]
+        assert row.timestamp == columns["timestamp"][index] == rows[index].timestamp
+        assert row.action == ("buy" if index % 25 % 2 == 0 else "sell")
+        assert row.cumulative_gain == columns["cumulative_gain"][index]
+
+    with pytest.raises(IndexError):
+        ledger[25]
+
+def test_indexing_maps_the_store_once(tmp_path, monkeypatch):
+    ledger = TradeLedger(str(tmp_path / "ledger"), flush_rows=100)
+    fill(ledger, 250)
+
+    loads = []
+    load = ledger.store.load
+    monkeypatch.setattr(ledger.store, "load", lambda *args, **kwargs: loads.append(args) or load(*args, **kwargs))
+    timestamps = [ledger[index].timestamp for index in range(len(ledger))]
+
+    assert timestamps == list(3600 * np.arange(250))
+    assert len(loads) == 1
+    assert set(loads[0][0]) == set(LEDGER_COLUMNS)
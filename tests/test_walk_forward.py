@@ -0,0 +1,33 @@
+import pytest
+from eval_strategy import PENALTY_RESULT
+from walk_forward import make_folds, aggregate, train_aggregate
+
+# --------------------- HELPERS ---------------------
+
+# A window result with the given sharpe, the other metrics derived from it
+def window_result(sharpe) -> dict:
+    return {"avg_sharpe": sharpe, "max_drawdown": -0.1 * abs(sharpe), "avg_percent_return": sharpe,
+            "avg_num_trades": 10}
+
+# --------------------- TESTS ---------------------
+
+@pytest.mark.parametrize("mode", ["rolling", "anchored", "kfold"])
+def test_folds_test_blocks_do_not_overlap_train_blocks(mode):
+    for fold in make_folds(4, mode):
+        start, stop = fold["test"]
+        for train_start, train_stop in fold["train"]:
+            assert train_stop <= start or train_start >= stop
+
+def test_aggregate_leaves_penalized_windows_out_of_the_report():
+    result = aggregate([window_result(2.0), dict(PENALTY_RESULT), window_result(1.0)])
+    assert result["avg_sharpe"] == pytest.approx(1.5)
+    assert result["penalized"] == 1
+
+def test_train_aggregate_rejects_a_strategy_penalized_on_any_window():
+    result = train_aggregate([window_result(2.0), dict(PENALTY_RESULT), window_result(1.0)])
+    assert result["avg_sharpe"] == PENALTY_RESULT["avg_sharpe"]
+    assert result["penalized"] == 1
+
+def test_train_aggregate_matches_aggregate_when_every_window_passes():
+    results = [window_result(2.0), window_result(-0.5), window_result(1.0)]
+    assert train_aggregate(results) == aggregate(results)
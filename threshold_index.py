@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from functools import partial
+import numpy as np
+from indicator_cube import variant_column
+
+# --------------------- THRESHOLD INDEX ---------------------
+
+# Sorted index over one column, answers threshold comparisons with a binary search
+class SortedIndex:
+
+    def __init__(self, values, rows=None):
+        values = np.asarray(values, dtype=np.float64)
+        rows = np.arange(len(values)) if rows is None else np.asarray(rows)
+
+        # NaN never satisfies a comparison, so it is left out of the index
+        valid = ~np.isnan(values)
+        values, rows = values[valid], rows[valid]
+
+        order = np.argsort(values, kind='stable')
+        self.values = values[order]
+        self.rows = rows[order]
+
+    # Candle indices where value >= threshold, in value order
+    def at_least(self, threshold) -> np.ndarray:
+        return self.rows[np.searchsorted(self.values, threshold, side='left'):]
+
+    # Candle indices where value <= threshold, in value order
+    def at_most(self, threshold) -> np.ndarray:
+        return self.rows[:np.searchsorted(self.values, threshold, side='right')]
+
+# Bucketed index of the threshold values each candle's step from the previous candle crosses
+class CrossingIndex:
+
+    '''
+    A step from prev to curr crosses upward through every threshold t with prev <= t < curr and
+    downward through every t with curr < t <= prev. Each step is an interval of thresholds, and
+    the steps are filed under every bucket of width bucket_width that their interval touches.
+    A query only scans the steps of the threshold's bucket, then filters them exactly with the
+    same comparisons as the indicator functions.
+    '''
+
+    def __init__(self, values, upward=True, bucket_width=1.0):
+        values = np.asarray(values, dtype=np.float64)
+        prev, curr = values[:-1], values[1:]
+        rows = np.arange(1, len(values))
+
+        # NaN comparisons are false, so steps touching NaN never cross anything
+        crossing = (prev < curr) if upward else (curr < prev)
+        lows = (prev if upward else curr)[crossing]
+        highs = (curr if upward else prev)[crossing]
+        rows = rows[crossing]
+
+        self.upward = upward
+        self.bucket_width = bucket_width
+        self.origin = np.floor(lows.min() / bucket_width) if len(lows) else 0.0
+
+        first = self._bucket(lows)
+        last = self._bucket(highs)
+        n_buckets = int(last.max()) + 1 if len(last) else 0
+
+        # one entry per (step, bucket) pair, grouped by bucket and in candle order within a bucket
+        spans = last - first + 1
+        entry_step = np.repeat(np.arange(len(rows)), spans)
+        entry_bucket = np.repeat(first, spans) + (np.arange(len(entry_step)) - np.repeat(np.cumsum(spans) - spans, spans))
+        order = np.argsort(entry_bucket, kind='stable')
+        entry_step = entry_step[order]
+
+        self.bucket_starts = np.concatenate(([0], np.cumsum(np.bincount(entry_bucket, minlength=n_buckets))))
+        self.entry_lows = lows[entry_step]
+        self.entry_highs = highs[entry_step]
+        self.entry_rows = rows[entry_step]
+
+    def _bucket(self, values) -> np.ndarray:
+        return (np.floor(values / self.bucket_width) - self.origin).astype(np.int64)
+
+    # Candle indices where the step from the previous candle crosses threshold, in candle order
+    def crossing(self, threshold) -> np.ndarray:
+        bucket = int(np.floor(threshold / self.bucket_width) - self.origin)
+        if bucket < 0 or bucket >= len(self.bucket_starts) - 1:
+            return np.empty(0, dtype=np.int64)
+
+        start, stop = self.bucket_starts[bucket], self.bucket_starts[bucket + 1]
+        lows = self.entry_lows[start:stop]
+        highs = self.entry_highs[start:stop]
+        if self.upward:
+            hit = (lows <= threshold) & (highs > threshold)
+        else:
+            hit = (highs >= threshold) & (lows < threshold)
+        return self.entry_rows[start:stop][hit]
+
+# Index over the rows of rising adx, for adx_trending
+def _adx_rising_index(df, variant=0):
+    rising = df[variant_column('adx_slope', variant)].values > 0
+    return SortedIndex(df[variant_column('adx', variant)].values[rising], np.flatnonzero(rising))
+
+# Builders and queries of the thresholded indicator functions in analysis, by function name.
+# Builders take the window variant of the indicator columns to index.
+LEAF_INDEXES = {
+    # prev_rsi <= threshold & curr_rsi > threshold
+    "rsi_overbought": ("rsi_up", lambda df, variant=0: CrossingIndex(df[variant_column('rsi', variant)].values, upward=True), CrossingIndex.crossing),
+    # prev_rsi >= threshold & curr_rsi < threshold
+    "rsi_oversold": ("rsi_down", lambda df, variant=0: CrossingIndex(df[variant_column('rsi', variant)].values, upward=False), CrossingIndex.crossing),
+    # stoch_rsi_k >= threshold
+    "stoch_rsi_overbought": ("stoch_rsi_k", lambda df, variant=0: SortedIndex(df[variant_column('stoch_rsi_k', variant)].values), SortedIndex.at_least),
+    # stoch_rsi_k <= threshold
+    "stoch_rsi_oversold": ("stoch_rsi_k", lambda df, variant=0: SortedIndex(df[variant_column('stoch_rsi_k', variant)].values), SortedIndex.at_most),
+    # adx >= threshold & adx_slope > 0
+    "adx_trending": ("adx_rising", _adx_rising_index, SortedIndex.at_least),
+}
+
+# Threshold indexes of the datasets seen by this process, least recently used dropped first
+class ThresholdIndexes:
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._indexes = OrderedDict()
+
+    def get(self, data_id, name, df, build):
+        key = (data_id, name)
+        index = self._indexes.get(key)
+        if index is None:
+            index = build(df)
+            self._indexes[key] = index
+            if len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(key)
+        return index
+
+    def clear(self):
+        self._indexes.clear()
+
+THRESHOLD_INDEXES = ThresholdIndexes()
+
+# Candle indices where a thresholded leaf fires, unordered, or None if the leaf has no index
+def _leaf_rows(func_name, df, data_id, threshold, variant=0):
+    entry = LEAF_INDEXES.get(func_name)
+    if entry is None or threshold is None:
+        return None
+
+    name, build, query = entry
+    index = THRESHOLD_INDEXES.get(data_id, variant_column(name, variant), df, partial(build, variant=variant))
+    return query(index, threshold)
+
+# Sorted candle indices where a thresholded leaf fires, or None if the leaf has no index
+def leaf_indices(func_name, df, data_id, threshold, variant=0):
+    rows = _leaf_rows(func_name, df, data_id, threshold, variant)
+    return None if rows is None else np.sort(rows)
+
+# Boolean signal of a thresholded leaf built from its index, or None if the leaf has no index
+def leaf_signal(func_name, df, data_id, threshold, variant=0):
+    rows = _leaf_rows(func_name, df, data_id, threshold, variant)
+    if rows is None:
+        return None
+
+    signal = np.zeros(len(df), dtype=bool)
+    signal[rows] = True
+    return signal
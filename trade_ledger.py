@@ -0,0 +1,233 @@
+import numpy as np
+import config
+from candle_store import ColumnStore
+
+# --------------------- TRADE LEDGER ---------------------
+
+ACTIONS = {"buy": 0, "sell": 1}
+ACTION_NAMES = {code: name for name, code in ACTIONS.items()}
+
+# Column dtypes of the ledger, in log_trade argument order
+LEDGER_COLUMNS = {
+    "timestamp": np.int64,
+    "action": np.int8,
+    "price": np.float64,
+    "coins": np.float64,
+    "total_value": np.float64,
+    "balance_after": np.float64,
+    "position_after": np.float64,
+    "cumulative_gain": np.float64,
+}
+
+SECONDS_PER_DAY = 86400
+
+# Read-only view of one trade of a ledger, nothing is copied until a field is read
+class TradeRow:
+
+    __slots__ = ("_columns", "_index")
+
+    def __init__(self, columns, index):
+        self._columns = columns
+        self._index = index
+
+    def __getattr__(self, name):
+        try:
+            value = self._columns[name][self._index].item()
+        except KeyError:
+            raise AttributeError(name) from None
+        return ACTION_NAMES[value] if name == "action" else value
+
+    def __repr__(self):
+        return "TradeRow(" + ", ".join(f"{name}={getattr(self, name)!r}" for name in LEDGER_COLUMNS) + ")"
+
+class TradeLedger:
+
+    '''
+    Trades kept as typed column arrays preallocated for capacity trades and doubled when full,
+    so logging a trade writes eight numbers in place instead of allocating an object. With a
+    path, trades are flushed in chunks of flush_rows to a columnar store (same format as the
+    candle stores) and the in-memory buffer starts over, so a long backtest never holds more
+    than one chunk. Queries run vectorized over the stored and buffered trades together.
+    '''
+
+    def __init__(self, path=None, capacity=config.LEDGER_CAPACITY, flush_rows=config.LEDGER_FLUSH_ROWS):
+        self.store = ColumnStore(path) if path is not None else None
+        self.flush_rows = flush_rows
+        self.length = 0
+        self._buffer = {name: np.empty(capacity, dtype=dtype) for name, dtype in LEDGER_COLUMNS.items()}
+        self._stored = (0, None)  # (store length, memory mapped columns) of the last _stored_columns call
+
+    def __len__(self):
+        return self.length + (len(self.store) if self.store is not None else 0)
+
+    # Makes room for n more buffered trades, doubling the buffer as needed
+    def _reserve(self, n):
+        needed = self.length + n
+        capacity = len(self._buffer["timestamp"])
+        if needed <= capacity:
+            return
+
+        while capacity < needed:
+            capacity = max(2 * capacity, 1)
+        for name, values in self._buffer.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:self.length] = values[:self.length]
+            self._buffer[name] = grown
+
+    # Logs one trade, action is "buy" or "sell"
+    def append(self, timestamp, action, price, coins, total_value, balance_after, position_after, cumulative_gain):
+        self._reserve(1)
+        i = self.length
+        buffer = self._buffer
+        buffer["timestamp"][i] = timestamp
+        buffer["action"][i] = ACTIONS[action]
+        buffer["price"][i] = price
+        buffer["coins"][i] = coins
+        buffer["total_value"][i] = total_value
+        buffer["balance_after"][i] = balance_after
+        buffer["position_after"][i] = position_after
+        buffer["cumulative_gain"][i] = cumulative_gain
+        self.length += 1
+
+        if self.store is not None and self.length >= self.flush_rows:
+            self.flush()
+
+    # Logs many trades at once from a dict of equal length arrays, action as codes of ACTIONS
+    def extend(self, columns):
+        n = len(columns["timestamp"])
+        self._reserve(n)
+        for name in LEDGER_COLUMNS:
+            self._buffer[name][self.length:self.length + n] = columns[name]
+        self.length += n
+
+        if self.store is not None and self.length >= self.flush_rows:
+            self.flush()
+
+    # Cumulative gain of the last trade, 0 for an empty ledger
+    def last_gain(self) -> float:
+        if self.length:
+            return float(self._buffer["cumulative_gain"][self.length - 1])
+        if self.store is not None and len(self.store):
+            return float(self.store.load(["cumulative_gain"])["cumulative_gain"][-1])
+        return 0.0
+
+    # Logs the trades of a backtest from the trade states returned by backtest.simulate_trades.
+    # cumulative_gain carries on from the last trade of the ledger, so the gains of several
+    # backtests recorded into one ledger add up and pnl_per_day stays right across them
+    def record_backtest(self, timestamps, closes, trade_indices, balances, positions, balance, position):
+        if not trade_indices:
+            return
+
+        trade_indices = np.asarray(trade_indices, dtype=np.int64)
+        balances = np.asarray(balances, dtype=np.float64)
+        positions = np.asarray(positions, dtype=np.float64)
+        prices = np.asarray(closes, dtype=np.float64)[trade_indices]
+
+        # a buy spends balance on coins and a sell turns coins back into balance
+        balance_change = np.diff(balances, prepend=balance)
+        position_change = np.diff(positions, prepend=position)
+        initial_equity = balance + position * float(closes[0]) - self.last_gain()
+
+        self.extend({
+            "timestamp": np.asarray(timestamps)[trade_indices],
+            "action": np.where(position_change > 0, ACTIONS["buy"], ACTIONS["sell"]),
+            "price": prices,
+            "coins": np.abs(position_change),
+            "total_value": np.abs(balance_change),
+            "balance_after": balances,
+            "position_after": positions,
+            "cumulative_gain": balances + positions * prices - initial_equity,
+        })
+
+    # Appends the buffered trades to the store and empties the buffer
+    def flush(self):
+        if self.store is None or self.length == 0:
+            return
+        self.store.append({name: values[:self.length] for name, values in self._buffer.items()})
+        self.length = 0
+
+    # Memory maps the stored columns once per store length, flushes are the only thing that changes it
+    def _stored_columns(self) -> dict:
+        length = len(self.store)
+        if self._stored[0] != length or self._stored[1] is None:
+            self._stored = (length, self.store.load(list(LEDGER_COLUMNS)))
+        return self._stored[1]
+
+    # Returns every trade as a dict of column arrays, the stored ones memory mapped when nothing is buffered
+    def columns(self) -> dict:
+        buffered = {name: values[:self.length] for name, values in self._buffer.items()}
+        if self.store is None or len(self.store) == 0:
+            return buffered
+
+        stored = self._stored_columns()
+        if self.length == 0:
+            return stored
+        return {name: np.concatenate((stored[name], buffered[name])) for name in LEDGER_COLUMNS}
+
+    # The trade at index is read from the stored columns or the buffer it is in, without
+    # concatenating the two, so indexing every trade in turn stays linear
+    def __getitem__(self, index) -> TradeRow:
+        if not -len(self) <= index < len(self):
+            raise IndexError("trade index out of range")
+        index %= len(self)
+
+        stored = len(self.store) if self.store is not None else 0
+        if index < stored:
+            return TradeRow(self._stored_columns(), index)
+        return TradeRow(dict(self._buffer), index - stored)
+
+    def __iter__(self):
+        if self.store is not None and len(self.store):
+            stored = self._stored_columns()
+            for index in range(len(self.store)):
+                yield TradeRow(stored, index)
+
+        buffered = dict(self._buffer)
+        for index in range(self.length):
+            yield TradeRow(buffered, index)
+
+    # Drops the buffered trades, the stored ones are kept
+    def clear(self):
+        self.length = 0
+
+    # Profit and loss of each UTC day with trades, as (day start timestamps, pnl)
+    def pnl_per_day(self) -> tuple:
+        columns = self.columns()
+        if len(columns["timestamp"]) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # the gain added by each trade, assigned to the day of the trade
+        gains = np.diff(columns["cumulative_gain"], prepend=0.0)
+        days = columns["timestamp"] // SECONDS_PER_DAY
+        unique_days, day_index = np.unique(days, return_inverse=True)
+        return unique_days * SECONDS_PER_DAY, np.bincount(day_index, weights=gains)
+
+    # Share of sells that closed with more gain than the previous sell (or the start)
+    def win_rate(self) -> float:
+        columns = self.columns()
+        sells = columns["action"] == ACTIONS["sell"]
+        if not sells.any():
+            return 0.0
+
+        gains_at_sells = columns["cumulative_gain"][sells]
+        return float(np.mean(np.diff(gains_at_sells, prepend=0.0) > 0))
+
+    # Traded value divided by the average equity after the trades
+    def turnover(self) -> float:
+        columns = self.columns()
+        if len(columns["timestamp"]) == 0:
+            return 0.0
+
+        equity = columns["balance_after"] + columns["position_after"] * columns["price"]
+        mean_equity = equity.mean()
+        return float(columns["total_value"].sum() / mean_equity) if mean_equity > 0 else 0.0
+
+    def summary(self) -> dict:
+        days, pnl = self.pnl_per_day()
+        return {
+            "trades": len(self),
+            "days": len(days),
+            "total_pnl": float(pnl.sum()),
+            "win_rate": self.win_rate(),
+            "turnover": self.turnover(),
+        }
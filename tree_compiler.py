@@ -0,0 +1,186 @@
+from collections import OrderedDict, namedtuple
+import numpy as np
+import bitset
+from signal_cache import SIGNAL_CACHE, threshold_key
+from threshold_index import leaf_signal
+from analysis import leaf_parts
+
+# --------------------- STRATEGY TREE COMPILER ---------------------
+
+# One step of a compiled tree. LEAF steps evaluate func at threshold on the indicator window
+# variant, AND/OR steps combine the results of the steps at indices left and right. key is the
+# signal cache key of the step.
+Instruction = namedtuple('Instruction', ['op', 'left', 'right', 'func', 'threshold', 'variant', 'key'])
+
+OPERATORS = ('AND', 'OR')
+
+def is_operator_node(node) -> bool:
+    return isinstance(node, tuple) and len(node) > 0 and isinstance(node[0], str)
+
+# Compiles a tree into program, reusing the steps already in it, and returns (root index, tree size)
+def _compile_into(node, program, steps) -> tuple:
+    results = []  # indices of the compiled children waiting for their parent
+    stack = [(node, False)]
+    size = 0
+
+    while stack:
+        node, children_done = stack.pop()
+
+        if is_operator_node(node):
+            op = node[0]
+            if op not in OPERATORS:
+                raise ValueError(f"Unknown operator {op} in strategy tree")
+
+            if not children_done:
+                stack.append((node, True))
+                stack.append((node[2], False))
+                stack.append((node[1], False))
+                continue
+
+            right = results.pop()
+            left = results.pop()
+            instruction = Instruction(op, left, right, None, None, 0, (op, program[left].key, program[right].key))
+        else:
+            func, threshold, variant = leaf_parts(node)
+            threshold = threshold_key(threshold)
+            key = (func.__name__, threshold) if not variant else (func.__name__, threshold, variant)
+            instruction = Instruction('LEAF', None, None, func, threshold, variant, key)
+
+        size += 1
+        index = steps.get(instruction.key)
+        if index is None:
+            index = len(program)
+            steps[instruction.key] = index
+            program.append(instruction)
+        results.append(index)
+
+    return results.pop(), size
+
+# Flattens a strategy tree into a post-order instruction list, identical subtrees compiled once
+def compile_tree(node) -> list:
+
+    '''
+    The tree is walked with an explicit stack instead of recursion. Every step comes after the
+    steps it reads, the last step is the root. Leaves keep the exact threshold of the tree, and a
+    step's key is the same for every tree containing that subtree, so steps are shared through
+    the signal cache across trees too.
+    '''
+
+    program = []
+    _compile_into(node, program, {})
+    return program
+
+# Hash-conses many trees into one program, a DAG where every distinct subtree is a single step
+def compile_population(trees) -> tuple:
+
+    '''
+    Returns (program, roots, n_nodes): roots[i] is the step computing trees[i] and n_nodes the
+    total number of nodes of the trees, so len(program) / n_nodes is the share of work left
+    after deduplication.
+    '''
+
+    program = []
+    steps = {}
+    roots = []
+    n_nodes = 0
+    for tree in trees:
+        root, size = _compile_into(tree, program, steps)
+        roots.append(root)
+        n_nodes += size
+    return program, roots, n_nodes
+
+# Deduplication summary of a set of trees compiled into one DAG
+def dedupe_stats(trees) -> dict:
+    program, _, n_nodes = compile_population(trees)
+    leaves = sum(1 for instruction in program if instruction.op == 'LEAF')
+    return {
+        "nodes": n_nodes,
+        "unique_nodes": len(program),
+        "unique_leaves": leaves,
+        "dedupe_ratio": 1 - len(program) / n_nodes if n_nodes else 0.0
+    }
+
+# Compiled programs of the trees seen by this process, least recently used dropped first
+_programs = OrderedDict()
+MAX_PROGRAMS = 4096
+
+# Returns the compiled program of a tree, compiling it only the first time the tree is seen
+def compiled(node) -> list:
+    try:
+        program = _programs.get(node)
+    except TypeError:
+        # trees with unhashable parts (e.g. lists read back from JSON) are compiled every time
+        return compile_tree(node)
+
+    if program is None:
+        program = compile_tree(node)
+        _programs[node] = program
+        if len(_programs) > MAX_PROGRAMS:
+            _programs.popitem(last=False)
+    else:
+        _programs.move_to_end(node)
+    return program
+
+# Evaluates one leaf into a bitset, None if the indicator function fails
+def _run_leaf(instruction, df, data_id):
+    func, threshold, variant = instruction.func, instruction.threshold, instruction.variant
+    try:
+        # Thresholded leaves are looked up in the threshold index of the dataset
+        signal = leaf_signal(func.__name__, df, data_id, threshold, variant)
+        if signal is None:
+            # Boolean value for each candle, window variants read their columns of the indicator cube
+            signal = (func(df, threshold, variant) if variant else func(df, threshold)).to_numpy(dtype=bool)
+    except Exception as e:
+        print(f"Error evaluating {func.__name__} with threshold {threshold} and window variant {variant}: {e}")
+        return None
+    return bitset.pack(signal)
+
+# Runs a compiled program on one dataset and returns the bitsets of the given root steps
+def run_roots(program, roots, df, data_id, cache=SIGNAL_CACHE) -> list:
+
+    '''
+    A first pass from the roots down looks every needed step up in the signal cache, so the steps
+    below a cached subtree are never visited. A second pass in program order computes the missing
+    steps with word-wise &/| on the bitsets, each step once however many trees share it. A
+    failing leaf gives an empty signal, which is not cached.
+    '''
+
+    results = [None] * len(program)
+    needed = [False] * len(program)
+    for root in roots:
+        needed[root] = True
+
+    for i in range(len(program) - 1, -1, -1):
+        if not needed[i]:
+            continue
+        instruction = program[i]
+        results[i] = cache.get((data_id, instruction.key))
+        if results[i] is None and instruction.op != 'LEAF':
+            needed[instruction.left] = True
+            needed[instruction.right] = True
+
+    failed = [False] * len(program)
+    for i, instruction in enumerate(program):
+        if not needed[i] or results[i] is not None:
+            continue
+
+        if instruction.op == 'LEAF':
+            bits = _run_leaf(instruction, df, data_id)
+            failed[i] = bits is None
+            if failed[i]:
+                bits = bitset.empty(len(df))
+        else:
+            left = results[instruction.left]
+            right = results[instruction.right]
+            failed[i] = failed[instruction.left] or failed[instruction.right]
+            bits = left & right if instruction.op == 'AND' else left | right
+
+        results[i] = bits
+        if not failed[i]:
+            cache.put((data_id, instruction.key), bits)
+
+    return [results[root] for root in roots]
+
+# Runs a compiled tree on one dataset and returns the root signal as a bitset
+def run_program(program, df, data_id, cache=SIGNAL_CACHE) -> np.ndarray:
+    return run_roots(program, [len(program) - 1], df, data_id, cache)[0]
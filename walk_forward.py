@@ -0,0 +1,151 @@
+from functools import partial
+import numpy as np
+import config
+from eval_strategy import evaluate_population, PENALTY_RESULT
+from shared_data import SharedDataset, attach
+from executors import make_executor
+
+# --------------------- WALK FORWARD EVALUATION ---------------------
+
+# Train/test folds as (start, stop) fractions of each currency's candles
+def make_folds(n_folds=config.WALK_FORWARD_FOLDS, mode=config.WALK_FORWARD_MODE) -> list:
+
+    '''
+    Returns one {"train": [windows], "test": window} dict per fold.
+
+    rolling: the data is cut into n_folds + 1 blocks, fold i trains on block i and tests on block i + 1
+    anchored: same test blocks, but fold i trains on every block up to and including block i
+    kfold: the data is cut into n_folds blocks, fold i tests on block i and trains on all the others
+    '''
+
+    if mode in ("rolling", "anchored"):
+        blocks = [(i / (n_folds + 1), (i + 1) / (n_folds + 1)) for i in range(n_folds + 1)]
+        folds = []
+        for i in range(n_folds):
+            train = (0.0 if mode == "anchored" else blocks[i][0], blocks[i][1])
+            folds.append({"train": [train], "test": blocks[i + 1]})
+        return folds
+
+    if mode == "kfold":
+        blocks = [(i / n_folds, (i + 1) / n_folds) for i in range(n_folds)]
+        return [{"train": blocks[:i] + blocks[i + 1:], "test": blocks[i]} for i in range(n_folds)]
+
+    raise ValueError(f"Unknown walk forward mode {mode}, expected rolling, anchored or kfold")
+
+# Combines results of several windows, penalized windows are counted but left out of the averages
+def aggregate(results) -> dict:
+    scored = [result for result in results if result["avg_sharpe"] != PENALTY_RESULT["avg_sharpe"]]
+    penalized = len(results) - len(scored)
+    if not scored:
+        return dict(PENALTY_RESULT, penalized=penalized)
+
+    sharpes = [result["avg_sharpe"] for result in scored]
+    return {
+        "avg_sharpe": np.mean(sharpes),
+        "std_sharpe": np.std(sharpes),
+        "max_drawdown": np.min([result["max_drawdown"] for result in scored]),
+        "avg_percent_return": np.mean([result["avg_percent_return"] for result in scored]),
+        "avg_num_trades": np.mean([result["avg_num_trades"] for result in scored]),
+        "penalized": penalized
+    }
+
+# Training fitness over several windows: a strategy rejected on any window is rejected, so one that
+# only passes some windows cannot outscore one that holds up on all of them. Reports use aggregate
+def train_aggregate(results) -> dict:
+    penalized = sum(result["avg_sharpe"] == PENALTY_RESULT["avg_sharpe"] for result in results)
+    if penalized:
+        return dict(PENALTY_RESULT, penalized=penalized)
+    return aggregate(results)
+
+# Executor task, evaluates every strategy on each window of the batch
+def evaluate_windows(spec, strategies, currencies, windows) -> list:
+    cached_data = attach(spec)
+    return [evaluate_population(cached_data, strategies, currencies, window=window) for window in windows]
+
+# Evaluates strategies on the train and test windows of each fold
+def walk_forward(
+        cached_data,
+        strategies,
+        folds=None,
+        currencies=config.TEST_CURRENCIES,
+        dataset=None,
+        executor=None
+    ) -> list:
+
+    '''
+    Returns one {"folds": [...], "train": aggregate, "test": aggregate} dict per strategy, where
+    each fold holds the train and test results of that fold and the aggregates combine the folds.
+
+    A window is a slice of the precomputed candle data, so indicators are never recomputed per
+    fold and each worker computes the signals of a strategy once on the full series and slices
+    them for every window it evaluates. Windows shared by several folds (the test block of one
+    rolling fold is the train block of the next) are evaluated once, and windows are spread over
+    executor with the candle data attached from shared memory, as in the GA.
+    '''
+
+    if folds is None:
+        folds = make_folds()
+
+    # every distinct window, in the order first seen
+    windows = list(dict.fromkeys(window for fold in folds for window in fold["train"] + [fold["test"]]))
+
+    published = dataset is None
+    if published:
+        dataset = SharedDataset({currency: cached_data[currency] for currency in currencies})
+
+    owns_executor = executor is None
+    if owns_executor:
+        executor = make_executor()
+
+    try:
+        window_results = executor.map_batches(partial(evaluate_windows, dataset.spec, strategies, currencies), windows)
+    finally:
+        if owns_executor:
+            executor.close()
+        if published:
+            dataset.close()
+
+    by_window = dict(zip(windows, window_results))
+
+    reports = []
+    for j in range(len(strategies)):
+        fold_reports = []
+        for i, fold in enumerate(folds):
+            fold_reports.append({
+                "fold": i,
+                "train": aggregate([by_window[window][j] for window in fold["train"]]),
+                "test": by_window[fold["test"]][j]
+            })
+
+        reports.append({
+            "folds": fold_reports,
+            "train": aggregate([fold["train"] for fold in fold_reports]),
+            "test": aggregate([fold["test"] for fold in fold_reports])
+        })
+
+    return reports
+
+# Walk forward version of evaluate_strategy_sharpe for a single strategy
+def evaluate_strategy_walk_forward(cached_data, strategy, folds=None, currencies=config.TEST_CURRENCIES, dataset=None, executor=None) -> dict:
+    return walk_forward(cached_data, [strategy], folds, currencies, dataset, executor)[0]
+
+# Prints the per fold and aggregate results of one strategy
+def print_report(report):
+    for fold in report["folds"]:
+        train, test = fold["train"], fold["test"]
+        print(f"Fold {fold['fold']}: train sharpe = {train['avg_sharpe']:.3f}, test sharpe = {test['avg_sharpe']:.3f}, "
+              f"test return = {test['avg_percent_return']:.2f}%, test drawdown = {test['max_drawdown']:.2f}%")
+
+    train, test = report["train"], report["test"]
+    print(f"Train: sharpe = {train['avg_sharpe']:.3f}, return = {train['avg_percent_return']:.2f}%, penalized folds = {train['penalized']}")
+    print(f"Test: sharpe = {test['avg_sharpe']:.3f} +/- {test.get('std_sharpe', 0.0):.3f}, "
+          f"return = {test['avg_percent_return']:.2f}%, penalized folds = {test['penalized']}")
+
+
+if __name__ == "__main__":
+    from candles import cache_data
+    from strategy_repository import load_strategies
+
+    cached_data = cache_data(currencies=config.TEST_CURRENCIES, candle_cutoff=config.CANDLE_CUTOFF)
+    for report in walk_forward(cached_data, load_strategies(10)):
+        print_report(report)